@@ -55,7 +55,8 @@ def load_model(model_name="flare_detector_v1", stage=None):
 
     clf = joblib.load(MODEL_PATH)
     tfidf = joblib.load(TFIDF_PATH)
-    svd = joblib.load(SVD_PATH)
+    # Sparse TF-IDF models are trained without an SVD.
+    svd = joblib.load(SVD_PATH) if os.path.exists(SVD_PATH) else None
     scaler = joblib.load(SCALER_PATH)
 
     return clf, tfidf, svd, scaler, local_artifacts_dir
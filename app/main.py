@@ -5,14 +5,19 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import JSONResponse
 from datetime import datetime
-from db.db import get_db
-from pipeline.get_patient import fetch_final_data
+from db.db import pool_telemetry, session_scope
+from pipeline.get_patient import fetch_final_data, fetch_patients_notes
 from app.model_service import ModelService
+from utils.text_cache import text_cache_stats
 from app.schemas import (
     PredictRequest,
     PatientPredictionResponse,
+    PatientsPredictRequest,
+    PatientsPredictionResponse,
     TrainResponse,
     HealthResponse,
+    PoolMetricsResponse,
+    TextCacheMetricsResponse,
     ErrorResponse,
     BatchPredictRequest,
 )
@@ -53,8 +58,8 @@ def predict_patient(patient_id: str):
     try:
         logger.info(f"Fetching data for patient: {patient_id}")
 
-        db = next(get_db())
-        notes_df = fetch_final_data(db, patient_id)
+        with session_scope() as db:
+            notes_df = fetch_final_data(db, patient_id)
 
         logger.info(f"Fetched {len(notes_df)} notes for patient {patient_id}")
 
@@ -78,6 +83,40 @@ def predict_patient(patient_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def predict_patients(patient_ids: list):
+    """
+    Predict psoriasis flare risk for many patients.
+
+    Notes are fetched in bulk (one query per batch of patients) instead of
+    one round trip per patient.
+
+    Args:
+        patient_ids: Patient identifiers
+
+    Returns:
+        List of per-patient prediction results
+    """
+    if svc is None:
+        raise HTTPException(status_code=503, detail="Model service not initialized")
+
+    logger.info(f"Fetching data for {len(patient_ids)} patients")
+    with session_scope() as db:
+        notes_by_patient = fetch_patients_notes(db, patient_ids)
+
+    results = []
+    for patient_id, notes_df in notes_by_patient.items():
+        if notes_df.empty:
+            results.append({"patientId": patient_id, "error": "No notes found"})
+            continue
+        try:
+            notes = notes_df.to_dict(orient="records")
+            results.append(svc.predict_patient_notes(notes, patient_id))
+        except Exception as e:
+            logger.error(f"Error predicting for patient {patient_id}: {str(e)}")
+            results.append({"patientId": patient_id, "error": str(e)})
+    return results
+
+
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
     """
@@ -105,6 +144,28 @@ async def ping():
     return await health_check()
 
 
+@router.get("/metrics/db-pool", response_model=PoolMetricsResponse)
+async def db_pool_metrics():
+    """
+    Connection pool usage of the serving database engine.
+
+    Returns:
+        Checked-out connections, overflow and checkout wait times
+    """
+    return PoolMetricsResponse(**pool_telemetry.snapshot())
+
+
+@router.get("/metrics/text-cache", response_model=TextCacheMetricsResponse)
+async def text_cache_metrics():
+    """
+    Hit statistics of the note text cleaning caches of this worker.
+
+    Returns:
+        Hits, misses and hit rate per cache
+    """
+    return TextCacheMetricsResponse(caches=text_cache_stats())
+
+
 @router.post("/predict", response_model=PatientPredictionResponse)
 async def predict(request: PredictRequest):
     """
@@ -127,6 +188,28 @@ async def predict(request: PredictRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/predict_patients", response_model=PatientsPredictionResponse)
+def predict_many(request: PatientsPredictRequest):
+    """
+    Predict psoriasis flare risk for a list of patients.
+
+    Args:
+        request: Request with the patient IDs to score
+
+    Returns:
+        Patient-level risk assessments
+    """
+    try:
+        logger.info(f"Prediction request for {len(request.patient_ids)} patients")
+        predictions = predict_patients(request.patient_ids)
+        return PatientsPredictionResponse(total_patients=len(predictions), predictions=predictions)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch patient prediction failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # @router.post("/predict_batch")
 # async def predict_batch(request: BatchPredictRequest):
 #     """
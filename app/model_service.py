@@ -2,8 +2,12 @@ import os
 import sys
 import numpy as np
 import shap
+import joblib
 from app.load_model import load_model
-from app.inference import preprocess_single
+from app.inference import SAFE_NUMERIC_COLS, feature_assembler, preprocess_notes
+from app.vector_store import NOTE_VECTOR_STORE_PATH, NoteVectorStore, model_fingerprint
+from utils.feature_spec import FEATURE_SPEC
+from utils.text_cache import CLEAN_HTML_VERSION, MASK_POST_FLARE_TERMS_VERSION
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -14,25 +18,78 @@ class ModelService:
         )
         
 
+        # Models trained on the fused projector's features are served with it;
+        # runs logged before it existed keep the TF-IDF -> SVD path they were trained on.
+        # Sparse TF-IDF models (no svd.joblib) take the TF-IDF row itself.
+        preprocessing_dir = os.path.join(self.artifacts_dir, "preprocessing")
+        preprocessing_files = ["tfidf.joblib", "svd.joblib", "scaler.joblib"]
+        projector_path = os.path.join(preprocessing_dir, "text_projector.joblib")
+        self.sparse = self.svd is None
+        self.projector = None
+        if self.sparse:
+            preprocessing_files.remove("svd.joblib")
+        elif os.path.exists(projector_path):
+            self.projector = joblib.load(projector_path)
+            preprocessing_files.append("text_projector.joblib")
+        self.assembler = feature_assembler(self.tfidf, self.svd, self.scaler, self.projector)
+
         self.explainer = shap.TreeExplainer(self.clf, model_output="raw")
         
 
-        self.numeric_features = [
-            "patient_age", "has_psoriasis", "on_steroid_med", "on_biologic",
-            "itch_present", "dry_skin", "plaques_present", "silvery_scale",
-            "elbows_involved", "hyperpigmentation", "smoker", "alcohol_use",
-            "family_melanoma"
+        self.numeric_features = list(FEATURE_SPEC.numeric_features)
+        if self.sparse:
+            self.text_features = [f"tfidf_{term}" for term in self.tfidf.get_feature_names_out()]
+        else:
+            self.text_features = [f"svd_{i}" for i in range(self.svd.n_components)]
+        self.feature_names = self.numeric_features + self.text_features
+
+        # Dense rows of sparse models are mostly zeros; they are not stored.
+        self.vector_store = None
+        if NOTE_VECTOR_STORE_PATH and not self.sparse:
+            self.model_version = model_fingerprint(
+                [os.path.join(preprocessing_dir, f) for f in preprocessing_files],
+                # Cleaning or masking changes alter the vectors as much as the spec does.
+                extra=repr((vars(FEATURE_SPEC), CLEAN_HTML_VERSION, MASK_POST_FLARE_TERMS_VERSION)),
+            )
+            self.vector_store = NoteVectorStore(self.model_version)
+
+    def note_vectors(self, notes: list[dict]) -> np.ndarray:
+        """
+        Model input rows of ``notes`` as float32, one row per note.
+        Vectors of signed notes come from the note vector store when present;
+        only the other notes are featurized, their text projected in one batch,
+        and the signed ones are stored.
+        """
+        keys = [
+            str(raw["noteId"]) if self.vector_store is not None
+            and raw.get("noteId") is not None and raw.get("physicianSignDate") else None
+            for raw in notes
         ]
-        self.svd_features = [f"svd_{i}" for i in range(self.svd.n_components)]
-        self.feature_names = self.numeric_features + self.svd_features
+        stored = self.vector_store.get_many([k for k in keys if k]) if any(keys) else {}
+
+        missing = [i for i, key in enumerate(keys) if not key or key not in stored]
+        X_missing = preprocess_notes([notes[i] for i in missing], self.assembler) if missing else None
+        computed = {i: X_missing[j] for j, i in enumerate(missing)}
+        new_vectors = {keys[i]: vector for i, vector in computed.items() if keys[i]}
+        if new_vectors:
+            self.vector_store.put_many(new_vectors)
+        return np.vstack([computed[i] if i in computed else stored[key] for i, key in enumerate(keys)])
 
-    def predict_note(self, raw_note: dict, hide_svd: bool = True):
+    def predict_note(self, raw_note: dict, hide_svd: bool = True, X: np.ndarray = None):
         """
         Predicts one note with optimized SHAP.
         hide_svd=True will group all text features as one 'text_signal'.
+        X is the note's precomputed model input row, if any.
         """
-        X, debug = preprocess_single(raw_note, self.tfidf, self.svd, self.scaler)
-        
+        if X is None:
+            X = self.note_vectors([raw_note])
+        X = X.reshape(1, -1)
+        debug = {
+            "SAFE_NUMERIC_COLS": SAFE_NUMERIC_COLS,
+            "X_final_shape": X.shape,
+            "svd_components": (1, len(self.text_features)),
+        }
+
 
         proba = float(self.clf.predict_proba(X)[:, 1][0])
         label = int(proba >= 0.5)
@@ -110,8 +167,9 @@ class ModelService:
             "trigger_mentioned", "steroid_started", "has_medications"
         ]
 
-        for raw in notes:
-            result = self.predict_note(raw)
+        X_notes = self.note_vectors(notes) if notes else None
+        for i, raw in enumerate(notes):
+            result = self.predict_note(raw, X=X_notes[i])
     
             filtered_influences = [
                 f for f in result["key_influences"] if f["feature"] in INTERPRETABLE_FEATURES
@@ -50,6 +50,24 @@ class PredictRequest(BaseModel):
     patient_id: str = Field(..., description="Patient identifier", alias="patientId")
 
 
+class PatientsPredictRequest(BaseModel):
+    """Schema for scoring many patients at once."""
+
+    patient_ids: List[str] = Field(..., description="Patient identifiers", alias="patientIds")
+
+    @field_validator("patient_ids")
+    def validate_patient_ids(cls, v):
+        if len(v) < 1:
+            raise ValueError("At least one patient ID is required")
+        if len(v) > 5000:
+            raise ValueError("Maximum 5000 patients per request")
+        return v
+
+    class Config:
+        populate_by_name = True
+        schema_extra = {"example": {"patientIds": ["178635", "185562"]}}
+
+
 class BatchPredictRequest(BaseModel):
     """Schema for batch prediction request."""
 
@@ -138,6 +156,13 @@ class PatientPredictionResponse(BaseModel):
         }
 
 
+class PatientsPredictionResponse(BaseModel):
+    """Schema for multi-patient prediction response."""
+
+    total_patients: int
+    predictions: List[Dict]
+
+
 class TrainResponse(BaseModel):
     """Schema for training response."""
 
@@ -174,6 +199,74 @@ class HealthResponse(BaseModel):
         }
 
 
+class PoolMetricsResponse(BaseModel):
+    """Schema for database connection pool metrics."""
+
+    pool_size: int
+    max_overflow: int
+    checked_out: int = Field(..., description="Connections currently in use")
+    checked_in: int = Field(..., description="Idle connections held by the pool")
+    overflow: int = Field(..., description="Connections open beyond pool_size")
+    checkouts: int
+    timeouts: int
+    avg_wait_ms: float = Field(..., description="Mean wait for a pool slot per checkout, excluding connect time")
+    max_wait_ms: float
+    connects: int = Field(..., description="Checkouts that opened a new connection")
+    avg_connect_ms: float = Field(..., description="Mean time to open a new connection")
+    max_connect_ms: float
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "pool_size": 5,
+                "max_overflow": 10,
+                "checked_out": 2,
+                "checked_in": 3,
+                "overflow": 0,
+                "checkouts": 1200,
+                "timeouts": 0,
+                "avg_wait_ms": 0.41,
+                "max_wait_ms": 12.7,
+                "connects": 15,
+                "avg_connect_ms": 8.2,
+                "max_connect_ms": 31.5,
+            }
+        }
+
+
+class TextCacheStats(BaseModel):
+    """Schema for the hit statistics of one text cleaning cache."""
+
+    hits: int = Field(..., description="Calls served from memory")
+    disk_hits: int = Field(..., description="Calls served from the persistent tier")
+    misses: int
+    hit_rate: float
+    size: int
+    maxsize: int
+
+
+class TextCacheMetricsResponse(BaseModel):
+    """Schema for the text cleaning cache metrics."""
+
+    caches: Dict[str, TextCacheStats]
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "caches": {
+                    "clean_html": {
+                        "hits": 5400,
+                        "disk_hits": 0,
+                        "misses": 2100,
+                        "hit_rate": 0.72,
+                        "size": 2100,
+                        "maxsize": 100000,
+                    }
+                }
+            }
+        }
+
+
 class ErrorResponse(BaseModel):
     """Schema for error response."""
 
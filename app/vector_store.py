@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+
+# SQLite file shared by every serving worker, e.g. data/note_vectors.sqlite;
+# unset disables the store. Rows of earlier model versions are never evicted.
+NOTE_VECTOR_STORE_PATH = os.getenv("NOTE_VECTOR_STORE_PATH", "")
+# SQLite caps bound parameters per statement; look notes up in batches below it.
+LOOKUP_BATCH = 500
+
+
+def model_fingerprint(paths: list, extra: str = "") -> str:
+    """Version of a featurizer: hash of its artifact files plus ``extra`` (e.g. the feature spec)."""
+    digest = hashlib.sha256(extra.encode("utf-8"))
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+class NoteVectorStore:
+    """Persistent model-input vectors of signed notes, keyed by noteId and model version.
+
+    Signed notes never change, so a note's feature vector only has to be
+    computed once per model version. Vectors are stored as float32 bytes in
+    a WAL-mode SQLite file that every serving worker opens; each thread gets
+    its own connection.
+    """
+
+    def __init__(self, model_version: str, path: str = NOTE_VECTOR_STORE_PATH):
+        self.model_version = model_version
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        db_dir = os.path.dirname(path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS note_vectors ("
+                "noteId TEXT NOT NULL, model_version TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (noteId, model_version))"
+            )
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get_many(self, note_ids: list) -> dict:
+        """Stored vectors of ``note_ids`` for this model version, by noteId."""
+        note_ids = [str(note_id) for note_id in note_ids]
+        found = {}
+        db = self._connection()
+        for i in range(0, len(note_ids), LOOKUP_BATCH):
+            batch = note_ids[i : i + LOOKUP_BATCH]
+            placeholders = ", ".join("?" * len(batch))
+            rows = db.execute(
+                f"SELECT noteId, vector FROM note_vectors WHERE model_version = ? AND noteId IN ({placeholders})",
+                [self.model_version, *batch],
+            ).fetchall()
+            for note_id, vector in rows:
+                found[note_id] = np.frombuffer(vector, dtype=np.float32)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(note_ids) - len(found)
+        return found
+
+    def put_many(self, vectors: dict):
+        """Store noteId -> vector for this model version."""
+        rows = [
+            (str(note_id), self.model_version, np.asarray(vector, dtype=np.float32).tobytes())
+            for note_id, vector in vectors.items()
+        ]
+        with self._connection() as db:
+            db.executemany("INSERT OR REPLACE INTO note_vectors VALUES (?, ?, ?)", rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "model_version": self.model_version,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,120 @@
+"""
+Parity check and benchmark of the HTML-to-text paths of utils.helper.
+
+Every sample of the parity corpus (hand-written edge cases plus the text
+columns of synthetic notes from ``db.synthetic``) must give the same text
+through ``clean_html`` as through the BeautifulSoup reference
+``clean_html_bs4``. The benchmark then reports notes/sec for BeautifulSoup,
+the regex fast path alone, and ``clean_html`` with its fallback.
+
+Usage:
+    python benchmarks/bench_clean_html.py [--patients 2000]
+"""
+
+import gc
+import os
+import sys
+import time
+import argparse
+import warnings
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from db.synthetic import NoteGenerator
+from bs4 import XMLParsedAsHTMLWarning
+from utils.helper import clean_html, clean_html_bs4, strip_html
+
+warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+
+
+PARITY_CORPUS = [
+    "",
+    "plain text, no markup",
+    "<p>Plaques with silvery scale on the elbows.</p>",
+    "<p><strong>Chief Complaint:</strong>&nbsp;itching for 2&nbsp;weeks</p>",
+    "<ul><li>Clobetasol 0.05% cream</li><li>Vitamin D3</li></ul>",
+    "line one<br/>line two<br />line three<BR>",
+    "<strong>A. Biopsy</strong><br/><strong>Location:</strong> Shins<br/><br/> consent given.<br />",
+    '<span style="font-family: Arial; color: #333">styled</span> text',
+    "<a href='https://example.org/?a=1&amp;b=2' title=\"x>y\">link</a>",
+    "<div class=note>\n\t<p>multi\n\n line</p>\n</div>",
+    "<!-- copied from prior visit --><p>Stable.</p>",
+    "<!DOCTYPE html><html><body><p>Full document</p></body></html>",
+    "<style>p { color: red; }</style><p>Visible</p><script>var a = 1 < 2;</script>",
+    "Assessment &amp; Plan: R &lt; L, temp 98.6&deg;F &#8211; &#x2014; done",
+    "A & B, 5 & 6",
+    "&copy; 2024 &unknownentity; text",
+    "Lesion <5 mm, BP > 120",
+    "unterminated <b tag",
+    "stray &nbsp without semicolon",
+    "&#128; and &#0; charrefs",
+    "<p>café – naïve   nbsp</p>",
+    "<table><tr><td>1</td><td>2</td></tr></table>",
+    "nested<b>bo<i>ld</i></b>word",
+    "<p>Post-inflammatory hyperpigmentation noted.</p>    ",
+    "<![CDATA[raw]]> after",
+    "<?xml version='1.0'?><p>xml pi</p>",
+    "<p<b>bold</b>",
+    "<a<script>x</script>",
+    "<p<script>x</script> after",
+    "<p&amp;x>entity in a tag</p>",
+    "<script>never closed <p>text</p>",
+    "<script--x>not a script</script> kept",
+    "<b'quoted'>stray quotes</b>",
+    "<p<!-- comment -->text>",
+]
+
+TEXT_COLUMNS = [
+    "complaints", "pastHistory", "assesment", "reviewofsystem", "currentmedication",
+    "procedure", "biopsyNotes", "allergy", "examination", "patientSummary",
+]
+
+
+def synthetic_notes(n_patients: int) -> list:
+    generator = NoteGenerator(seed=7)
+    notes = []
+    for patient_id in range(1, n_patients + 1):
+        for note in generator.patient_rows(patient_id, max_notes=6)["newProgressNotes"]:
+            notes.extend(note[column] for column in TEXT_COLUMNS)
+    return notes
+
+
+def check_parity(samples: list) -> int:
+    mismatches = 0
+    for sample in samples:
+        expected, actual = clean_html_bs4(sample), clean_html(sample)
+        if expected != actual:
+            mismatches += 1
+            print(f"MISMATCH {sample!r}\n  bs4:  {expected!r}\n  fast: {actual!r}")
+    return mismatches
+
+
+def notes_per_second(func, samples: list, repeats: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        for sample in samples:
+            func(sample)
+        best = min(best, time.perf_counter() - started)
+    return len(samples) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="clean_html parity check and benchmark")
+    parser.add_argument("--patients", type=int, default=2000)
+    args = parser.parse_args()
+
+    samples = synthetic_notes(args.patients)
+    mismatches = check_parity(PARITY_CORPUS + samples)
+    fallbacks = sum(strip_html(sample) is None for sample in PARITY_CORPUS)
+    print(f"parity corpus: {len(PARITY_CORPUS)} edge cases ({fallbacks} fall back), "
+          f"{len(samples)} synthetic cells, {mismatches} mismatches")
+
+    print(f"{'path':>12} {'notes/sec':>12}")
+    for name, func in [("bs4", clean_html_bs4), ("fast", strip_html), ("clean_html", clean_html)]:
+        print(f"{name:>12} {notes_per_second(func, samples):>12,.0f}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark the two cohort strategies of the note extraction query.
+
+Compares the inlined ``IN (...)`` list against the temporary-table join
+(``pipeline.extract_data.load_cohort_table``) on the synthetic EHR
+(``db.synthetic``) for 1k, 10k and 100k cohort patients, plus the default
+settings: the cohort split into EXTRACT_SHARD_SIZE shards, each choosing its
+strategy by EXTRACT_IN_LIST_MAX. With the defaults (500 and 1000) every shard
+uses an IN list; the temporary table only serves unsharded or larger-shard
+queries.
+
+Usage:
+    python benchmarks/bench_cohort_join.py [--sizes 1000 10000 100000]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from sqlalchemy.orm import Session
+from db.synthetic import build_synthetic_db
+from pipeline.extract_data import IN_LIST_MAX, SHARD_SIZE, final_data_query, shard_patient_ids, stream_final_data
+
+
+def time_strategy(engine, shards: list, in_list_max: float, repeats: int = 3):
+    best, rows = float("inf"), 0
+    for _ in range(repeats):
+        with Session(engine) as db:
+            started = time.perf_counter()
+            rows = sum(
+                len(chunk) for shard in shards for chunk in stream_final_data(db, shard, in_list_max=in_list_max)
+            )
+            best = min(best, time.perf_counter() - started)
+    return best, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IN-list vs temp-table cohort join benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'patients':>9} {'strategy':>10} {'sql bytes':>10} {'rows':>8} {'seconds':>9}")
+    for n_patients in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "synthetic_ehr.db")
+            engine = build_synthetic_db(f"sqlite:///{db_path}", 2 * n_patients, max_notes=3)
+            patient_ids = [str(patient_id) for patient_id in range(1, n_patients + 1)]
+            default_shards = shard_patient_ids(patient_ids, SHARD_SIZE)
+            for strategy, shards, in_list_max in [
+                ("in-list", [patient_ids], float("inf")),
+                ("temp-table", [patient_ids], 0),
+                ("default", default_shards, IN_LIST_MAX),
+            ]:
+                # SQL text sent per run, summed over the shards.
+                sql_bytes = sum(
+                    len(str(final_data_query(shard, cohort_table=len(shard) > in_list_max))) for shard in shards
+                )
+                seconds, rows = time_strategy(engine, shards, in_list_max)
+                print(f"{n_patients:>9} {strategy:>10} {sql_bytes:>10} {rows:>8} {seconds:>9.3f}")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Peak RSS of the preprocessing pipeline with and without the compact layout.
+
+Builds a synthetic EHR database (``db.synthetic``) once, then runs
+``FeatureExtraction.extract_features`` against it followed by ``split_data``
+in a fresh process per mode, each with its own working directory (note and
+feature stores). Reports the in-memory size of the returned feature frame
+and the peak RSS of each run. The compact run must produce the same
+train/test matrices.
+
+Usage:
+    python benchmarks/bench_compact_memory.py [--patients 20000] [--workdir /tmp/bench_compact]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import numpy as np
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(compact: bool, chunk_size: int, out_path: str) -> dict:
+    """Child process body: extract_features, then split_data"""
+    from pipeline.preprocessing import FeatureExtraction
+
+    feature_extraction = FeatureExtraction(workers=1, chunk_size=chunk_size, compact=compact)
+    started = time.perf_counter()
+    df = feature_extraction.extract_features()
+    frame_mb = df.memory_usage(deep=True).sum() / 2**20
+    extract_rss = peak_rss_mb()
+    X_train, X_test, y_train, y_test = feature_extraction.split_data(df)
+    np.savez(out_path, X_train=X_train, X_test=X_test, y_train=y_train, y_test=y_test)
+    return {
+        "rows": len(df),
+        "frame_mb": frame_mb,
+        "extract_peak_rss_mb": extract_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS with and without compact preprocessing")
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--max-notes", type=int, default=12)
+    parser.add_argument("--chunk-size", type=int, default=20000)
+    parser.add_argument("--workdir", default="/tmp/bench_compact")
+    parser.add_argument("--child", choices=["default", "compact"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    db_path = os.path.join(workdir, f"ehr_{args.patients}.db")
+    if args.child:
+        out_path = os.path.join(workdir, f"{args.child}.npz")
+        result = run_mode(args.child == "compact", args.chunk_size, out_path)
+        print(json.dumps(result))
+        return
+
+    os.makedirs(workdir, exist_ok=True)
+    if not os.path.exists(db_path):
+        from db.synthetic import build_synthetic_db
+
+        started = time.perf_counter()
+        build_synthetic_db(f"sqlite:///{db_path}", args.patients, max_notes=args.max_notes).dispose()
+        print(f"built {db_path} in {time.perf_counter() - started:.0f}s")
+
+    results = {}
+    for mode in ["default", "compact"]:
+        # Read by db.db and the pipeline modules at import time; the stores
+        # live under the child's working directory.
+        mode_dir = os.path.join(workdir, mode)
+        os.makedirs(mode_dir, exist_ok=True)
+        env = dict(
+            os.environ,
+            DB_URL=f"sqlite:///{db_path}",
+            DB_ASYNC_URL=f"sqlite+aiosqlite:///{db_path}",
+            NOTE_STORE_DIR=os.path.join(mode_dir, "data", "notes"),
+            TEXT_CACHE_DIR="",
+            PREPROC_CACHE_DIR="",
+            MATRIX_CACHE_DIR="",
+        )
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--patients", str(args.patients),
+             "--chunk-size", str(args.chunk_size), "--workdir", workdir, "--child", mode],
+            capture_output=True, text=True, env=env, cwd=mode_dir,
+        )
+        if child.returncode != 0:
+            print(child.stderr[-2000:])
+            sys.exit(1)
+        results[mode] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    print(f"{'mode':>8} {'rows':>9} {'frame MB':>9} {'extract RSS MB':>15} {'peak RSS MB':>12} {'seconds':>8}")
+    for mode, r in results.items():
+        print(
+            f"{mode:>8} {r['rows']:>9} {r['frame_mb']:>9.0f} {r['extract_peak_rss_mb']:>15.0f} "
+            f"{r['peak_rss_mb']:>12.0f} {r['seconds']:>8.0f}"
+        )
+
+    default = np.load(os.path.join(workdir, "default.npz"))
+    compact = np.load(os.path.join(workdir, "compact.npz"))
+    identical = all(np.array_equal(default[key], compact[key]) for key in default.files)
+    print(f"train/test matrices identical: {identical}")
+    sys.exit(0 if identical else 1)
+
+
+if __name__ == "__main__":
+    main()
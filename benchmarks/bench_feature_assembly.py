@@ -0,0 +1,121 @@
+"""
+float64 hstack vs in-place float32 assembly of the model input matrix.
+
+Builds a synthetic EHR (``db.synthetic``), extracts its features and fits the
+preprocessors once (``split_data``), then assembles the model input of all
+extracted rows, tiled to ``--rows``, two ways: the former scaler output +
+TextProjector output ``np.hstack``-ed in float64, and ``model_matrices``
+(FeatureAssembler writing into one preallocated float32 matrix). Reports
+wall time and the tracemalloc peak of each, the latency of one serving row,
+and the time to write the matrix cache vs map a stored entry. The float32
+matrix must equal the float64 one rounded to float32, bit for bit.
+
+Usage:
+    python benchmarks/bench_feature_assembly.py [--patients 5000] [--rows 200000] [--workdir /tmp/bench_assembly]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import numpy as np
+
+
+def measure(fn):
+    """(result, seconds, tracemalloc peak MB) of ``fn()``, timed untraced then run again traced"""
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+    del result
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="float64 hstack vs float32 in-place feature assembly")
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--max-notes", type=int, default=12)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--timed-rows", type=int, default=300)
+    parser.add_argument("--workdir", default="/tmp/bench_assembly")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    db_path = os.path.join(args.workdir, f"ehr_{args.patients}.db")
+    matrix_dir = os.path.join(args.workdir, "matrices")
+    shutil.rmtree(matrix_dir, ignore_errors=True)
+    # Read by db.db and the pipeline modules at import time.
+    os.environ.update(
+        DB_URL=f"sqlite:///{db_path}",
+        DB_ASYNC_URL=f"sqlite+aiosqlite:///{db_path}",
+        NOTE_STORE_DIR=os.path.join(args.workdir, "notes"),
+        TEXT_CACHE_DIR="",
+        PREPROC_CACHE_DIR="",
+        MATRIX_CACHE_DIR="",
+    )
+    os.chdir(args.workdir)
+    if not os.path.exists(db_path):
+        from db.synthetic import build_synthetic_db
+
+        started = time.perf_counter()
+        build_synthetic_db(f"sqlite:///{db_path}", args.patients, max_notes=args.max_notes).dispose()
+        print(f"built {db_path} in {time.perf_counter() - started:.0f}s")
+    from pipeline.preproc_cache import MatrixCache
+    from pipeline.preprocessing import FeatureExtraction, load_preprocessors
+    from utils.feature_assembler import FeatureAssembler
+    from utils.feature_spec import FEATURE_SPEC
+
+    feature_extraction = FeatureExtraction()
+    df = feature_extraction.extract_features()
+    feature_extraction.split_data(df.copy())
+    _, _, scaler, projector = load_preprocessors(feature_extraction.preproc_dir)
+    assembler = FeatureAssembler(scaler, projector)
+
+    reps = -(-args.rows // len(df))
+    X_num = np.tile(df[FEATURE_SPEC.numeric_features].fillna(0).astype(float).values, (reps, 1))[: args.rows]
+    texts = np.tile(feature_extraction.model_text(df).to_numpy(dtype=object), reps)[: args.rows]
+    batches = {"X": (X_num, texts)}
+
+    X_old, old_seconds, old_peak = measure(lambda: np.hstack([scaler.transform(X_num), projector.transform(texts)]))
+    (X_new,), new_seconds, new_peak = measure(lambda: feature_extraction.model_matrices(assembler, batches))
+    exact = np.array_equal(X_new, X_old.astype(np.float32))
+
+    old_row = new_row = 0.0
+    for i in range(args.timed_rows):
+        started = time.perf_counter()
+        np.hstack([scaler.transform(X_num[i : i + 1]), projector.transform(texts[i : i + 1])]).astype(np.float32)
+        old_row += time.perf_counter() - started
+        started = time.perf_counter()
+        assembler.transform(X_num[i : i + 1], texts[i : i + 1])
+        new_row += time.perf_counter() - started
+
+    feature_extraction.matrix_cache = MatrixCache(matrix_dir)
+    started = time.perf_counter()
+    (X_built,) = feature_extraction.model_matrices(assembler, batches)
+    build_seconds = time.perf_counter() - started
+    (X_mapped,), map_seconds, map_peak = measure(lambda: feature_extraction.model_matrices(assembler, batches))
+    exact = exact and np.array_equal(X_built, X_new) and np.array_equal(X_mapped, X_new)
+
+    print(f"{'assembly':>16} {'rows':>8} {'dtype':>8} {'seconds':>8} {'peak MB':>8} {'row ms':>7}")
+    print(
+        f"{'float64 hstack':>16} {len(X_old):>8} {str(X_old.dtype):>8} {old_seconds:>8.2f} {old_peak:>8.0f} "
+        f"{1000 * old_row / args.timed_rows:>7.3f}"
+    )
+    print(
+        f"{'float32 in place':>16} {len(X_new):>8} {str(X_new.dtype):>8} {new_seconds:>8.2f} {new_peak:>8.0f} "
+        f"{1000 * new_row / args.timed_rows:>7.3f}"
+    )
+    print(f"matrix cache: build {build_seconds:.2f}s, map {map_seconds:.3f}s ({map_peak:.1f} MB traced)")
+    print(f"float32 matrix == float64 matrix rounded to float32: {exact}")
+    sys.exit(0 if exact else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Parity check and benchmark of the two backends of utils.feature_spec.
+
+Featurizes synthetic notes (``db.synthetic``) with the batch backend used in
+training and the row backend used in serving, and checks that every feature,
+the numeric model input and the masked TF-IDF text are identical. Then times
+single-note featurization with the row backend against the batch backend on a
+one-row DataFrame, which is what serving used to do.
+
+Usage:
+    python benchmarks/bench_feature_backends.py [--patients 1000]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import numpy as np
+import pandas as pd
+from db.synthetic import NoteGenerator
+from utils.feature_spec import FEATURE_SPEC, BatchFeatures, RowFeatures
+from utils.helper import clean_html, mask_post_flare_terms
+
+
+def synthetic_notes(n_patients: int) -> list:
+    generator = NoteGenerator(seed=3)
+    notes = []
+    for patient_id in range(1, n_patients + 1):
+        rows = generator.patient_rows(patient_id, max_notes=6)
+        for note in rows["newProgressNotes"]:
+            note["diagnoses"] = "L40.0 Psoriasis vulgaris, Plaque psoriasis" if patient_id % 3 else "L82.1 Seborrheic keratosis"
+            notes.append(note)
+    notes.append({"noteId": -1})
+    return notes
+
+
+def same(a, b) -> bool:
+    if isinstance(a, list) or isinstance(b, list):
+        return list(a) == list(b)
+    if pd.isna(a) and pd.isna(b):
+        return True
+    return bool(a == b)
+
+
+def check_parity(notes: list, batch: BatchFeatures, row: RowFeatures) -> int:
+    df = batch.transform(pd.DataFrame(notes))
+    numeric = df[FEATURE_SPEC.numeric_features].fillna(0).astype(float).values
+    mismatches = 0
+    names = (
+        [name for name, _, _, _ in FEATURE_SPEC.extracts]
+        + batch.keywords.feature_names
+        + [name for name, _ in FEATURE_SPEC.derived]
+    )
+    for i, note in enumerate(notes):
+        features = row.transform(note)
+        for name in names + FEATURE_SPEC.text_columns:
+            if not same(df[name].iloc[i], features[name]):
+                mismatches += 1
+                print(f"MISMATCH note {i} {name}: batch={df[name].iloc[i]!r} row={features[name]!r}")
+        if not np.array_equal(numeric[i : i + 1], row.numeric_vector(features)):
+            mismatches += 1
+            print(f"MISMATCH note {i} numeric vector")
+        batch_text = " ".join(mask_post_flare_terms(df[col].iloc[i]) for col in FEATURE_SPEC.model_text_columns)
+        if batch_text != row.model_text(features):
+            mismatches += 1
+            print(f"MISMATCH note {i} model text")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch vs row feature backend parity and latency")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--timed-notes", type=int, default=500)
+    args = parser.parse_args()
+
+    # Uncached cleaning so the timings compare featurization, not cache lookups.
+    batch = BatchFeatures(clean=clean_html)
+    row = RowFeatures(clean=clean_html, mask=mask_post_flare_terms)
+
+    notes = synthetic_notes(args.patients)
+    mismatches = check_parity(notes, batch, row)
+    print(f"{len(notes)} notes compared, {mismatches} mismatches")
+
+    timed = notes[: args.timed_notes]
+    started = time.perf_counter()
+    for note in timed:
+        batch.transform(pd.DataFrame([note]))
+    batch_ms = 1000 * (time.perf_counter() - started) / len(timed)
+    started = time.perf_counter()
+    for note in timed:
+        row.model_text(row.transform(note))
+    row_ms = 1000 * (time.perf_counter() - started) / len(timed)
+    print(f"per-note featurization: one-row DataFrame {batch_ms:.3f} ms, row backend {row_ms:.3f} ms")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark the "full" and "lean" note extraction queries.
+
+Runs both variants of ``pipeline.extract_data.final_data_query`` over the
+same cohort of the synthetic EHR (``db.synthetic``) and reports rows, columns, bytes of
+column values returned, and query time.
+
+Usage:
+    python benchmarks/bench_lean_query.py [--patients 10000]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from sqlalchemy.orm import Session
+from pipeline.extract_data import final_data_query
+from db.synthetic import build_synthetic_db
+
+
+def payload_bytes(rows) -> int:
+    """Approximate bytes on the wire: the encoded size of every non-null value."""
+    return sum(len(str(value).encode("utf-8")) for row in rows for value in row if value is not None)
+
+
+def run_variant(engine, patient_ids: list, variant: str, repeats: int = 3):
+    query = final_data_query(patient_ids, cohort_table=False, variant=variant)
+    best, rows, columns = float("inf"), [], []
+    for _ in range(repeats):
+        with Session(engine) as db:
+            started = time.perf_counter()
+            result = db.execute(query)
+            columns = list(result.keys())
+            rows = result.fetchall()
+            best = min(best, time.perf_counter() - started)
+    return best, rows, columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full vs lean extraction query benchmark")
+    parser.add_argument("--patients", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "synthetic_ehr.db")
+        engine = build_synthetic_db(f"sqlite:///{db_path}", 2 * args.patients, max_notes=3)
+        patient_ids = [str(patient_id) for patient_id in range(1, args.patients + 1)]
+
+        results = {}
+        print(f"{'variant':>8} {'rows':>8} {'columns':>8} {'MB':>9} {'seconds':>9}")
+        for variant in ["full", "lean"]:
+            seconds, rows, columns = run_variant(engine, patient_ids, variant)
+            size = payload_bytes(rows)
+            results[variant] = (size, seconds)
+            print(f"{variant:>8} {len(rows):>8} {len(columns):>8} {size / 1e6:>9.2f} {seconds:>9.3f}")
+        engine.dispose()
+
+    (full_bytes, full_seconds), (lean_bytes, lean_seconds) = results["full"], results["lean"]
+    print(f"bytes reduction: {100 * (1 - lean_bytes / full_bytes):.1f}%")
+    print(f"time reduction:  {100 * (1 - lean_seconds / full_seconds):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Equivalence check and benchmark of utils.helper.mask_post_flare_terms.
+
+Compares the one-pass masking against the original four sequential
+``re.sub`` calls (kept here as ``mask_post_flare_terms_reference``) on
+hand-written edge cases, randomly assembled token soups and the masked
+columns of synthetic notes, then reports texts/sec for the reference and
+the one-pass function.
+
+Usage:
+    python benchmarks/bench_mask.py [--patients 2000]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from db.synthetic import NoteGenerator
+from utils.helper import clean_html, mask_post_flare_terms
+
+
+def mask_post_flare_terms_reference(text):
+    if not isinstance(text, str):
+        return ""
+
+    text = re.sub(r'\b(flare|flares|flaring|flare-up|flare up|psoriasis flare)\b', ' ', text, flags=re.I)
+    text = re.sub(r'\b(triamcinolone|clobetasol|hydrocortisone|ointment|apply|start|apply\s+\w+|prescribed|prescription|start\s+)\b', ' ', text, flags=re.I)
+
+    text = re.sub(r'\b(apply|use)\b.*?(ointment|cream|gel)\b', ' ', text, flags=re.I)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+EDGE_CASES = [
+    None,
+    "",
+    "   ",
+    "Psoriasis flare-up, worsening despite treatment.",
+    "Start Clobetasol 0.05% cream, apply twice daily for 2 weeks.",
+    "Use triamcinolone ointment on the elbows; use gel at night.",
+    "use X ointment Y cream",
+    "use the pointment then cream",
+    "USE sunscream daily",
+    "flares, flaring, FLARE UP and psoriasis flare",
+    "starts started restart start",
+    "apply\tsome\nmedication use\ncream",
+    "prescribed prescription prescriptions",
+    "use it. ointments help; use gelatin gel",
+    "Flare-up of plaques. No new lesions.",
+]
+
+TOKENS = [
+    "flare", "flares", "flare-up", "flare up", "psoriasis", "use", "USE", "apply", "ointment",
+    "ointments", "pointment", "cream", "sunscream", "gel", "gelatin", "start", "starts",
+    "triamcinolone", "Clobetasol", "prescribed", "twice", "daily", "elbows", ",", ".", "-",
+    "\n", "\t", "  ",
+]
+
+MASKED_COLUMNS = ["assesment", "complaints", "examination", "patientSummary", "currentmedication"]
+
+
+def token_soups(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choice(TOKENS) + rng.choice([" ", "", " ", "/"]) for _ in range(rng.randint(1, 25)))
+        for _ in range(n)
+    ]
+
+
+def synthetic_texts(n_patients: int) -> list:
+    generator = NoteGenerator(seed=11)
+    texts = []
+    for patient_id in range(1, n_patients + 1):
+        for note in generator.patient_rows(patient_id, max_notes=6)["newProgressNotes"]:
+            texts.extend(clean_html(note[column]) for column in MASKED_COLUMNS)
+    return texts
+
+
+def texts_per_second(func, texts: list, repeats: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func(texts)
+        best = min(best, time.perf_counter() - started)
+    return len(texts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mask_post_flare_terms equivalence check and benchmark")
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--soups", type=int, default=50000)
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.patients)
+    samples = EDGE_CASES + token_soups(args.soups) + texts
+    mismatches = 0
+    for sample in samples:
+        expected, actual = mask_post_flare_terms_reference(sample), mask_post_flare_terms(sample)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"MISMATCH {sample!r}\n  reference: {expected!r}\n  one-pass:  {actual!r}")
+    print(f"{len(samples)} texts compared, {mismatches} mismatches")
+
+    print(f"{'path':>10} {'texts/sec':>12}")
+    for name, func in [
+        ("reference", lambda batch: [mask_post_flare_terms_reference(text) for text in batch]),
+        ("one-pass", lambda batch: [mask_post_flare_terms(text) for text in batch]),
+    ]:
+        print(f"{name:>10} {texts_per_second(func, texts):>12,.0f}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+In-memory vs out-of-core text transformers: peak RSS and model quality.
+
+Builds a synthetic EHR (``db.synthetic``) and the streaming pipeline's chunk
+store once, then fits the text transformers and the scaler on the stored
+training chunks (``StreamingPipeline.fit_transformers``) in a fresh process
+per mode: TfidfVectorizer + TruncatedSVD on the whole training text, and the
+hashed TF-IDF + Gram-matrix SVD fitted chunk by chunk. Reports fit time, the
+RSS the fit added, and the ROC-AUC of the same LightGBM model trained on each
+mode's features. The out-of-core ROC-AUC must be within AUC_TOLERANCE.
+
+Usage:
+    python benchmarks/bench_out_of_core.py [--patients 20000] [--workdir /tmp/bench_out_of_core]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import numpy as np
+
+AUC_TOLERANCE = 0.01
+MODES = ["in-memory", "out-of-core"]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def run_mode(mode: str, store_dir: str) -> dict:
+    """Child process body; DB_URL points at the synthetic database"""
+    from lightgbm import LGBMClassifier
+    from sklearn.metrics import roc_auc_score
+    from pipeline.preprocessing import TARGET_COL, FeatureExtraction, patient_split
+    from pipeline.streaming import ChunkStore, StreamingPipeline
+
+    store = ChunkStore(store_dir)
+    if mode == "store":
+        pipeline = StreamingPipeline(FeatureExtraction(), store)
+        return {"chunks": pipeline.build_chunk_store(pipeline.feature_extraction.cohort_patient_ids())}
+
+    pipeline = StreamingPipeline(FeatureExtraction(out_of_core=mode == "out-of-core"), store)
+    stored_ids = store.patient_ids()
+    train_idx, _ = patient_split(stored_ids)
+    train_ids = set(stored_ids[train_idx])
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    projector, scaler = pipeline.fit_transformers(train_ids)
+    fit_seconds = time.perf_counter() - started
+    fit_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    X, y, is_train = [], [], []
+    for chunk, X_chunk, train_chunk in pipeline.vectorize(store.read(), projector, scaler, train_ids):
+        X.append(X_chunk)
+        y.append(chunk[TARGET_COL].to_numpy())
+        is_train.append(train_chunk)
+    X, y, is_train = np.vstack(X), np.concatenate(y), np.concatenate(is_train)
+    clf = LGBMClassifier(n_estimators=300, learning_rate=0.05, class_weight="balanced", random_state=42, verbose=-1)
+    clf.fit(X[is_train], y[is_train])
+    return {
+        "rows": len(y),
+        "n_terms": projector.projection.shape[0],
+        "fit_seconds": fit_seconds,
+        "fit_rss_mb": fit_peak - rss_before,
+        "roc_auc": roc_auc_score(y[~is_train], clf.predict_proba(X[~is_train])[:, 1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory vs out-of-core text transformer benchmark")
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--max-notes", type=int, default=12)
+    parser.add_argument("--workdir", default="/tmp/bench_out_of_core")
+    parser.add_argument("--child", choices=["store"] + MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    store_dir = os.path.join(args.workdir, f"chunks_{args.patients}")
+    if args.child:
+        print(json.dumps(run_mode(args.child, store_dir)))
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    db_path = os.path.join(args.workdir, f"ehr_{args.patients}.db")
+    if not os.path.exists(db_path):
+        from db.synthetic import build_synthetic_db
+
+        started = time.perf_counter()
+        build_synthetic_db(f"sqlite:///{db_path}", args.patients, max_notes=args.max_notes).dispose()
+        print(f"built {db_path} in {time.perf_counter() - started:.0f}s")
+
+    env = dict(
+        os.environ,
+        DB_URL=f"sqlite:///{db_path}",
+        DB_ASYNC_URL=f"sqlite+aiosqlite:///{db_path}",
+        NOTE_STORE_DIR=os.path.join(args.workdir, "notes"),
+        TEXT_CACHE_DIR="",
+        PREPROC_CACHE_DIR="",
+        MATRIX_CACHE_DIR="",
+    )
+    results = {}
+    for mode in (["store"] if not os.path.isdir(store_dir) else []) + MODES:
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--patients", str(args.patients),
+             "--workdir", args.workdir, "--child", mode],
+            capture_output=True, text=True, env=env, cwd=args.workdir,
+        )
+        if child.returncode != 0:
+            print(child.stderr[-2000:])
+            sys.exit(1)
+        results[mode] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    print(f"{'mode':>12} {'rows':>9} {'terms':>6} {'fit s':>7} {'fit RSS MB':>11} {'ROC-AUC':>8}")
+    for mode in MODES:
+        r = results[mode]
+        print(
+            f"{mode:>12} {r['rows']:>9} {r['n_terms']:>6} {r['fit_seconds']:>7.1f} "
+            f"{r['fit_rss_mb']:>11.0f} {r['roc_auc']:>8.4f}"
+        )
+    auc_drop = results["in-memory"]["roc_auc"] - results["out-of-core"]["roc_auc"]
+    sys.exit(0 if auc_drop < AUC_TOLERANCE else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+SVD text features vs sparse TF-IDF fed straight to LightGBM.
+
+Builds a synthetic EHR (``db.synthetic``), extracts its features once, then
+for each text mode runs ``split_data`` (fitting the preprocessors), trains the
+pipeline's LightGBM model with early stopping and reports the preprocessing
+and training time, the ROC-AUC and the latency of one request as
+``ModelService.predict_note`` serves it: featurize, predict and SHAP. Serving
+rows of synthetic notes must equal the batch rows of the same notes.
+
+Usage:
+    python benchmarks/bench_sparse_tfidf.py [--patients 5000] [--workdir /tmp/bench_sparse]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import numpy as np
+import pandas as pd
+
+MODES = ["svd", "sparse"]
+
+
+def serving_notes(n_notes: int) -> list:
+    from db.synthetic import NoteGenerator
+
+    generator = NoteGenerator(seed=24)
+    notes, patient_id = [], 0
+    while len(notes) < n_notes:
+        patient_id += 1
+        notes.extend(generator.patient_rows(patient_id, max_notes=6)["newProgressNotes"])
+    return notes[:n_notes]
+
+
+def run_mode(df: pd.DataFrame, sparse: bool, notes: list) -> dict:
+    import shap
+    import lightgbm as lgb
+    from lightgbm import LGBMClassifier
+    from sklearn.metrics import roc_auc_score
+    from app.inference import feature_assembler, preprocess_notes
+    from pipeline.preprocessing import FeatureExtraction, load_preprocessors, sparse_model_input
+    from utils.feature_spec import FEATURE_SPEC, batch_features
+
+    feature_extraction = FeatureExtraction(sparse=sparse)
+    started = time.perf_counter()
+    X_train, X_test, y_train, y_test = feature_extraction.split_data(df.copy())
+    split_seconds = time.perf_counter() - started
+
+    clf = LGBMClassifier(
+        n_estimators=1000, learning_rate=0.05, num_leaves=31, class_weight="balanced",
+        subsample=0.8, colsample_bytree=0.8, random_state=42, n_jobs=-1, verbose=-1,
+    )
+    started = time.perf_counter()
+    clf.fit(
+        X_train, y_train, eval_set=[(X_test, y_test)], eval_metric="auc",
+        callbacks=[lgb.early_stopping(stopping_rounds=50, verbose=False)],
+    )
+    train_seconds = time.perf_counter() - started
+    auc = roc_auc_score(y_test, clf.predict_proba(X_test)[:, 1])
+
+    # Serving as ModelService does it, from the saved artifacts.
+    tfidf, svd, scaler, projector = load_preprocessors(feature_extraction.preproc_dir)
+    assembler = feature_assembler(tfidf, svd, scaler, projector)
+    explainer = shap.TreeExplainer(clf, model_output="raw")
+    X_served = preprocess_notes(notes, assembler)
+
+    features = batch_features.transform(pd.DataFrame(notes))
+    X_num = features[FEATURE_SPEC.numeric_features].fillna(0).astype(float).values
+    text = feature_extraction.model_text(features)
+    if sparse:
+        X_batch = sparse_model_input(scaler.transform(X_num), tfidf.transform(text))
+    else:
+        X_batch = assembler.transform(X_num, text)
+    same_rows = np.array_equal(X_served, X_batch.toarray() if sparse else X_batch)
+    same_predictions = np.array_equal(clf.predict_proba(X_served), clf.predict_proba(X_batch))
+
+    timings = {"featurize": 0.0, "predict": 0.0, "shap": 0.0}
+    for note in notes:
+        started = time.perf_counter()
+        X = preprocess_notes([note], assembler)
+        featurized = time.perf_counter()
+        clf.predict_proba(X)
+        predicted = time.perf_counter()
+        explainer.shap_values(X, check_additivity=False)
+        timings["featurize"] += featurized - started
+        timings["predict"] += predicted - featurized
+        timings["shap"] += time.perf_counter() - predicted
+    return {
+        "features": X_train.shape[1],
+        "split_seconds": split_seconds,
+        "train_seconds": train_seconds,
+        "trees": clf.booster_.num_trees(),
+        "roc_auc": auc,
+        **{f"{step}_ms": 1000 * seconds / len(notes) for step, seconds in timings.items()},
+        "parity": same_rows and same_predictions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SVD vs sparse TF-IDF text features")
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--max-notes", type=int, default=12)
+    parser.add_argument("--timed-notes", type=int, default=300)
+    parser.add_argument("--workdir", default="/tmp/bench_sparse")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    db_path = os.path.join(args.workdir, f"ehr_{args.patients}.db")
+    # Read by db.db and the pipeline modules at import time.
+    os.environ.update(
+        DB_URL=f"sqlite:///{db_path}",
+        DB_ASYNC_URL=f"sqlite+aiosqlite:///{db_path}",
+        NOTE_STORE_DIR=os.path.join(args.workdir, "notes"),
+        TEXT_CACHE_DIR="",
+        PREPROC_CACHE_DIR="",
+        MATRIX_CACHE_DIR="",
+    )
+    os.chdir(args.workdir)
+    if not os.path.exists(db_path):
+        from db.synthetic import build_synthetic_db
+
+        started = time.perf_counter()
+        build_synthetic_db(f"sqlite:///{db_path}", args.patients, max_notes=args.max_notes).dispose()
+        print(f"built {db_path} in {time.perf_counter() - started:.0f}s")
+    from pipeline.preprocessing import FeatureExtraction
+
+    df = FeatureExtraction().extract_features()
+    notes = serving_notes(args.timed_notes)
+    results = {mode: run_mode(df, mode == "sparse", notes) for mode in MODES}
+
+    print(
+        f"{'mode':>7} {'features':>9} {'split s':>8} {'train s':>8} {'trees':>6} {'ROC-AUC':>8} "
+        f"{'featurize ms':>13} {'predict ms':>11} {'shap ms':>8} {'parity':>7}"
+    )
+    for mode, r in results.items():
+        print(
+            f"{mode:>7} {r['features']:>9} {r['split_seconds']:>8.2f} {r['train_seconds']:>8.2f} {r['trees']:>6} "
+            f"{r['roc_auc']:>8.4f} {r['featurize_ms']:>13.3f} {r['predict_ms']:>11.3f} {r['shap_ms']:>8.3f} "
+            f"{str(r['parity']):>7}"
+        )
+    sys.exit(0 if all(r["parity"] for r in results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Staged vs streaming preprocessing, from the database to feature matrices.
+
+Builds a synthetic EHR (``db.synthetic``), then runs the staged pipeline
+(``FeatureExtraction.extract_features`` + ``split_data``) and the generator
+pipeline (``pipeline.streaming.StreamingPipeline``) in a fresh process each,
+and reports wall time and peak RSS. The two must produce the same labels and
+matrices up to float32 rounding of the text features.
+
+Usage:
+    python benchmarks/bench_streaming.py [--patients 20000] [--workdir /tmp/bench_streaming]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import numpy as np
+
+# The float32 text features of the two runs may differ in the last bit.
+TOLERANCE = 1e-6
+
+
+def run_mode(mode: str, out_path: str) -> dict:
+    """Child process body; DB_URL points at the synthetic database"""
+    from pipeline.preprocessing import FeatureExtraction
+    from pipeline.streaming import StreamingPipeline
+
+    started = time.perf_counter()
+    if mode == "staged":
+        feature_extraction = FeatureExtraction()
+        X_train, X_test, y_train, y_test = feature_extraction.split_data(feature_extraction.extract_features())
+    else:
+        X_train, X_test, y_train, y_test = StreamingPipeline().run()
+    seconds = time.perf_counter() - started
+    np.savez(out_path, X_train=X_train, X_test=X_test, y_train=y_train, y_test=y_test)
+    return {
+        "rows": len(y_train) + len(y_test),
+        "seconds": seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Staged vs streaming preprocessing benchmark")
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--max-notes", type=int, default=12)
+    parser.add_argument("--workdir", default="/tmp/bench_streaming")
+    parser.add_argument("--child", choices=["staged", "streaming"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.child, os.path.join(args.workdir, f"{args.child}.npz"))))
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    db_path = os.path.join(args.workdir, f"ehr_{args.patients}.db")
+    if not os.path.exists(db_path):
+        from db.synthetic import build_synthetic_db
+
+        started = time.perf_counter()
+        build_synthetic_db(f"sqlite:///{db_path}", args.patients, max_notes=args.max_notes).dispose()
+        print(f"built {db_path} in {time.perf_counter() - started:.0f}s")
+
+    env = dict(
+        os.environ,
+        DB_URL=f"sqlite:///{db_path}",
+        DB_ASYNC_URL=f"sqlite+aiosqlite:///{db_path}",
+        NOTE_STORE_DIR=os.path.join(args.workdir, "notes"),
+        TEXT_CACHE_DIR="",
+        PREPROC_CACHE_DIR="",
+        MATRIX_CACHE_DIR="",
+    )
+    results = {}
+    for mode in ["staged", "streaming"]:
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--patients", str(args.patients),
+             "--workdir", args.workdir, "--child", mode],
+            capture_output=True, text=True, env=env, cwd=args.workdir,
+        )
+        if child.returncode != 0:
+            print(child.stderr[-2000:])
+            sys.exit(1)
+        results[mode] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    print(f"{'mode':>10} {'rows':>9} {'seconds':>8} {'peak RSS MB':>12}")
+    for mode, r in results.items():
+        print(f"{mode:>10} {r['rows']:>9} {r['seconds']:>8.1f} {r['peak_rss_mb']:>12.0f}")
+
+    staged = np.load(os.path.join(args.workdir, "staged.npz"))
+    streaming = np.load(os.path.join(args.workdir, "streaming.npz"))
+    same_labels = all(np.array_equal(staged[key], streaming[key]) for key in ["y_train", "y_test"])
+    max_diff = max(np.abs(staged[key] - streaming[key]).max() for key in ["X_train", "X_test"])
+    print(f"labels identical: {same_labels}, max abs matrix difference: {max_diff:.2e}")
+    sys.exit(0 if same_labels and max_diff < TOLERANCE else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Accuracy check and benchmark of utils.text_projector.TextProjector.
+
+Fits TF-IDF and SVD on the masked model text of synthetic notes
+(``db.synthetic``) with the training parameters, and with a few other
+TfidfVectorizer settings, and checks that the fused float32 projection agrees
+with ``svd.transform(tfidf.transform(...))`` to float32 precision. Then
+times the text projection of single notes, as served per request, and of a
+batch.
+
+Usage:
+    python benchmarks/bench_text_projector.py [--patients 2000]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+from db.synthetic import NoteGenerator
+from pipeline.preprocessing import SVD_PARAMS, TFIDF_PARAMS
+from utils.feature_spec import RowFeatures
+from utils.helper import clean_html, mask_post_flare_terms
+from utils.text_projector import TextProjector
+
+TOLERANCE = 1e-5
+
+VARIANTS = [
+    ("training", TFIDF_PARAMS, SVD_PARAMS),
+    ("l1", dict(TFIDF_PARAMS, norm="l1"), SVD_PARAMS),
+    ("no-norm", dict(TFIDF_PARAMS, norm=None), SVD_PARAMS),
+    ("sublinear", dict(TFIDF_PARAMS, sublinear_tf=True), SVD_PARAMS),
+    ("no-idf", dict(TFIDF_PARAMS, use_idf=False), SVD_PARAMS),
+    ("binary", dict(TFIDF_PARAMS, binary=True), SVD_PARAMS),
+]
+
+
+def model_texts(n_patients: int) -> list:
+    row = RowFeatures(clean=clean_html, mask=mask_post_flare_terms)
+    generator = NoteGenerator(seed=21)
+    texts = []
+    for patient_id in range(1, n_patients + 1):
+        for note in generator.patient_rows(patient_id, max_notes=6)["newProgressNotes"]:
+            texts.append(row.model_text(row.transform(note)))
+    return texts + ["", "zzz unseen words only"]
+
+
+def per_note_ms(func, texts: list) -> float:
+    started = time.perf_counter()
+    for text in texts:
+        func([text])
+    return 1000 * (time.perf_counter() - started) / len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fused TF-IDF -> SVD projection accuracy and latency")
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--timed-notes", type=int, default=1000)
+    args = parser.parse_args()
+
+    texts = model_texts(args.patients)
+    failures = 0
+    for name, tfidf_params, svd_params in VARIANTS:
+        tfidf = TfidfVectorizer(**tfidf_params)
+        svd = TruncatedSVD(**svd_params).fit(tfidf.fit_transform(texts))
+        projector = TextProjector.from_fitted(tfidf, svd)
+        max_diff = np.abs(svd.transform(tfidf.transform(texts)) - projector.transform(texts)).max()
+        failures += max_diff > TOLERANCE
+        print(f"{name:>10}: {len(texts)} texts, max abs difference {max_diff:.2e}")
+        if name == "training":
+            two_step = lambda batch: svd.transform(tfidf.transform(batch))
+            timed = texts[: args.timed_notes]
+            print(f"{'path':>10} {'single ms/note':>15} {'batch ms/note':>14}")
+            for path, func in [("two-step", two_step), ("fused", projector.transform)]:
+                started = time.perf_counter()
+                func(texts)
+                batch_ms = 1000 * (time.perf_counter() - started) / len(texts)
+                print(f"{path:>10} {per_note_ms(func, timed):>15.3f} {batch_ms:>14.4f}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
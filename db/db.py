@@ -1,7 +1,12 @@
 
-from sqlalchemy import create_engine, text, URL
+from sqlalchemy import create_engine, event, text, URL
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from contextlib import contextmanager
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 
@@ -22,18 +27,158 @@ url_object = URL.create(
     database=db_name,
 )
 
-print("database url", url_object)
+# DB_URL overrides the MySQL URL, e.g. "sqlite:///data/synthetic_ehr.db" for
+# the synthetic EHR built by db/synthetic.py.
+sync_url = os.getenv("DB_URL") or url_object
 
+print("database url", sync_url)
 
+# Connection pool of the serving engine. Size it so that
+# workers * (pool_size + max_overflow) stays below the database's max_connections.
+pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+pool_recycle = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+pool_timeout = int(os.getenv("DB_POOL_TIMEOUT", "30"))
 
-engine = create_engine(url_object, pool_pre_ping=True)
 
-
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+engine = create_engine(
+    sync_url,
+    pool_pre_ping=True,
+    pool_size=pool_size,
+    max_overflow=max_overflow,
+    pool_recycle=pool_recycle,
+    pool_timeout=pool_timeout,
+)
 
 
+SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
 
+def create_pooled_engine(pool_size: int, max_overflow: int = 0):
+    """Create an engine whose connection pool is sized for ``pool_size`` concurrent workers."""
+    pooled_engine = create_engine(
+        sync_url,
+        pool_pre_ping=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=pool_recycle,
+        pool_timeout=pool_timeout,
+    )
+    register_sqlite_functions(pooled_engine)
+    return pooled_engine
+
+
+class PoolTelemetry:
+    """Checkout counters, pool wait and connect times for an engine's connection pool.
+
+    A checkout that opens a new DBAPI connection spends part of its time
+    connecting; that time is measured with the engine's ``do_connect`` and
+    pool ``connect`` events and reported as connect time, so the wait only
+    covers queueing for a pool slot (and the pre-ping of a reused
+    connection).
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.connects = 0
+        self.total_connect = 0.0
+        self.max_connect = 0.0
+        event.listen(engine, "do_connect", self._connect_started)
+        event.listen(engine, "connect", self._connect_finished)
+
+    def _connect_started(self, dialect, connection_record, cargs, cparams):
+        self._local.connect_started = time.perf_counter()
+
+    def _connect_finished(self, dbapi_connection, connection_record):
+        started = getattr(self._local, "connect_started", None)
+        if started is None:
+            return
+        self._local.connect_started = None
+        self._local.connect_time = getattr(self._local, "connect_time", 0.0) + time.perf_counter() - started
+
+    def start_checkout(self):
+        """Reset the connect time measured on this thread before a checkout."""
+        self._local.connect_time = 0.0
+
+    def record_wait(self, seconds: float):
+        """Record a checkout of ``seconds``, split into pool wait and connect time."""
+        connect = min(getattr(self._local, "connect_time", 0.0), seconds)
+        self._local.connect_time = 0.0
+        wait = seconds - connect
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if connect:
+                self.connects += 1
+                self.total_connect += connect
+                self.max_connect = max(self.max_connect, connect)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        """Current pool occupancy plus the checkout statistics since startup."""
+        pool = self.engine.pool
+        with self._lock:
+            checkouts, timeouts = self.checkouts, self.timeouts
+            total_wait, max_wait = self.total_wait, self.max_wait
+            connects, total_connect, max_connect = self.connects, self.total_connect, self.max_connect
+        return {
+            "pool_size": pool.size() if hasattr(pool, "size") else 0,
+            "max_overflow": max_overflow,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else 0,
+            "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else 0,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else 0,
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "avg_wait_ms": round(1000 * total_wait / checkouts, 3) if checkouts else 0.0,
+            "max_wait_ms": round(1000 * max_wait, 3),
+            "connects": connects,
+            "avg_connect_ms": round(1000 * total_connect / connects, 3) if connects else 0.0,
+            "max_connect_ms": round(1000 * max_connect, 3),
+        }
+
+
+pool_telemetry = PoolTelemetry(engine)
+
+# Async engine for the extraction coroutines. DB_ASYNC_URL overrides the
+# aiomysql URL, e.g. "sqlite+aiosqlite:///data/ehr.db" for a local stand-in.
+async_url = os.getenv("DB_ASYNC_URL") or url_object.set(drivername="mysql+aiomysql")
+
+async_engine = create_async_engine(async_url, pool_pre_ping=True)
+
+
+def _mysql_concat(*parts):
+    """MySQL CONCAT semantics: NULL if any argument is NULL."""
+    if any(part is None for part in parts):
+        return None
+    return "".join(str(part) for part in parts)
+
+
+def register_sqlite_functions(sqlite_engine):
+    """Give a SQLite stand-in engine the MySQL functions used by the extraction queries."""
+    sync_engine = getattr(sqlite_engine, "sync_engine", sqlite_engine)
+    if sync_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _register(dbapi_connection, connection_record):
+        dbapi_connection.create_function("concat", -1, _mysql_concat)
+
+
+register_sqlite_functions(engine)
+register_sqlite_functions(async_engine)
+
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 
 def get_db():
@@ -42,4 +187,34 @@ def get_db():
         yield db
     finally:
         db.close()
-    
\ No newline at end of file
+
+
+@contextmanager
+def session_scope():
+    """Session for one request, always returned to the pool on exit.
+
+    The connection is checked out up front so the pool wait, and the
+    connect time of a new connection, are recorded in ``pool_telemetry``.
+    """
+    db = SessionLocal()
+    pool_telemetry.start_checkout()
+    started = time.perf_counter()
+    try:
+        db.connection()
+    except PoolTimeoutError:
+        pool_telemetry.record_timeout()
+        db.close()
+        raise
+    pool_telemetry.record_wait(time.perf_counter() - started)
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,383 @@
+"""
+Synthetic EHR database for running the pipeline and the API offline.
+
+Creates the tables the extraction queries read (progressNotes,
+newProgressNotes, pnAssessment, diagnosis, diagnosisCodes, providers and
+placeOfService) on any SQLAlchemy URL and fills them with HTML-laden
+dermatology notes. Histories are copy-forwarded per patient like the real
+EHR, and flare visits mention the terms the feature code looks for.
+
+Usage:
+    python -m db.synthetic --url sqlite:///data/synthetic_ehr.db --patients 5000
+
+Then point the pipeline at it:
+    DB_URL=sqlite:///data/synthetic_ehr.db DB_ASYNC_URL=sqlite+aiosqlite:///data/synthetic_ehr.db
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    create_engine,
+)
+from sqlalchemy.dialects import sqlite
+from db.db import register_sqlite_functions
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Second-resolution timestamps on SQLite, matching what MySQL DATETIME returns.
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite",
+)
+
+metadata = MetaData()
+
+progress_notes = Table(
+    "progressNotes",
+    metadata,
+    Column("noteId", Integer, primary_key=True, autoincrement=False),
+    Column("patientId", Integer, nullable=False),
+    Column("provider", Integer),
+    Column("physician", Integer),
+    Column("referringPhysician", Integer),
+    Column("billingProvider", Integer),
+    Column("placeOfService", Integer),
+    Column("noteDate", Timestamp),
+    Column("physicianSignDate", Timestamp),
+    Index("ix_progressNotes_patientId", "patientId"),
+)
+
+new_progress_notes = Table(
+    "newProgressNotes",
+    metadata,
+    Column("noteId", Integer, primary_key=True, autoincrement=False),
+    Column("complaints", Text),
+    Column("pastHistory", Text),
+    Column("assesment", Text),
+    Column("reviewofsystem", Text),
+    Column("currentmedication", Text),
+    Column("procedure", Text),
+    Column("biopsyNotes", Text),
+    Column("mohsNotes", Text),
+    Column("allergy", Text),
+    Column("examination", Text),
+    Column("patientSummary", Text),
+)
+
+pn_assessment = Table(
+    "pnAssessment",
+    metadata,
+    Column("assessmentId", Integer, primary_key=True, autoincrement=False),
+    Column("noteId", Integer, nullable=False),
+    Column("dxId", Integer),
+    Column("dxCodeId", Integer),
+    Index("ix_pnAssessment_noteId", "noteId"),
+    Index("ix_pnAssessment_dxId", "dxId"),
+)
+
+diagnosis = Table(
+    "diagnosis",
+    metadata,
+    Column("dxId", Integer, primary_key=True, autoincrement=False),
+    Column("dxDescription", String(255)),
+)
+
+diagnosis_codes = Table(
+    "diagnosisCodes",
+    metadata,
+    Column("dxCodeId", Integer, primary_key=True, autoincrement=False),
+    Column("dxId", Integer),
+    Column("icd10Code", String(16)),
+)
+
+providers = Table(
+    "providers",
+    metadata,
+    Column("providerId", Integer, primary_key=True, autoincrement=False),
+    Column("firstName", String(64)),
+    Column("lastName", String(64)),
+)
+
+place_of_service = Table(
+    "placeOfService",
+    metadata,
+    Column("posCodes", Integer, primary_key=True, autoincrement=False),
+    Column("posName", String(128)),
+)
+
+
+PSORIASIS_DIAGNOSES = [
+    (1120, "L40.0", "Psoriasis vulgaris, Plaque psoriasis"),
+    (1121, "L40.1", "Generalized pustular psoriasis, Pustular psoriasis"),
+    (1122, "L40.4", "Guttate psoriasis"),
+    (1123, "L40.50", "Arthropathic psoriasis, unspecified"),
+    (1124, "L40.8", "Other psoriasis"),
+    (1216, "L40.9", "Psoriasis, unspecified"),
+]
+OTHER_DIAGNOSES = [
+    (200, "L82.1", "Seborrheic keratosis"),
+    (201, "L57.0", "Actinic keratosis"),
+    (202, "L20.9", "Atopic dermatitis, unspecified"),
+    (203, "D22.5", "Melanocytic nevi of trunk"),
+    (204, "L70.0", "Acne vulgaris"),
+]
+PLACES_OF_SERVICE = [(11, "Office"), (22, "On Campus-Outpatient Hospital"), (2, "Telehealth")]
+FIRST_NAMES = ["Ann", "Bilal", "Carmen", "David", "Elena", "Farah", "George", "Hina", "Ivan", "Julia"]
+LAST_NAMES = ["Lee", "Khan", "Garcia", "Smith", "Rossi", "Ahmed", "Brown", "Iqbal", "Petrov", "Novak"]
+
+SITES = ["elbows", "knees", "scalp", "lower back", "shins", "trunk", "hands"]
+FLARE_COMPLAINTS = [
+    "Psoriasis flare on the {site} for 2 weeks, worse with cold weather.",
+    "Increased itching, redness and scaling on the {site}. Tried OTC cream without relief.",
+    "New rash and burning over the {site}; lesions spreading.",
+]
+STABLE_COMPLAINTS = [
+    "Follow up for psoriasis. Stable on current regimen.",
+    "Routine skin check, no new concerns.",
+    "Here for follow up of {site} plaques, improving.",
+]
+STEROIDS = ["Triamcinolone 0.1% ointment", "Clobetasol 0.05% cream", "Hydrocortisone 2.5% cream"]
+BIOLOGICS = ["Adalimumab 40 mg SC q2w", "Secukinumab 300 mg SC monthly", "Ixekizumab 80 mg SC q4w"]
+OTHER_MEDS = ["Lisinopril 10 mg daily", "Metformin 500 mg BID", "Vitamin D3 2000 IU daily", "Cetirizine 10 mg"]
+
+
+def _html_list(items) -> str:
+    return "<ul>" + "".join(f"<li>{item}</li>" for item in items) + "</ul>"
+
+
+class NoteGenerator:
+    """Deterministic generator of synthetic patients and their visit notes."""
+
+    def __init__(self, seed: int = 42, start_date: datetime = datetime(2022, 6, 1), days: int = 1200):
+        self.rng = random.Random(seed)
+        self.start_date = start_date
+        self.days = days
+        self.note_id = 0
+        self.assessment_id = 0
+
+    def _patient(self, patient_id: int) -> dict:
+        rng = self.rng
+        gender = rng.choice(["Male", "Female"])
+        age = rng.randint(18, 85)
+        smoker = rng.random() < 0.2
+        history = [
+            "Current every day smoker." if smoker else "Never smoker.",
+            f"Alcohol use: {'yes, socially' if rng.random() < 0.4 else 'no'}.",
+            f"Family history of melanoma: {'yes, father' if rng.random() < 0.08 else 'no'}.",
+        ]
+        allergy = rng.choice(
+            ["No known drug allergies.", "No Known Allergies", "Penicillin (rash).", "Sulfa drugs (hives)."]
+        )
+        meds = rng.sample(OTHER_MEDS, rng.randint(0, 2))
+        if rng.random() < 0.25:
+            meds.append(rng.choice(BIOLOGICS))
+        return {
+            "patientId": patient_id,
+            "psoriasis": rng.random() < 0.6,
+            "severity": rng.random(),
+            "site": rng.choice(SITES),
+            "summary": f"<p>{age} year old {gender} presenting to the dermatology clinic.</p>",
+            "history": "<p><strong>Social History:</strong></p>" + _html_list(history),
+            "allergy": f"<p>{allergy}</p>",
+            "meds": meds,
+            "provider": rng.randint(1, len(FIRST_NAMES)),
+            "physician": rng.randint(1, len(FIRST_NAMES)),
+        }
+
+    def _visit(self, patient: dict, note_date: datetime, steroid: bool) -> dict:
+        rng = self.rng
+        site = patient["site"]
+        flare = patient["psoriasis"] and rng.random() < 0.25 + 0.4 * patient["severity"]
+        template = rng.choice(FLARE_COMPLAINTS if flare else STABLE_COMPLAINTS)
+        complaints = f"<p><strong>Chief Complaint:</strong>&nbsp;{template.format(site=site)}</p>"
+
+        exam = [f"Well-demarcated erythematous plaques with silvery scale on the {site}."] if patient["psoriasis"] else []
+        if rng.random() < 0.15:
+            exam.append("Post-inflammatory hyperpigmentation noted.")
+        exam.append("Skin otherwise clear; no suspicious pigmented lesions.")
+
+        ros = ["Reports itching." if flare or rng.random() < 0.2 else "Denies itching."]
+        ros.append("Dry skin." if rng.random() < 0.4 else "No dry skin.")
+        ros.append("No fever or chills.")
+
+        if patient["psoriasis"]:
+            assessment = "Psoriasis flare-up, worsening despite treatment." if flare else "Psoriasis, stable."
+            if flare and rng.random() < 0.5:
+                assessment += f" Possible trigger: {rng.choice(['stress', 'recent infection', 'cold weather', 'new medication'])}."
+            if flare:
+                assessment += f" Start {rng.choice(STEROIDS)}, apply twice daily for 2 weeks."
+        else:
+            assessment = "Benign lesions, reassurance given."
+
+        meds = list(patient["meds"]) + ([rng.choice(STEROIDS)] if steroid else [])
+        procedure = ""
+        biopsy = ""
+        if rng.random() < 0.05:
+            procedure = "<p>Shave biopsy performed, specimen sent to pathology.</p>"
+            biopsy = (
+                "<strong>A. Biopsy</strong><br/><strong>Location:</strong> "
+                f"{site.title()}<br/><strong>Method:</strong>&nbsp;Shave<br/><br/> "
+                "The patient gave informed consent for this procedure. Local anesthetic, 2% lidocaine "
+                "with epinephrine was infiltrated around the area of interest.<br />"
+            )
+
+        return {
+            "flare": flare,
+            "note": {
+                "complaints": complaints,
+                "pastHistory": patient["history"],
+                "assesment": f"<p>{assessment}</p>",
+                "reviewofsystem": "<p>" + " ".join(ros) + "</p>",
+                "currentmedication": _html_list(meds) if meds else "<p>No active medications.</p>",
+                "procedure": procedure,
+                "biopsyNotes": biopsy,
+                "mohsNotes": "",
+                "allergy": patient["allergy"],
+                "examination": "<p><strong>Exam:</strong></p>" + _html_list(exam),
+                "patientSummary": patient["summary"] + ("<p>Follow up visit.</p>" if rng.random() < 0.5 else ""),
+            },
+        }
+
+    def patient_rows(self, patient_id: int, max_notes: int) -> dict:
+        """All table rows for one patient's visit history."""
+        rng = self.rng
+        patient = self._patient(patient_id)
+        n_notes = rng.randint(1, max_notes)
+        offsets = sorted(rng.sample(range(self.days), min(n_notes, self.days)))
+        rows = {"progressNotes": [], "newProgressNotes": [], "pnAssessment": []}
+        steroid = False
+        for offset in offsets:
+            self.note_id += 1
+            note_date = self.start_date + timedelta(days=offset, hours=rng.randint(8, 17))
+            signed = rng.random() > 0.03
+            visit = self._visit(patient, note_date, steroid)
+            steroid = visit["flare"] or (steroid and rng.random() < 0.5)
+
+            rows["progressNotes"].append({
+                "noteId": self.note_id,
+                "patientId": patient_id,
+                "provider": patient["provider"],
+                "physician": patient["physician"],
+                "referringPhysician": rng.randint(1, len(FIRST_NAMES)) if rng.random() < 0.1 else None,
+                "billingProvider": patient["provider"],
+                "placeOfService": rng.choice(PLACES_OF_SERVICE)[0],
+                "noteDate": note_date,
+                "physicianSignDate": note_date + timedelta(days=rng.randint(0, 3), hours=2) if signed else None,
+            })
+            rows["newProgressNotes"].append({"noteId": self.note_id, **visit["note"]})
+
+            dx_pool = PSORIASIS_DIAGNOSES if patient["psoriasis"] else OTHER_DIAGNOSES
+            for dx_id, _, _ in rng.sample(dx_pool, rng.randint(1, 2)):
+                self.assessment_id += 1
+                rows["pnAssessment"].append({
+                    "assessmentId": self.assessment_id,
+                    "noteId": self.note_id,
+                    "dxId": dx_id,
+                    "dxCodeId": dx_id,
+                })
+        return rows
+
+
+def create_schema(engine, drop_existing: bool = True):
+    """Create the EHR tables read by the extraction queries."""
+    if drop_existing:
+        metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+
+def populate(engine, n_patients: int, max_notes: int = 12, batch_patients: int = 2000, seed: int = 42):
+    """
+    Fill the synthetic EHR with ``n_patients`` patients.
+
+    Args:
+        engine: SQLAlchemy engine with the schema created
+        n_patients: Number of patients to generate
+        max_notes: Maximum visits per patient (uniform 1..max_notes)
+        batch_patients: Patients generated and inserted per transaction
+        seed: Random seed; the same seed produces the same database
+
+    Returns:
+        Number of notes written
+    """
+    with engine.begin() as conn:
+        conn.execute(providers.insert(), [
+            {"providerId": i + 1, "firstName": first, "lastName": LAST_NAMES[i]}
+            for i, first in enumerate(FIRST_NAMES)
+        ])
+        conn.execute(place_of_service.insert(), [
+            {"posCodes": code, "posName": name} for code, name in PLACES_OF_SERVICE
+        ])
+        conn.execute(diagnosis.insert(), [
+            {"dxId": dx_id, "dxDescription": description}
+            for dx_id, _, description in PSORIASIS_DIAGNOSES + OTHER_DIAGNOSES
+        ])
+        conn.execute(diagnosis_codes.insert(), [
+            {"dxCodeId": dx_id, "dxId": dx_id, "icd10Code": code}
+            for dx_id, code, _ in PSORIASIS_DIAGNOSES + OTHER_DIAGNOSES
+        ])
+
+    generator = NoteGenerator(seed=seed)
+    started = time.perf_counter()
+    for first_id in range(1, n_patients + 1, batch_patients):
+        batch = {"progressNotes": [], "newProgressNotes": [], "pnAssessment": []}
+        for patient_id in range(first_id, min(first_id + batch_patients, n_patients + 1)):
+            for table_name, rows in generator.patient_rows(patient_id, max_notes).items():
+                batch[table_name].extend(rows)
+        with engine.begin() as conn:
+            conn.execute(progress_notes.insert(), batch["progressNotes"])
+            conn.execute(new_progress_notes.insert(), batch["newProgressNotes"])
+            conn.execute(pn_assessment.insert(), batch["pnAssessment"])
+        logger.info(
+            f"{min(first_id + batch_patients - 1, n_patients)} patients, {generator.note_id} notes "
+            f"written ({time.perf_counter() - started:.1f}s)"
+        )
+    return generator.note_id
+
+
+def build_synthetic_db(url: str, n_patients: int, max_notes: int = 12, seed: int = 42):
+    """Create and populate a synthetic EHR database at ``url``; returns its engine."""
+    engine = create_engine(url)
+    register_sqlite_functions(engine)
+    create_schema(engine)
+    populate(engine, n_patients, max_notes=max_notes, seed=seed)
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic EHR database")
+    parser.add_argument("--url", default="sqlite:///data/synthetic_ehr.db", help="SQLAlchemy database URL")
+    parser.add_argument("--patients", type=int, default=5000, help="Number of patients")
+    parser.add_argument("--max-notes", type=int, default=12, help="Maximum notes per patient")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.url.startswith("sqlite:///"):
+        db_dir = os.path.dirname(args.url[len("sqlite:///"):])
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+    engine = build_synthetic_db(args.url, args.patients, max_notes=args.max_notes, seed=args.seed)
+    engine.dispose()
+    logger.info(f"Synthetic EHR ready at {args.url}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,58 +3,104 @@ import sys
 import pandas as pd
 import numpy as np
 import asyncio
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.db import AsyncSessionLocal, SessionLocal, async_engine, create_pooled_engine
 
 
 
-async def get_patient_ids(db: Session):
+# Psoriasis diagnosis IDs (pnAssessment.dxId) that define the training cohort.
+COHORT_DX_IDS = (
+    1120, 1121, 1122, 1123, 1124, 1216, 1596, 1662, 1663, 1666,
+    1667, 1668, 1830, 1872, 1895, 2051, 2052, 2102, 2256,
+)
+COHORT_START_DATE = "2023-01-01 00:00:00"
+
+# The cohort only changes as new notes are signed, so reuse it for a day.
+COHORT_CACHE_DIR = os.getenv("COHORT_CACHE_DIR", os.path.join("data", "cache"))
+COHORT_CACHE_TTL = int(os.getenv("COHORT_CACHE_TTL", str(24 * 60 * 60)))
+
+COHORT_QUERY = text("""SELECT DISTINCT pn.patientId
+        FROM progressNotes pn
+        JOIN pnAssessment pa ON pn.noteId = pa.noteId
+        WHERE pa.dxId IN :dx_ids AND pn.noteDate >= :start_date""").bindparams(
+    bindparam("dx_ids", expanding=True)
+)
+
+
+def _cohort_cache_path(dx_ids, start_date: str):
+    """Cache file for a cohort definition on the configured database."""
+    key = json.dumps(
+        {"db": str(async_engine.url), "dx_ids": sorted(dx_ids), "start_date": start_date},
+        sort_keys=True,
+    )
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(COHORT_CACHE_DIR, f"cohort_{digest}.json")
+
+
+def _read_cached_cohort(path: str, ttl: int):
+    """Return the cached patient IDs, or None if the cache is missing or older than ``ttl`` seconds."""
+    if ttl <= 0 or not os.path.exists(path):
+        return None
+    if time.time() - os.path.getmtime(path) > ttl:
+        return None
     try:
-        """Fetch a single note and attach biopsy, general, mohs, and prescription results."""
-
-        data = text("""SELECT * FROm progressNotes pn JOIN pnAssessment pa ON pn.noteId = pa.noteId WHERE pa.dxId IN (1120,
-        1121,
-        1122,
-        1123,
-        1124,
-        1216,
-        1596,
-        1662,
-        1663,
-        1666,
-        1667,
-        1668,
-        1830,
-        1872,
-        1895,
-        2051,
-        2052,
-        2102,
-        2256) AND pn.noteDate >= "2023-01-01 00:00:0000" """)
-        dxd_result = db.execute(data)
-        
-        patient_ids = []
-
-        for row in dxd_result.mappings():
-            patient_ids.append(str(row['patientId']))
-        
-        return patient_ids
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        patient_ids = []
+        with open(path) as f:
+            return json.load(f)["patient_ids"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_cached_cohort(path: str, patient_ids: list):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"patient_ids": patient_ids}, f)
+    os.replace(tmp_path, path)
+
+
+async def get_patient_ids(
+    db: AsyncSession,
+    dx_ids=COHORT_DX_IDS,
+    start_date: str = COHORT_START_DATE,
+    use_cache: bool = True,
+    ttl: int = COHORT_CACHE_TTL,
+):
+    """Fetch the distinct IDs of patients with a psoriasis assessment since ``start_date``.
+
+    The result is cached on disk for ``ttl`` seconds, keyed by the database
+    and the cohort definition; pass ``use_cache=False`` to force a query.
+    A cached cohort does not see patients who entered it since it was
+    written, so incremental extraction queries without the cache. Query
+    errors are raised.
+    """
+    cache_path = _cohort_cache_path(dx_ids, start_date)
+    if use_cache:
+        patient_ids = _read_cached_cohort(cache_path, ttl)
+        if patient_ids is not None:
+            return patient_ids
+    result = await db.execute(
+        COHORT_QUERY, {"dx_ids": list(dx_ids), "start_date": start_date}
+    )
+    patient_ids = [str(patient_id) for patient_id in result.scalars()]
+    if use_cache:
+        _write_cached_cohort(cache_path, patient_ids)
     return patient_ids
 
 
-async def fetch_final_data(db: Session, patient_ids: list):
-    """Fetch final data for given patient IDs."""
-    try:
-        final_df = """SELECT
-            pn.noteId, pn.provider, pn.physician, pn.referringPhysician, pn.noteDate, pn.patientId,
+FINAL_DATA_QUERY = """SELECT
+            pn.noteId, pn.provider, pn.physician, pn.referringPhysician, pn.noteDate, pn.patientId, pn.physicianSignDate,
             npn.complaints, npn.pastHistory, npn.assesment, npn.reviewofsystem, npn.currentmedication,
             npn.`procedure`, npn.biopsyNotes, npn.mohsNotes, npn.allergy, npn.examination, npn.patientSummary, npn.procedure, npn.assesment,
             group_concat(concat(dc.icd10Code, ' ', d.dxDescription)) AS diagnoses, pos.posName as PlaceOfService, CONCAT(p.firstName, ' ', p.lastName) as 'Rendering Provider', CONCAT(p2.firstName, ' ', p2.lastName) as 'Physician', CONCAT(p3.firstName, ' ', p3.lastName) as 'Referring Provider', CONCAT(p4.firstName, ' ', p4.lastName) as 'Billing Provider'
-            FROM progressNotes pn
+            FROM progressNotes pn {cohort_join}
             LEFT JOIN providers p ON p.providerId = pn.provider
             LEFT JOIN providers p2 ON p2.providerId = pn.physician
             LEFT JOIN providers p3 ON p3.providerId = pn.referringPhysician
@@ -65,19 +111,228 @@ async def fetch_final_data(db: Session, patient_ids: list):
             LEFT JOIN diagnosis d ON d.dxId = pa.dxId
             LEFT JOIN diagnosisCodes dc ON dc.dxId = d.dxId AND dc.dxCodeId = pa.dxCodeId
             WHERE pn.physicianSignDate IS NOT NULL
-            AND pn.patientId IN (""" + ",".join(patient_ids) + """) AND pn.noteDate >= "2023-01-01 00:00:0000" 
+            {cohort_filter} AND pn.noteDate >= "2023-01-01 00:00:0000" {extra_filter}
+            GROUP BY pn.noteId"""
+
+# Projects and joins only what FeatureExtraction.build_features consumes: no
+# provider/place-of-service joins, no biopsy/mohs notes, no repeated columns.
+LEAN_DATA_QUERY = """SELECT
+            pn.noteId, pn.noteDate, pn.patientId, pn.physicianSignDate,
+            npn.complaints, npn.pastHistory, npn.assesment, npn.reviewofsystem, npn.currentmedication,
+            npn.`procedure`, npn.allergy, npn.examination, npn.patientSummary,
+            group_concat(concat(dc.icd10Code, ' ', d.dxDescription)) AS diagnoses
+            FROM progressNotes pn {cohort_join}
+            LEFT JOIN newProgressNotes npn ON pn.noteId = npn.noteId
+            LEFT JOIN pnAssessment pa ON pa.noteId = pn.noteId
+            LEFT JOIN diagnosis d ON d.dxId = pa.dxId
+            LEFT JOIN diagnosisCodes dc ON dc.dxId = d.dxId AND dc.dxCodeId = pa.dxCodeId
+            WHERE pn.physicianSignDate IS NOT NULL
+            {cohort_filter} AND pn.noteDate >= "2023-01-01 00:00:0000" {extra_filter}
             GROUP BY pn.noteId"""
-        final_result =db.execute(text(final_df)).fetchall()
-        df = pd.DataFrame(final_result)
-        return df
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        df = pd.DataFrame()
-        return df
+
+NOTE_QUERIES = {"full": FINAL_DATA_QUERY, "lean": LEAN_DATA_QUERY}
+QUERY_VARIANT = os.getenv("EXTRACT_QUERY_VARIANT", "lean")
+
+# Only notes signed after the stored (physicianSignDate, noteId) high-water mark.
+WATERMARK_FILTER = """AND (pn.physicianSignDate > :watermark_sign_date
+                OR (pn.physicianSignDate = :watermark_sign_date AND pn.noteId > :watermark_note_id))"""
+
+# Rows held in memory per chunk when streaming the final data.
+STREAM_CHUNK_SIZE = int(os.getenv("EXTRACT_CHUNK_SIZE", "5000"))
+
+# Patients per query and concurrent queries for sharded extraction.
+SHARD_SIZE = int(os.getenv("EXTRACT_SHARD_SIZE", "500"))
+SHARD_WORKERS = int(os.getenv("EXTRACT_SHARD_WORKERS", "4"))
+
+
+# Cohorts larger than this are joined through a temporary table instead of
+# being inlined into the query text as an IN (...) list. This applies per
+# query: the default shards of the full extraction (EXTRACT_SHARD_SIZE=500)
+# stay below it and use IN lists, while the unsharded queries (streamed
+# extraction, incremental fetch) and the streaming pipeline's larger shards
+# take the temporary table.
+IN_LIST_MAX = int(os.getenv("EXTRACT_IN_LIST_MAX", "1000"))
+COHORT_TABLE = "tmp_cohort_ids"
+COHORT_INSERT_BATCH = 10000
+
+
+def final_data_query(patient_ids: list, watermark: dict = None, cohort_table: bool = False, variant: str = None):
+    """Build the multi-join note query for the given patient IDs.
+
+    With a ``watermark`` ({"physicianSignDate", "noteId"}) only notes signed
+    after it are selected. With ``cohort_table=True`` the patients are joined
+    from the temporary table filled by ``load_cohort_table`` instead of being
+    listed in the query, which keeps the statement text constant. ``variant``
+    picks the "lean" or "full" projection (default EXTRACT_QUERY_VARIANT).
+    """
+    template = NOTE_QUERIES[variant or QUERY_VARIANT]
+    if cohort_table:
+        cohort_join = f"JOIN {COHORT_TABLE} tc ON tc.patientId = pn.patientId"
+        cohort_filter = ""
+    else:
+        cohort_join = ""
+        cohort_filter = "AND pn.patientId IN (" + ",".join(patient_ids) + ")"
+
+    if watermark is None:
+        return text(template.format(cohort_join=cohort_join, cohort_filter=cohort_filter, extra_filter=""))
+    query = template.format(cohort_join=cohort_join, cohort_filter=cohort_filter, extra_filter=WATERMARK_FILTER)
+    return text(query).bindparams(
+        watermark_sign_date=watermark["physicianSignDate"],
+        watermark_note_id=watermark["noteId"],
+    )
+
+
+def _drop_cohort_table_sql(dialect_name: str):
+    if dialect_name == "mysql":
+        return f"DROP TEMPORARY TABLE IF EXISTS {COHORT_TABLE}"
+    return f"DROP TABLE IF EXISTS temp.{COHORT_TABLE}"
+
+
+def load_cohort_table(db: Session, patient_ids: list):
+    """Load the patient IDs into a connection-local temporary table.
+
+    The IDs are sent as bound, batched multi-row inserts, and the table only
+    lives on the session's connection until ``drop_cohort_table``.
+    """
+    db.execute(text(_drop_cohort_table_sql(db.get_bind().dialect.name)))
+    db.execute(text(f"CREATE TEMPORARY TABLE {COHORT_TABLE} (patientId BIGINT PRIMARY KEY)"))
+    insert = text(f"INSERT INTO {COHORT_TABLE} (patientId) VALUES (:patientId)")
+    rows = [{"patientId": int(patient_id)} for patient_id in sorted(set(patient_ids))]
+    for i in range(0, len(rows), COHORT_INSERT_BATCH):
+        db.execute(insert, rows[i:i + COHORT_INSERT_BATCH])
+
+
+def drop_cohort_table(db: Session):
+    db.execute(text(_drop_cohort_table_sql(db.get_bind().dialect.name)))
+
+
+async def fetch_final_data(db: AsyncSession, patient_ids: list, watermark: dict = None, in_list_max: int = IN_LIST_MAX):
+    """Fetch final data for given patient IDs.
+
+    Query errors propagate, so a failed fetch is never mistaken for a cohort
+    without notes.
+    """
+    use_cohort_table = len(patient_ids) > in_list_max
+    if use_cohort_table:
+        await db.run_sync(load_cohort_table, patient_ids)
+    try:
+        query = final_data_query(patient_ids, watermark, cohort_table=use_cohort_table)
+        final_result = (await db.execute(query)).fetchall()
+    finally:
+        if use_cohort_table:
+            await db.run_sync(drop_cohort_table)
+    return pd.DataFrame(final_result)
+
+
+def stream_final_data(db: Session, patient_ids: list, chunk_size: int = STREAM_CHUNK_SIZE, in_list_max: int = IN_LIST_MAX):
+    """Yield final data for given patient IDs as DataFrame chunks.
+
+    The query runs on a server-side cursor, so only ``chunk_size`` rows are
+    fetched from the database and held in memory at a time. Errors (e.g. a
+    dropped cursor or connection) propagate to the consumer, so a failed
+    stream is never mistaken for the end of the data.
+    """
+    use_cohort_table = len(patient_ids) > in_list_max
+    if use_cohort_table:
+        load_cohort_table(db, patient_ids)
+    result = None
+    try:
+        query = final_data_query(patient_ids, cohort_table=use_cohort_table).execution_options(
+            stream_results=True, yield_per=chunk_size
+        )
+        result = db.execute(query)
+        columns = list(result.keys())
+        for rows in result.partitions(chunk_size):
+            yield pd.DataFrame(rows, columns=columns)
+    finally:
+        if result is not None:
+            result.close()
+        if use_cohort_table:
+            drop_cohort_table(db)
+
+
+def shard_patient_ids(patient_ids: list, shard_size: int = SHARD_SIZE):
+    """Split the unique patient IDs into shards of at most ``shard_size`` IDs."""
+    unique_ids = sorted(set(patient_ids))
+    return [unique_ids[i:i + shard_size] for i in range(0, len(unique_ids), shard_size)]
+
+
+def _fetch_shard(shard_engine, patient_ids: list):
+    """Fetch final data for one shard on its own session."""
+    with SessionLocal(bind=shard_engine) as db:
+        final_result = db.execute(final_data_query(patient_ids)).fetchall()
+        return pd.DataFrame(final_result)
+
+
+def fetch_final_data_sharded(patient_ids: list, shard_size: int = SHARD_SIZE, max_workers: int = SHARD_WORKERS):
+    """Fetch final data with the patient IDs split into concurrently queried shards.
+
+    Each shard runs on a worker of a bounded thread pool with its own session,
+    backed by an engine whose pool holds exactly ``max_workers`` connections.
+    Shards are disjoint by patient, so the merged result is simply re-sorted
+    by patientId and noteDate. A failed shard query raises, failing the run.
+    """
+    shards = shard_patient_ids(patient_ids, shard_size)
+    shard_engine = create_pooled_engine(pool_size=max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            frames = list(executor.map(partial(_fetch_shard, shard_engine), shards))
+    finally:
+        shard_engine.dispose()
+
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    return df.sort_values(["patientId", "noteDate"], kind="stable").reset_index(drop=True)
+
+
+async def _gather_shard(semaphore: asyncio.Semaphore, patient_ids: list):
+    """Fetch final data for one shard on its own async session."""
+    async with semaphore:
+        async with AsyncSessionLocal() as db:
+            return await fetch_final_data(db, patient_ids)
 
 
+async def gather_final_data(patient_ids: list, shard_size: int = SHARD_SIZE, concurrency: int = SHARD_WORKERS):
+    """Fetch final data with up to ``concurrency`` shard queries in flight on the async engine.
 
+    Every shard is awaited; if any failed, the run fails with the first
+    error rather than returning a cohort missing those shards' patients.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    shards = shard_patient_ids(patient_ids, shard_size)
+    frames = await asyncio.gather(*(_gather_shard(semaphore, shard) for shard in shards), return_exceptions=True)
+    failed = [frame for frame in frames if isinstance(frame, BaseException)]
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(shards)} extraction shards failed") from failed[0]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    return df.sort_values(["patientId", "noteDate"], kind="stable").reset_index(drop=True)
 
 
+async def fetch_new_notes(patient_ids: list, watermark: dict = None, known_patient_ids=()):
+    """Fetch the notes signed since ``watermark`` for the cohort.
 
+    Patients already in the local note store (``known_patient_ids``) only
+    contribute notes signed after the watermark; patients that joined the
+    cohort since the last run are fetched in full.
+    """
+    known = set(str(patient_id) for patient_id in known_patient_ids)
+    known_ids = [patient_id for patient_id in patient_ids if patient_id in known]
+    new_ids = [patient_id for patient_id in patient_ids if patient_id not in known]
+    if watermark is None:
+        known_ids, new_ids = [], list(patient_ids)
 
+    frames = []
+    async with AsyncSessionLocal() as db:
+        if known_ids:
+            frames.append(await fetch_final_data(db, known_ids, watermark))
+        if new_ids:
+            frames.append(await fetch_final_data(db, new_ids))
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
@@ -4,72 +4,29 @@ import pandas as pd
 import numpy as np
 import asyncio
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from sqlalchemy import text
-from sqlalchemy.orm import Session
-from db.db import get_db
+from sqlalchemy import bindparam, text
+from db.db import session_scope
+from pipeline.extract_data import NOTE_QUERIES, QUERY_VARIANT
 import json
 from pandas import to_datetime
 
 
 
-async def get_patient_ids(db: Session):
-    try:
-        """Fetch a single note and attach biopsy, general, mohs, and prescription results."""
-
-        data = text("""SELECT * FROm progressNotes pn JOIN pnAssessment pa ON pn.noteId = pa.noteId WHERE pa.dxId IN (1120,
-        1121,
-        1122,
-        1123,
-        1124,
-        1216,
-        1596,
-        1662,
-        1663,
-        1666,
-        1667,
-        1668,
-        1830,
-        1872,
-        1895,
-        2051,
-        2052,
-        2102,
-        2256) AND pn.noteDate >= "2023-01-01 00:00:0000" """)
-        dxd_result = db.execute(data)
-        
-        patient_ids = []
-
-        for row in dxd_result.mappings():
-            patient_ids.append(str(row['patientId']))
-        
-        return patient_ids
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        patient_ids = []
-    return patient_ids
+# Patients per query when fetching notes for many patients at once.
+BULK_FETCH_BATCH = int(os.getenv("BULK_FETCH_BATCH", "500"))
+
+
+def patient_notes_query(patient_filter: str, variant: str = None):
+    """Note query of the training extraction restricted by ``patient_filter``."""
+    return NOTE_QUERIES[variant or QUERY_VARIANT].format(
+        cohort_join="", cohort_filter="AND " + patient_filter, extra_filter=""
+    )
 
 
 def fetch_final_data(db, patient_id:str): 
     """Fetch final data for given patient IDs."""
     try:
-        final_df = """SELECT
-            pn.noteId, pn.provider, pn.physician, pn.referringPhysician, pn.noteDate, pn.patientId,
-            npn.complaints, npn.pastHistory, npn.assesment, npn.reviewofsystem, npn.currentmedication,
-            npn.`procedure`, npn.biopsyNotes, npn.mohsNotes, npn.allergy, npn.examination, npn.patientSummary, npn.procedure, npn.assesment,
-            group_concat(concat(dc.icd10Code, ' ', d.dxDescription)) AS diagnoses, pos.posName as PlaceOfService, CONCAT(p.firstName, ' ', p.lastName) as 'Rendering Provider', CONCAT(p2.firstName, ' ', p2.lastName) as 'Physician', CONCAT(p3.firstName, ' ', p3.lastName) as 'Referring Provider', CONCAT(p4.firstName, ' ', p4.lastName) as 'Billing Provider'
-            FROM progressNotes pn
-            LEFT JOIN providers p ON p.providerId = pn.provider
-            LEFT JOIN providers p2 ON p2.providerId = pn.physician
-            LEFT JOIN providers p3 ON p3.providerId = pn.referringPhysician
-            LEFT JOIN providers p4 ON p4.providerId = pn.billingProvider
-            LEFT JOIN newProgressNotes npn ON pn.noteId = npn.noteId
-            LEFT JOIN placeOfService pos ON pos.posCodes = pn.placeOfService
-            LEFT JOIN pnAssessment pa ON pa.noteId = pn.noteId
-            LEFT JOIN diagnosis d ON d.dxId = pa.dxId
-            LEFT JOIN diagnosisCodes dc ON dc.dxId = d.dxId AND dc.dxCodeId = pa.dxCodeId
-            WHERE pn.physicianSignDate IS NOT NULL
-            AND pn.patientId = :patient_id AND pn.noteDate >= "2023-01-01 00:00:0000" 
-            GROUP BY pn.noteId"""
+        final_df = patient_notes_query("pn.patientId = :patient_id")
         final_result =db.execute(text(final_df).bindparams(patient_id=patient_id)).fetchall()
         df = pd.DataFrame(final_result)
         return df
@@ -79,11 +36,49 @@ def fetch_final_data(db, patient_id:str):
         return df
 
 
+def fetch_patients_notes(db, patient_ids: list, batch_size: int = BULK_FETCH_BATCH):
+    """
+    Fetch the notes of many patients with one query per ``batch_size`` patients.
+
+    Args:
+        db: Database session
+        patient_ids: Patient identifiers
+        batch_size: Patients bound into each query
+
+    Returns:
+        Dict of patient ID to that patient's notes DataFrame, in input order;
+        patients without notes map to an empty DataFrame
+
+    Raises:
+        Any error of a batch query, so a failed fetch is never reported as
+        patients without notes
+    """
+    patient_ids = [str(patient_id) for patient_id in dict.fromkeys(patient_ids)]
+    query = text(patient_notes_query("pn.patientId IN :patient_ids")).bindparams(
+        bindparam("patient_ids", expanding=True)
+    )
+
+    frames = []
+    for i in range(0, len(patient_ids), batch_size):
+        batch = patient_ids[i:i + batch_size]
+        final_result = db.execute(query, {"patient_ids": batch}).fetchall()
+        frames.append(pd.DataFrame(final_result))
+
+    frames = [frame for frame in frames if not frame.empty]
+    notes_by_patient = {patient_id: pd.DataFrame() for patient_id in patient_ids}
+    if not frames:
+        return notes_by_patient
+    df = pd.concat(frames, ignore_index=True)
+    for patient_id, patient_df in df.groupby(df["patientId"].astype(str), sort=False):
+        notes_by_patient[patient_id] = patient_df.reset_index(drop=True)
+    return notes_by_patient
+
+
 
 
 
 
 if __name__ == '__main__':
-    db = next(get_db())
-    patient_data = fetch_final_data(db, '178635')
+    with session_scope() as db:
+        patient_data = fetch_final_data(db, '178635')
     print(patient_data.head())
\ No newline at end of file
@@ -3,9 +3,12 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import mlflow
 import joblib
+import tempfile
 import pandas as pd
 import logging
-from pipeline.preprocessing import FeatureExtraction
+from pipeline.preprocessing import PREPROC_DIR, FeatureExtraction
+from pipeline.streaming import ChunkStore, StreamingPipeline
+from utils.text_cache import text_cache_stats
 from sklearn.metrics import classification_report, roc_auc_score
 from lightgbm import LGBMClassifier
 import lightgbm as lgb
@@ -24,31 +27,59 @@ logging.basicConfig(
 
 mlflow.set_experiment("flare_detection_pipeline")
 
-def run_pipeline():
-    with mlflow.start_run(run_name="feature_extraction_and_training") as run:
+def run_pipeline(incremental: bool = False, streaming: bool = False):
+    # Files are logged from a directory of this run only, so concurrent runs
+    # never overwrite each other's artifacts.
+    os.makedirs(PREPROC_DIR, exist_ok=True)
+    with mlflow.start_run(run_name="feature_extraction_and_training") as run, tempfile.TemporaryDirectory(
+        prefix=f"{run.info.run_id}-", dir=PREPROC_DIR
+    ) as work_dir:
         logger.info("Starting Feature Extraction...")
 
-        feature_extraction = FeatureExtraction()
-        df = feature_extraction.extract_features()
-        if df is None:
-            logger.error("Feature extraction returned None.")
-            return
-
-        mlflow.log_param("n_rows", len(df))
-        mlflow.log_metric("flare_signal_rate", df['flare_signal'].mean())
-        mlflow.log_metric("steroid_use_rate", df['any_steroid_use'].mean())
-
-        feature_path = "/tmp/features_v1.parquet"
-        df.to_parquet(feature_path, index=False)
-        mlflow.log_artifact(feature_path, "features")
-        logger.info("Features logged to MLflow.")
-
-        logger.info("Splitting data and saving preprocessing objects...")
-        X_train, X_test, y_train, y_test = feature_extraction.split_data(df)
-
-        preproc_dir = "/tmp/preproc"
-        for f in ["tfidf.joblib", "svd.joblib", "scaler.joblib"]:
-            mlflow.log_artifact(os.path.join(preproc_dir, f), "preprocessing")
+        feature_extraction = FeatureExtraction(preproc_dir=os.path.join(work_dir, "preprocessing"))
+        mlflow.log_param("incremental", incremental)
+        mlflow.log_param("streaming", streaming)
+        mlflow.log_param("preprocess_workers", feature_extraction.workers)
+        mlflow.log_param("preprocess_compact", feature_extraction.compact)
+        mlflow.log_param("text_out_of_core", feature_extraction.out_of_core)
+        mlflow.log_param("text_sparse", feature_extraction.sparse)
+        if streaming:
+            logger.info("Running the streaming pipeline...")
+            pipeline = StreamingPipeline(feature_extraction, ChunkStore(os.path.join(work_dir, "chunks")))
+            matrices = pipeline.run()
+            if matrices is None:
+                logger.error("Streaming pipeline returned None.")
+                return
+            X_train, X_test, y_train, y_test = matrices
+            n_rows = pipeline.stats["n_rows"]
+            mlflow.log_param("n_rows", n_rows)
+            mlflow.log_metric("flare_signal_rate", pipeline.stats["flare_signal"] / n_rows)
+            mlflow.log_metric("steroid_use_rate", pipeline.stats["any_steroid_use"] / n_rows)
+        else:
+            df = feature_extraction.extract_features(incremental=incremental)
+            if df is None:
+                logger.error("Feature extraction returned None.")
+                return
+
+            mlflow.log_param("n_rows", len(df))
+            mlflow.log_metric("flare_signal_rate", df['flare_signal'].mean())
+            mlflow.log_metric("steroid_use_rate", df['any_steroid_use'].mean())
+
+            feature_path = os.path.join(work_dir, "features_v1.parquet")
+            df.to_parquet(feature_path, index=False)
+            mlflow.log_artifact(feature_path, "features")
+            logger.info("Features logged to MLflow.")
+
+            logger.info("Splitting data and saving preprocessing objects...")
+            X_train, X_test, y_train, y_test = feature_extraction.split_data(df)
+        for name, stats in text_cache_stats().items():
+            mlflow.log_metric(f"{name}_cache_hit_rate", stats["hit_rate"])
+        mlflow.log_param("preproc_fingerprint", feature_extraction.preproc_fingerprint)
+        mlflow.log_param("preproc_cache_hit", feature_extraction.preproc_cache_hit)
+        mlflow.log_param("matrix_fingerprint", feature_extraction.matrix_fingerprint)
+
+        for f in feature_extraction.preprocessing_files:
+            mlflow.log_artifact(os.path.join(feature_extraction.preproc_dir, f), "preprocessing")
 
         logger.info("Training LightGBM model...")
         clf = LGBMClassifier(
@@ -84,7 +115,7 @@ def run_pipeline():
 
         logger.info(f"Model training complete. ROC-AUC = {auc:.4f}")
 
-        model_path = "/tmp/lgbm_model.pkl"
+        model_path = os.path.join(work_dir, "lgbm_model.pkl")
         joblib.dump(clf, model_path)
         mlflow.log_artifact(model_path, "model_files")
         mlflow.lightgbm.log_model(clf, artifact_path="model")#type:ignore
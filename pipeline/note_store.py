@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import zlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+NOTE_STORE_DIR = os.getenv("NOTE_STORE_DIR", os.path.join("data", "notes"))
+PATIENT_BUCKETS = int(os.getenv("NOTE_STORE_PATIENT_BUCKETS", "16"))
+NOTE_STORE_COMPRESSION = os.getenv("NOTE_STORE_COMPRESSION", "zstd")
+
+PARTITION_COLS = ["note_month", "patient_bucket"]
+
+# Columns of the "full" extraction query (pipeline.extract_data.FINAL_DATA_QUERY),
+# with fixed types so every part file of the raw store shares one schema. The
+# default "lean" query (LEAN_DATA_QUERY) returns a subset of them; the columns
+# it omits are stored as nulls. A column outside this schema is rejected.
+RAW_NOTE_SCHEMA = pa.schema(
+    [
+        ("noteId", pa.int64()),
+        ("provider", pa.int64()),
+        ("physician", pa.int64()),
+        ("referringPhysician", pa.float64()),
+        ("noteDate", pa.timestamp("us")),
+        ("patientId", pa.int64()),
+        ("physicianSignDate", pa.timestamp("us")),
+        ("complaints", pa.string()),
+        ("pastHistory", pa.string()),
+        ("assesment", pa.string()),
+        ("reviewofsystem", pa.string()),
+        ("currentmedication", pa.string()),
+        ("procedure", pa.string()),
+        ("biopsyNotes", pa.string()),
+        ("mohsNotes", pa.string()),
+        ("allergy", pa.string()),
+        ("examination", pa.string()),
+        ("patientSummary", pa.string()),
+        ("diagnoses", pa.string()),
+        ("PlaceOfService", pa.string()),
+        ("Rendering Provider", pa.string()),
+        ("Physician", pa.string()),
+        ("Referring Provider", pa.string()),
+        ("Billing Provider", pa.string()),
+    ]
+)
+
+
+def _fill_null_type(arrow_type):
+    """Use strings for columns whose type could not be inferred from all-null values."""
+    if pa.types.is_null(arrow_type):
+        return pa.string()
+    if pa.types.is_list(arrow_type) and pa.types.is_null(arrow_type.value_type):
+        return pa.list_(pa.string())
+    return arrow_type
+
+
+def patient_bucket(patient_id) -> int:
+    """Stable hash bucket of a patient ID."""
+    return zlib.crc32(str(patient_id).encode("utf-8")) % PATIENT_BUCKETS
+
+
+class NoteStore:
+    """Append-only local store of extracted notes.
+
+    Notes are written as compressed Parquet, hive-partitioned by note month
+    and patient-ID hash bucket. Every append adds new part files, so adding a
+    batch costs only the size of that batch, and reads only open the columns
+    and partitions they ask for. The store also keeps the extraction
+    high-water mark on (physicianSignDate, noteId).
+
+    ``schema`` fixes the column types of the store; pass None to infer them
+    from the first batch (as for derived feature frames) and keep them fixed
+    for every later batch.
+    """
+
+    def __init__(self, root: str = NOTE_STORE_DIR, schema: pa.Schema = RAW_NOTE_SCHEMA):
+        self.root = root
+        self.schema = schema
+        self.infer_schema = schema is None
+        self.watermark_path = os.path.join(root, "_watermark.json")
+        self.schema_path = os.path.join(root, "_schema.arrow")
+        os.makedirs(root, exist_ok=True)
+
+    def _load_or_infer_schema(self, df: pd.DataFrame) -> pa.Schema:
+        if os.path.exists(self.schema_path):
+            with open(self.schema_path, "rb") as f:
+                return pa.ipc.read_schema(pa.py_buffer(f.read()))
+        inferred = pa.Table.from_pandas(df, preserve_index=False).schema.remove_metadata()
+        schema = pa.schema([pa.field(f.name, _fill_null_type(f.type)) for f in inferred])
+        with open(self.schema_path, "wb") as f:
+            f.write(schema.serialize().to_pybytes())
+        return schema
+
+    def _has_parts(self):
+        return any(
+            not name.startswith(("_", ".")) for name in os.listdir(self.root)
+        )
+
+    def _to_table(self, df: pd.DataFrame) -> pa.Table:
+        df = df.loc[:, ~df.columns.duplicated(keep="first")]
+        if self.schema is None:
+            self.schema = self._load_or_infer_schema(df)
+        elif not self.infer_schema:
+            unknown = [col for col in df.columns if col not in self.schema.names]
+            if unknown:
+                raise ValueError(f"Columns not in the note store schema: {unknown}")
+        df = df.reindex(columns=self.schema.names)
+        for field in self.schema:
+            if pa.types.is_timestamp(field.type):
+                df[field.name] = pd.to_datetime(df[field.name], errors="coerce")
+            elif pa.types.is_string(field.type):
+                df[field.name] = df[field.name].astype(object).where(df[field.name].notna(), None)
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+
+        note_month = pd.to_datetime(df["noteDate"], errors="coerce").dt.strftime("%Y-%m")
+        buckets = df["patientId"].map(patient_bucket)
+        table = table.append_column("note_month", pa.array(note_month.fillna("unknown").tolist(), pa.string()))
+        return table.append_column("patient_bucket", pa.array(buckets.tolist(), pa.int32()))
+
+    def append(self, df: pd.DataFrame):
+        """Write ``df`` as new part files of the store."""
+        if df.empty:
+            return None
+        pq.write_to_dataset(
+            self._to_table(df),
+            root_path=self.root,
+            partition_cols=PARTITION_COLS,
+            compression=NOTE_STORE_COMPRESSION,
+            basename_template=f"part-{time.time_ns()}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        return self.root
+
+    def read(self, columns: list = None, filters=None, months: list = None, patient_ids: list = None) -> pd.DataFrame:
+        """Read stored notes, keeping the latest copy of each noteId.
+
+        Args:
+            columns: Columns to load; None loads all stored columns
+            filters: Extra pyarrow filters in DNF form, e.g. [("noteId", ">", 10)]
+            months: Note months ("YYYY-MM") to read; prunes partitions
+            patient_ids: Patients to read; prunes patient-bucket partitions
+
+        Returns:
+            DataFrame of the matching notes
+        """
+        if not self._has_parts():
+            return pd.DataFrame()
+
+        filters = list(filters or [])
+        if months is not None:
+            filters.append(("note_month", "in", list(months)))
+        if patient_ids is not None:
+            patient_ids = [int(patient_id) for patient_id in patient_ids]
+            filters.append(("patient_bucket", "in", sorted({patient_bucket(p) for p in patient_ids})))
+            filters.append(("patientId", "in", patient_ids))
+
+        read_columns = None
+        if columns is not None:
+            read_columns = list(dict.fromkeys(list(columns) + ["noteId"]))
+        table = pq.read_table(
+            self.root,
+            columns=read_columns,
+            filters=filters or None,
+            partitioning="hive",
+        )
+        df = table.to_pandas()
+        if "noteId" in df.columns:
+            df = df.drop_duplicates(subset="noteId", keep="last").reset_index(drop=True)
+        keep = list(columns) if columns is not None else [c for c in df.columns if c not in PARTITION_COLS]
+        return df[keep]
+
+    def patient_ids(self) -> set:
+        """IDs of the patients that already have notes in the store."""
+        df = self.read(columns=["patientId"])
+        if df.empty:
+            return set()
+        return set(df["patientId"].astype(str))
+
+    def reset(self):
+        """Remove every stored note and the watermark."""
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+        if self.infer_schema:
+            self.schema = None
+
+    def staging(self) -> "NoteStore":
+        """Empty store in a sibling directory, to be swapped in with ``replace_with``"""
+        root = os.path.abspath(self.root)
+        staging_root = tempfile.mkdtemp(prefix=f".{os.path.basename(root)}-", dir=os.path.dirname(root))
+        return NoteStore(staging_root, schema=None if self.infer_schema else self.schema)
+
+    def replace_with(self, staged: "NoteStore"):
+        """Make the complete ``staged`` store this store's contents, dropping the previous ones.
+
+        The directories are swapped by renames, so a failed rebuild never
+        leaves a partial store or removes the previous notes and watermark.
+        """
+        root = os.path.abspath(self.root)
+        previous = tempfile.mkdtemp(prefix=f".{os.path.basename(root)}-old-", dir=os.path.dirname(root))
+        os.rename(root, os.path.join(previous, "store"))
+        os.rename(staged.root, root)
+        shutil.rmtree(previous, ignore_errors=True)
+        if self.infer_schema:
+            self.schema = None
+
+    def discard(self):
+        """Remove a staging store that will not be swapped in."""
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def load_watermark(self):
+        """Return the stored high-water mark, or None before the first extraction."""
+        if not os.path.exists(self.watermark_path):
+            return None
+        with open(self.watermark_path) as f:
+            return json.load(f)
+
+    def save_watermark(self, df: pd.DataFrame):
+        """Advance the high-water mark to the latest signed note in ``df``."""
+        if df.empty:
+            return self.load_watermark()
+        df = df.loc[:, ~df.columns.duplicated(keep="first")]
+        signed = df.assign(
+            physicianSignDate=pd.to_datetime(df["physicianSignDate"], errors="coerce")
+        ).dropna(subset=["physicianSignDate"])
+        if signed.empty:
+            return self.load_watermark()
+        latest = signed.sort_values(["physicianSignDate", "noteId"]).iloc[-1]
+        watermark = {
+            "physicianSignDate": str(latest["physicianSignDate"]),
+            "noteId": int(latest["noteId"]),
+        }
+        current = self.load_watermark()
+        if current is not None and (
+            pd.Timestamp(current["physicianSignDate"]), current["noteId"]
+        ) >= (pd.Timestamp(watermark["physicianSignDate"]), watermark["noteId"]):
+            return current
+
+        tmp_path = self.watermark_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(watermark, f)
+        os.replace(tmp_path, self.watermark_path)
+        return watermark
@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+import sklearn
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+# Fitted preprocessors by training fingerprint, e.g. data/preproc_cache. Off
+# unless set: entries are never evicted, one per new training fingerprint.
+PREPROC_CACHE_DIR = os.getenv("PREPROC_CACHE_DIR", "")
+# Model input matrices as memory-mappable .npy files, e.g. data/matrices. Off
+# unless set: entries are never evicted, and cached matrices are read-only.
+MATRIX_CACHE_DIR = os.getenv("MATRIX_CACHE_DIR", "")
+
+
+def training_fingerprint(text_chunks, numeric_blocks, params: dict) -> str:
+    """Hash of the transformers' training inputs and hyperparameters
+
+    Args:
+        text_chunks: Iterable of chunks of training texts, in fit order
+        numeric_blocks: Iterable of training numeric arrays, in fit order
+        params: Hyperparameters and settings the fitted transformers depend on
+
+    Returns:
+        16 hex characters
+    """
+    digest = hashlib.sha256(
+        json.dumps(dict(params, sklearn=sklearn.__version__), sort_keys=True, default=str).encode("utf-8")
+    )
+    for texts in text_chunks:
+        for text in texts:
+            digest.update(text.encode("utf-8"))
+            digest.update(b"\0")
+    for block in numeric_blocks:
+        block = np.ascontiguousarray(block, dtype=np.float64)
+        digest.update(repr(block.shape).encode("utf-8"))
+        digest.update(block.tobytes())
+    return digest.hexdigest()[:16]
+
+
+class PreprocessorCache:
+    """Directories of fitted preprocessing artifacts, keyed by training fingerprint
+
+    An entry is written to a temporary directory and renamed into place, so
+    concurrent runs never see a partial entry; when two runs store the same
+    fingerprint, the first rename wins and the other copy is discarded.
+    """
+
+    def __init__(self, root: str = PREPROC_CACHE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, fingerprint: str) -> str:
+        return os.path.join(self.root, fingerprint)
+
+    def fetch(self, fingerprint: str, files: list, out_dir: str) -> bool:
+        """Copy the cached ``files`` of ``fingerprint`` to ``out_dir``; False on a miss"""
+        entry = self.path(fingerprint)
+        if not all(os.path.exists(os.path.join(entry, name)) for name in files):
+            return False
+        os.makedirs(out_dir, exist_ok=True)
+        for name in files:
+            shutil.copy(os.path.join(entry, name), os.path.join(out_dir, name))
+        return True
+
+    def put(self, fingerprint: str, files: list, src_dir: str):
+        """Store ``files`` of ``src_dir`` as the entry of ``fingerprint``"""
+        if os.path.isdir(self.path(fingerprint)):
+            return
+        staging = tempfile.mkdtemp(prefix=f".{fingerprint}-", dir=self.root)
+        try:
+            for name in files:
+                shutil.copy(os.path.join(src_dir, name), os.path.join(staging, name))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        _publish(staging, self.path(fingerprint))
+
+
+class MatrixCache:
+    """Model input matrices stored as .npy files, keyed by fingerprint
+
+    ``build`` hands out writable memory maps of the entry's files, so the
+    matrices are assembled straight on disk. ``load`` maps a complete entry
+    read-only: reruns, CV folds and hyperparameter trials on the same rows
+    share one on-disk copy, paged in by every process that uses it.
+    """
+
+    def __init__(self, root: str = MATRIX_CACHE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, fingerprint: str) -> str:
+        return os.path.join(self.root, fingerprint)
+
+    def load(self, fingerprint: str, names: list):
+        """Read-only memory maps of the ``names`` matrices of ``fingerprint``, or None on a miss"""
+        paths = [os.path.join(self.path(fingerprint), f"{name}.npy") for name in names]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        return [np.load(path, mmap_mode="r") for path in paths]
+
+    @contextmanager
+    def build(self, fingerprint: str, shapes: dict, dtype=np.float32):
+        """Writable memory maps of new ``{name: shape}`` matrices, stored as ``fingerprint`` on exit
+
+        The files are staged and renamed into place once the block completes;
+        an exception discards them.
+        """
+        staging = tempfile.mkdtemp(prefix=f".{fingerprint}-", dir=self.root)
+        try:
+            arrays = {
+                name: np.lib.format.open_memmap(os.path.join(staging, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+                for name, shape in shapes.items()
+            }
+            yield arrays
+            for array in arrays.values():
+                array.flush()
+            del arrays
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        _publish(staging, self.path(fingerprint))
+
+
+def _publish(staging: str, entry: str):
+    """Rename a complete staging directory into place"""
+    try:
+        os.rename(staging, entry)
+    except OSError:
+        # Another run stored the same fingerprint first.
+        shutil.rmtree(staging, ignore_errors=True)
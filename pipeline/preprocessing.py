@@ -3,19 +3,48 @@ import mlflow
 import asyncio
 import logging
 import joblib, os
+import shutil
+import tempfile
+import weakref
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-import nest_asyncio
+import scipy.sparse as sp
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from db.db import get_db
+from db.db import AsyncSessionLocal, async_engine, session_scope
 from typing_extensions import Tuple
 from sklearn.decomposition import TruncatedSVD
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import GroupShuffleSplit
 from sklearn.feature_extraction.text import TfidfVectorizer
-from pipeline.extract_data import fetch_final_data, get_patient_ids
-from utils.helper import clean_html, flag_any, mask_post_flare_terms
+from pipeline.extract_data import (
+    STREAM_CHUNK_SIZE,
+    fetch_final_data_sharded,
+    fetch_new_notes,
+    gather_final_data,
+    get_patient_ids,
+    stream_final_data,
+)
+from pipeline.note_store import NoteStore
+from pipeline.preproc_cache import (
+    MATRIX_CACHE_DIR,
+    PREPROC_CACHE_DIR,
+    MatrixCache,
+    PreprocessorCache,
+    training_fingerprint,
+)
+from utils.feature_spec import FEATURE_SPEC, batch_features
+from utils.feature_assembler import FeatureAssembler
+from utils.out_of_core import HashingTfidf, fit_out_of_core
+from utils.text_projector import TextProjector
+from utils.text_cache import (
+    cached_mask_post_flare_terms,
+    drain_text_cache_counts,
+    merge_text_cache_counts,
+    text_cache_stats,
+)
 import warnings
 
 warnings.filterwarnings("ignore")
@@ -36,247 +65,663 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Worker processes for cleaning and feature derivation; 1 runs in-process.
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "1"))
+PREPROCESS_CHUNK_SIZE = int(os.getenv("PREPROCESS_CHUNK_SIZE", "2000"))
+# Compact feature frames: Arrow strings, categoricals, int8 flags, no unused text.
+PREPROCESS_COMPACT = os.getenv("PREPROCESS_COMPACT", "0") == "1"
+# Out-of-core text transformers: hashed TF-IDF and a Gram-matrix SVD fitted
+# chunk by chunk, instead of TfidfVectorizer and TruncatedSVD on the whole text.
+TEXT_OUT_OF_CORE = os.getenv("TEXT_OUT_OF_CORE", "0") == "1"
+# Hash buckets of the out-of-core vectorizer, before min_df and max_features.
+HASHING_N_FEATURES = int(os.getenv("HASHING_N_FEATURES", str(2**20)))
+# Texts per chunk when fitting the out-of-core transformers.
+TEXT_FIT_CHUNK_SIZE = int(os.getenv("TEXT_FIT_CHUNK_SIZE", "20000"))
+# Sparse text features: LightGBM takes the TF-IDF matrix itself, no SVD.
+TEXT_SPARSE = os.getenv("TEXT_SPARSE", "0") == "1"
+
+MASKED_TEXT_COLS = FEATURE_SPEC.masked_columns
+# Cleaned text that only feeds the derived features and is never masked.
+FEATURE_ONLY_TEXT_COLS = [c for c in FEATURE_SPEC.text_columns if c not in MASKED_TEXT_COLS]
+CATEGORICAL_DTYPES = {name: pd.CategoricalDtype(values) for name, values in FEATURE_SPEC.categories.items()}
+INT_FLAG_COLS = [
+    name for features in FEATURE_SPEC.keyword_features.values() for name, _, _, as_int in features if as_int
+] + [name for name, _ in FEATURE_SPEC.derived]
+
+
+def compact_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Memory-compact layout of a feature frame; applying it twice is a no-op
+
+    Drops the cleaned text that only feeds derived features, stores the
+    masked text columns and the diagnosis codes as Arrow-backed strings,
+    the extracted categories as categoricals with fixed categories (so chunks
+    concatenate without falling back to object) and integer flags as int8.
+    """
+    df = df.drop(columns=FEATURE_ONLY_TEXT_COLS, errors="ignore")
+    for col in MASKED_TEXT_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("string[pyarrow]")
+    if "diagnosis_codes" in df.columns:
+        codes = df["diagnosis_codes"]
+        if codes.dtype == object:
+            codes = codes.map(lambda values: ",".join(values) if isinstance(values, (list, np.ndarray)) else values)
+        df["diagnosis_codes"] = codes.astype("string[pyarrow]")
+    for col, dtype in CATEGORICAL_DTYPES.items():
+        if col in df.columns:
+            df[col] = df[col].astype(dtype)
+    for col in INT_FLAG_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype(np.int8)
+    if "patient_age" in df.columns:
+        df["patient_age"] = df["patient_age"].astype(np.float32)
+    return df
+
+
+def stored_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Feature frame read back from the feature store, typed as ``featurize`` returns it
+
+    The Parquet round-trip gives missing extracted strings back as None and
+    findall lists as numpy arrays; they become NaN and lists again, so a
+    frame rebuilt from the store equals a full extraction of the same notes.
+    """
+    for name, _, _, kind in FEATURE_SPEC.extracts:
+        if name not in df.columns or df[name].dtype != object:
+            continue
+        if kind == "findall":
+            df[name] = df[name].map(lambda values: list(values) if isinstance(values, np.ndarray) else values)
+        else:
+            df[name] = df[name].where(df[name].notna(), np.nan)
+    return df
+
+
+TARGET_COL = "flare_label_next"
+# Same-visit outcome features that would leak the next-visit label.
+LEAK_COLS = [
+    "flare_label",
+    "flare_signal",
+    "flare_risk_score",
+    "flare_in_assessment",
+    "any_steroid_use",
+    "steroid_started",
+    "complaint_flare_kw",
+    "complaint_no_relief",
+]
+TFIDF_PARAMS = dict(ngram_range=(1, 2), max_features=5000, min_df=5, stop_words="english")
+SVD_PARAMS = dict(n_components=100, random_state=42)
+
+
+# Parent of the per-run preprocessing directories.
+PREPROC_DIR = os.getenv("PREPROC_DIR", os.path.join(tempfile.gettempdir(), "preproc"))
+PREPROCESSING_FILES = ["tfidf.joblib", "svd.joblib", "scaler.joblib", "text_projector.joblib"]
+# Sparse runs have no SVD; serving tells them apart by the missing svd.joblib.
+SPARSE_PREPROCESSING_FILES = ["tfidf.joblib", "scaler.joblib"]
+
+
+def save_preprocessors(tfidf, svd, scaler, projector: TextProjector, out_dir: str):
+    """Dump the fitted transformers and the fused text projector for serving; None entries are skipped"""
+    os.makedirs(out_dir, exist_ok=True)
+    for name, obj in zip(PREPROCESSING_FILES, [tfidf, svd, scaler, projector]):
+        if obj is not None:
+            joblib.dump(obj, os.path.join(out_dir, name))
+
+
+def load_preprocessors(out_dir: str):
+    """The (tfidf, svd, scaler, projector) written by ``save_preprocessors``, None where absent"""
+    return tuple(
+        joblib.load(os.path.join(out_dir, name)) if os.path.exists(os.path.join(out_dir, name)) else None
+        for name in PREPROCESSING_FILES
+    )
+
+
+def sparse_model_input(X_num: np.ndarray, X_tfidf) -> sp.csr_matrix:
+    """float32 CSR model input of sparse mode: scaled numeric columns, then the TF-IDF columns"""
+    return sp.hstack([sp.csr_matrix(X_num), X_tfidf], format="csr", dtype=np.float32)
+
+
+def preprocessor_params(out_of_core: bool, fit: str, sparse: bool = False) -> dict:
+    """Settings the fitted preprocessors depend on, besides their training data
+
+    ``fit`` names the fitting code path: split_data and the streaming
+    pipeline fit the same transformers up to rounding, and are cached apart.
+    """
+    params = dict(
+        tfidf=TFIDF_PARAMS,
+        svd=SVD_PARAMS,
+        numeric_features=FEATURE_SPEC.numeric_features,
+        out_of_core=out_of_core,
+        fit=fit,
+        sparse=sparse,
+    )
+    if out_of_core:
+        params["hashing_n_features"] = HASHING_N_FEATURES
+    return params
+
+
+def fit_text_transformers(text_chunks, out_of_core: bool = TEXT_OUT_OF_CORE, sparse: bool = TEXT_SPARSE):
+    """Fit the TF-IDF and SVD pair on the training text
+
+    ``text_chunks`` returns a fresh iterator over chunks of the training
+    text on every call. The default pair is a TfidfVectorizer and a
+    TruncatedSVD fitted on the whole text; ``out_of_core=True`` fits a
+    HashingTfidf and a GramSVD in two passes over the chunks, so memory is
+    bounded by the hash buckets and the (max_features, max_features) Gram
+    matrix instead of the corpus. ``sparse=True`` fits the TF-IDF only and
+    returns None for the SVD.
+    """
+    if out_of_core and sparse:
+        return HashingTfidf(n_features=HASHING_N_FEATURES, **TFIDF_PARAMS).fit(text_chunks()), None
+    if out_of_core:
+        return fit_out_of_core(text_chunks, TFIDF_PARAMS, SVD_PARAMS, HASHING_N_FEATURES)
+    tfidf = TfidfVectorizer(**TFIDF_PARAMS)
+    if sparse:
+        return tfidf.fit(text for texts in text_chunks() for text in texts), None
+    X_text_train = tfidf.fit_transform(text for texts in text_chunks() for text in texts)
+    svd = TruncatedSVD(**SVD_PARAMS)
+    svd.fit(X_text_train)
+    return tfidf, svd
+
+
+def add_next_flare_label(df: pd.DataFrame) -> pd.DataFrame:
+    """Label each note with the flare label of the patient's next note
+
+    Sorts by patientId and noteDate, drops each patient's last note and the
+    leak columns. Needs every note of a patient in ``df``.
+    """
+    df["flare_label"] = np.where(
+        (df["flare_signal"] == 1) & (df["any_steroid_use"] == 1), 1, 0
+    )
+    logger.info(f"target column flare_label created.")
+    df = df.sort_values(["patientId", "noteDate"]).reset_index(drop=True)
+    df[TARGET_COL] = df.groupby("patientId")["flare_label"].shift(-1)
+    df = df.dropna(subset=[TARGET_COL]).reset_index(drop=True)
+    df[TARGET_COL] = df[TARGET_COL].astype(int)
+    return df.drop(columns=[c for c in LEAK_COLS if c in df.columns])
+
+
+def patient_split(patient_ids) -> Tuple[np.ndarray, np.ndarray]:
+    """Train and test row indices of the 80/20 split grouped by patient
+
+    Depends only on the set of patients, so it can be computed on the unique
+    patient IDs as well as on every note's patient ID.
+    """
+    gss = GroupShuffleSplit(n_splits=1, test_size=0.20, random_state=42)
+    return next(gss.split(patient_ids, groups=patient_ids))
+
+
+def _clean_text_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    return batch_features.clean_text(FeatureExtraction.prepare_columns(chunk))
+
+
+def _build_features_chunk(chunk: pd.DataFrame, compact: bool = False) -> pd.DataFrame:
+    df = FeatureExtraction.build_features(chunk)
+    return compact_features(df) if compact else df
+
+
+def _mask_text_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame(
+        {col + "_clean": chunk[col].fillna("").apply(cached_mask_post_flare_terms) for col in chunk.columns},
+        index=chunk.index,
+    )
 
-class FeatureExtraction:
-    def __init__(self):
-        """Preprocessing and feature extraction pipeline"""
 
-    def extract_features(self):
-        """Extract features from final data"""
+def _model_text(df: pd.DataFrame) -> pd.Series:
+    """TF-IDF input: the masked model text columns joined by spaces"""
+    cols = [col + "_clean" for col in FEATURE_SPEC.model_text_columns]
+    text = df[cols[0]].fillna("")
+    for col in cols[1:]:
+        text = text + " " + df[col].fillna("")
+    return text.astype(str)
+
+
+def _run_worker_chunk(func, chunk: pd.DataFrame):
+    """Run ``func`` in a worker process, returning its text cache counters with the result"""
+    return func(chunk), drain_text_cache_counts()
+
+
+class FeatureExtraction:
+    def __init__(
+        self,
+        workers: int = PREPROCESS_WORKERS,
+        chunk_size: int = PREPROCESS_CHUNK_SIZE,
+        compact: bool = PREPROCESS_COMPACT,
+        out_of_core: bool = TEXT_OUT_OF_CORE,
+        preproc_dir: str = None,
+        sparse: bool = TEXT_SPARSE,
+    ):
+        """Preprocessing and feature extraction pipeline
+
+        ``workers`` > 1 runs text cleaning, feature derivation and masking on a
+        process pool over ``chunk_size``-row chunks; the result is identical
+        to the in-process run. ``compact=True`` keeps feature frames in the
+        ``compact_features`` layout, applied per chunk, and has ``split_data``
+        drop each text column once its masked copy exists; the model inputs
+        are unchanged. ``out_of_core=True`` fits the text transformers with
+        ``fit_text_transformers``' hashed, chunked mode. ``sparse=True``
+        makes the model input the scaled numeric columns followed by the
+        TF-IDF columns as a float32 CSR matrix, with no SVD.
+
+        The fitted preprocessors are written to ``preproc_dir``, by default a
+        fresh directory under PREPROC_DIR, so concurrent runs never share
+        one; a directory created here is removed by ``close()`` or once the
+        object is garbage collected. With PREPROC_CACHE_DIR set they are
+        reused from that cache when the training data and settings are
+        unchanged. Dense train/test matrices
+        are float32, assembled in place by ``model_matrices`` and, with
+        MATRIX_CACHE_DIR set, memory-mapped from .npy files.
+        """
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.compact = compact
+        self.out_of_core = out_of_core
+        self.sparse = sparse
+        self._remove_preproc_dir = None
+        if preproc_dir is None:
+            os.makedirs(PREPROC_DIR, exist_ok=True)
+            preproc_dir = tempfile.mkdtemp(prefix="run-", dir=PREPROC_DIR)
+            self._remove_preproc_dir = weakref.finalize(self, shutil.rmtree, preproc_dir, True)
+        self.preproc_dir = preproc_dir
+        self.preproc_cache = PreprocessorCache() if PREPROC_CACHE_DIR else None
+        self.preproc_fingerprint = None
+        self.preproc_cache_hit = False
+        self.matrix_cache = MatrixCache() if MATRIX_CACHE_DIR else None
+        self.matrix_fingerprint = None
+        self.note_store = NoteStore()
+        self.feature_store = NoteStore(os.path.join(data_directory, "features"), schema=None)
+
+    def close(self):
+        """Remove the preprocessing directory this object created, if any"""
+        if self._remove_preproc_dir is not None:
+            self._remove_preproc_dir()
+
+    def _map_chunks(self, func, df: pd.DataFrame) -> pd.DataFrame:
+        """Apply a row-wise ``func`` to ``df``, chunked over the process pool when enabled"""
+        if self.workers <= 1 or len(df) <= self.chunk_size:
+            return func(df)
+        chunks = [df.iloc[i : i + self.chunk_size] for i in range(0, len(df), self.chunk_size)]
+        logger.info(f"Processing {len(chunks)} chunks on {self.workers} workers")
+        frames = []
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for frame, cache_counts in executor.map(_run_worker_chunk, [func] * len(chunks), chunks):
+                frames.append(frame)
+                merge_text_cache_counts(cache_counts)
+        return pd.concat(frames)
+
+    def featurize(self, df: pd.DataFrame, compact: bool = None) -> pd.DataFrame:
+        """``build_features`` over the worker pool
+
+        ``compact`` defaults to the instance setting; frames written to the
+        feature store are built with ``compact=False`` so the store keeps one
+        schema whichever mode wrote it.
+        """
+        compact = self.compact if compact is None else compact
+        df = self._map_chunks(partial(_build_features_chunk, compact=compact), df)
+        logger.info(f"Text cache stats: {text_cache_stats()}")
+        return df
+
+    def clean_text(self, df: pd.DataFrame) -> pd.DataFrame:
+        """First half of ``featurize``: column preparation and text cleaning over the worker pool"""
+        return self._map_chunks(_clean_text_chunk, df)
+
+    def derive(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Second half of ``featurize``: feature derivation on cleaned text"""
+        df = batch_features.derive(df)
+        return compact_features(df) if self.compact else df
+
+    def model_text(self, df: pd.DataFrame) -> pd.Series:
+        """Masked TF-IDF input text of ``df``, masked over the worker pool"""
+        return _model_text(self._map_chunks(_mask_text_chunk, df[FEATURE_SPEC.model_text_columns]))
+
+    @property
+    def preprocessing_files(self) -> list:
+        """Artifacts the fitted preprocessors are saved as"""
+        return SPARSE_PREPROCESSING_FILES if self.sparse else PREPROCESSING_FILES
+
+    def fit_preprocessors(self, text_chunks, numeric_blocks, fit, fit_name: str = "split_data"):
+        """Fitted (tfidf, svd, scaler, projector), from the cache or from ``fit``
+
+        ``text_chunks`` returns a fresh iterator over the training text
+        chunks and ``numeric_blocks`` iterates the training numeric arrays,
+        both in fit order; together with ``preprocessor_params`` they make
+        the cache key. On a miss ``fit()`` returns the fitted (tfidf, svd,
+        scaler). Either way the artifacts end up in ``preproc_dir``; sparse
+        runs have no SVD or projector.
+        """
+        fingerprint = training_fingerprint(
+            text_chunks(), numeric_blocks, preprocessor_params(self.out_of_core, fit_name, self.sparse)
+        )
+        self.preproc_fingerprint = fingerprint
+        self.preproc_cache_hit = self.preproc_cache is not None and self.preproc_cache.fetch(
+            fingerprint, self.preprocessing_files, self.preproc_dir
+        )
+        if self.preproc_cache_hit:
+            logger.info(f"Preprocessors {fingerprint} loaded from {self.preproc_cache.root}")
+            return load_preprocessors(self.preproc_dir)
+
+        tfidf, svd, scaler = fit()
+        # Text features come from the fused projector serving uses, so a note
+        # gets exactly the values the model was trained on.
+        projector = TextProjector.from_fitted(tfidf, svd) if svd is not None else None
+        save_preprocessors(tfidf, svd, scaler, projector, self.preproc_dir)
+        if self.preproc_cache is not None:
+            self.preproc_cache.put(fingerprint, self.preprocessing_files, self.preproc_dir)
+        logger.info(f"Preprocessors {fingerprint} fitted, TF-IDF vocab size: {len(tfidf.idf_)}")
+        return tfidf, svd, scaler, projector
+
+    def model_matrices(self, assembler: FeatureAssembler, batches: dict) -> list:
+        """Dense float32 model input of ``{name: (raw numeric rows, model texts)}`` batches
+
+        Each matrix is allocated once and filled chunk by chunk by
+        ``assembler``. With the matrix cache it is allocated as a .npy file
+        and returned memory-mapped read-only; rows and preprocessors seen
+        before map the stored files instead of being rebuilt.
+        """
+        shapes = {name: (len(X_num), assembler.n_features) for name, (X_num, _) in batches.items()}
+
+        def fill(arrays: dict):
+            for name, (X_num, texts) in batches.items():
+                for start in range(0, len(X_num), TEXT_FIT_CHUNK_SIZE):
+                    stop = start + TEXT_FIT_CHUNK_SIZE
+                    assembler.transform(X_num[start:stop], texts[start:stop], out=arrays[name][start:stop])
+            return [arrays[name] for name in batches]
+
+        if self.matrix_cache is None:
+            return fill({name: np.empty(shape, dtype=np.float32) for name, shape in shapes.items()})
+
+        fingerprint = training_fingerprint(
+            (texts for _, texts in batches.values()),
+            (X_num for X_num, _ in batches.values()),
+            dict(preprocessors=self.preproc_fingerprint, matrices=list(batches)),
+        )
+        self.matrix_fingerprint = fingerprint
+        matrices = self.matrix_cache.load(fingerprint, list(batches))
+        if matrices is not None:
+            logger.info(f"Model matrices {fingerprint} mapped from {self.matrix_cache.root}")
+            return matrices
+        with self.matrix_cache.build(fingerprint, shapes) as arrays:
+            fill(arrays)
+        logger.info(f"Model matrices {fingerprint} written to {self.matrix_cache.path(fingerprint)}")
+        return self.matrix_cache.load(fingerprint, list(batches))
+
+    def cohort_patient_ids(self) -> list:
+        """Cohort patient IDs from the database"""
+        return self._run_async(self._load_patient_ids())
+
+    def extract_features(
+        self,
+        stream: bool = False,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        sharded: bool = False,
+        incremental: bool = False,
+    ):
+        """Extract features from final data
+
+        With ``stream=True`` the notes are fetched through a server-side cursor
+        and featurized chunk by chunk, so the raw HTML of the whole cohort is
+        never held in memory at once; the returned frame keeps only the text
+        columns ``split_data`` masks, so memory still grows with the note
+        count, by the derived features and that text. Raw notes go to the partitioned
+        note store and derived features to ``data/features``. By default the cohort is split into patient
+        shards that are queried concurrently on the async engine; with
+        ``sharded=True`` the shards run on a thread pool over the sync engine.
+        With ``incremental=True`` only notes signed since the last run are
+        fetched and featurized, and appended to the local note store.
+        """
+        if stream:
+            return self._extract_features_streaming(chunk_size)
+        if incremental:
+            return self._extract_features_incremental()
         try:
-            nest_asyncio.apply()
-            patients_ids = asyncio.run(get_patient_ids(next(get_db())))
+            patients_ids = self._run_async(self._load_patient_ids())
             logger.info(f"Total patients IDs: {len(patients_ids)}")
-            event_loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(event_loop)
-            df = event_loop.run_until_complete(
-                fetch_final_data(next(get_db()), patients_ids)
-            )
+            if sharded:
+                df = fetch_final_data_sharded(patients_ids)
+            else:
+                df = self._run_async(gather_final_data(patients_ids))
             logger.info(f"Total rows in extracted data: {df.shape[0]}")
+            if df.empty:
+                logger.error("Extraction returned no rows; the note store is left unchanged.")
+                return None
 
-            if df is not None:
-                df.to_csv(os.path.join(data_directory, "final_data.csv"), index=False)
-                logger.info(f"Final data saved to final_data.csv")
-
-            event_loop.close()
+            # Replace the stores only with a complete extraction.
+            self._replace_store(self.note_store, [df], watermark=True)
+            logger.info(f"Final data saved to the note store at {self.note_store.root}")
 
         except Exception as e:
             logger.error(f"An error occurred: {e}")
+            return None
 
         try:
             """Feature Engineering and preprocessing of the data and preparing for the model training"""
             logger.info(f"Preprocessing the data....")
             df.info()
-            df = df.drop(
-                columns=["biopsyNotes", "mohsNotes", "referringPhysician", "Physician"],
-                axis=1,
-            )
-            df.columns = df.columns.str.strip()
-            df = df.loc[:, ~df.columns.duplicated(keep="first")]
-            df.drop(
-                columns=[
-                    "Rendering Provider",
-                    "Referring Provider",
-                    "Billing Provider",
-                ],
-                inplace=True,
-            )
-            logger.info(f"columns after dropping the columns: {df.columns}")
-            df["noteDate"] = pd.to_datetime(df["noteDate"], errors="coerce")
+            # Featurized chunk by chunk: each chunk goes to the feature store
+            # as built, and only its compacted form is kept.
+            frames = []
+
+            def feature_chunks():
+                step = self.chunk_size * max(self.workers, 1)
+                for start in range(0, len(df), step):
+                    features = self.featurize(df.iloc[start : start + step], compact=False)
+                    frames.append(compact_features(features) if self.compact else features)
+                    yield features
+
+            self._replace_store(self.feature_store, feature_chunks())
+            del df
+            df = pd.concat(frames, ignore_index=True)
             df = df.sort_values(["patientId", "noteDate"]).reset_index(drop=True)
-            text_cols = [
-                "complaints",
-                "pastHistory",
-                "assesment",
-                "reviewofsystem",
-                "currentmedication",
-                "procedure",
-                "allergy",
-                "examination",
-                "patientSummary",
-                "diagnoses",
-            ]
-            df[text_cols] = df[text_cols].fillna("")
-            for col in text_cols:
-                df[col] = df[col].fillna("").apply(clean_html)
-
-            logger.info(f"text columns preprocessed: {df.columns}")
-
-            df["diagnosis_codes"] = df["diagnoses"].str.findall(r"[A-Z]\d{2}\.\d")
-            df["has_psoriasis"] = (
-                df["diagnoses"].str.contains("L40", case=False, na=False).astype(int)
-            )
-            df["psoriasis_type"] = df["diagnoses"].str.extract(
-                r"(Plaque|Arthropathic|Guttate|Pustular)", expand=False
-            )
-            flare_terms = [
-                "flare",
-                "worse",
-                "itch",
-                "red",
-                "scaling",
-                "burning",
-                "rash",
-                "lesion",
-            ]
-            df["complaint_flare_kw"] = (
-                df["complaints"]
-                .str.lower()
-                .apply(lambda t: int(any(k in t for k in flare_terms)))
-            )
-            df["complaint_no_relief"] = (
-                df["complaints"]
-                .str.contains("without relief|no improvement", case=False, na=False)
-                .astype(int)
-            )
-
-            df["flare_in_assessment"] = df["assesment"].apply(
-                lambda t: flag_any(t, ["flare", "worsen", "flare-up"])
-            )
-            df["trigger_mentioned"] = df["assesment"].apply(
-                lambda t: flag_any(t, ["stress", "infection", "weather", "medication"])
-            )
-            df["steroid_started"] = df["assesment"].apply(
-                lambda t: flag_any(t, ["triamcinolone", "steroid", "ointment", "cream"])
-            )
+            logger.info(f"Preprocessing completed.")
+            return df
+        except Exception as e:
+            logger.error(f"An error occurred in preprocessing: {e}")
+            return None
 
-            df["has_medications"] = ~df["currentmedication"].str.contains(
-                "no active", case=False, na=False
-            )
-            df["on_steroid_med"] = df["currentmedication"].str.contains(
-                "steroid|triamcinolone|clobetasol|hydrocortisone", case=False, na=False
-            )
-            df["on_biologic"] = df["currentmedication"].str.contains(
-                "adalimumab|secukinumab|ixekizumab|etanercept", case=False, na=False
-            )
+    @staticmethod
+    def _replace_store(store: NoteStore, frames, watermark: bool = False):
+        """Rebuild ``store`` from ``frames`` in a staging directory and swap it in
 
-            df["plaques_present"] = df["examination"].str.contains(
-                "plaque", case=False, na=False
-            )
-            df["silvery_scale"] = df["examination"].str.contains(
-                "silvery|scale", case=False, na=False
-            )
-            df["elbows_involved"] = df["examination"].str.contains(
-                "elbow", case=False, na=False
-            )
-            df["hyperpigmentation"] = df["examination"].str.contains(
-                "hyperpigment", case=False, na=False
-            )
+        With ``watermark=True`` the staged store's watermark is set from all
+        of its notes once every frame is written. The live store, its
+        watermark included, is only replaced when this completes.
+        """
+        staged = store.staging()
+        try:
+            for frame in frames:
+                staged.append(frame)
+            if watermark:
+                staged.save_watermark(staged.read(columns=["physicianSignDate", "noteId"]))
+        except BaseException:
+            staged.discard()
+            raise
+        store.replace_with(staged)
+
+    def extract_features_from_store(self, months: list = None, patient_ids: list = None):
+        """Build features from the local raw-note store instead of querying MySQL
+
+        Args:
+            months: Note months ("YYYY-MM") to load; None loads every month
+            patient_ids: Patients to load; None loads every patient
+
+        Returns:
+            Feature DataFrame sorted by patientId and noteDate, or None
+        """
+        try:
+            df = self.note_store.read(months=months, patient_ids=patient_ids)
+            logger.info(f"Rows read from the note store: {df.shape[0]}")
+            if df.empty:
+                return None
+            df = self.featurize(df)
+            return df.sort_values(["patientId", "noteDate"]).reset_index(drop=True)
+        except Exception as e:
+            logger.error(f"An error occurred building features from the store: {e}")
+            return None
 
-            df["itch_present"] = df["reviewofsystem"].str.contains(
-                "itch", case=False, na=False
-            )
-            df["dry_skin"] = df["reviewofsystem"].str.contains(
-                "dry skin", case=False, na=False
-            )
-            df["fever_absent"] = df["reviewofsystem"].str.contains(
-                "no fever", case=False, na=False
-            )
+    @staticmethod
+    def _run_async(coro):
+        """Run an extraction coroutine, releasing the async connections bound to its event loop"""
 
-            df["smoker"] = df["pastHistory"].str.contains(
-                "smoker", case=False, na=False
-            )
-            df["alcohol_use"] = df["pastHistory"].str.contains(
-                "alcohol.*yes", case=False, na=False
-            )
-            df["family_melanoma"] = df["pastHistory"].str.contains(
-                "melanoma.*yes", case=False, na=False
-            )
+        async def runner():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
 
-            df["patient_age"] = (
-                df["patientSummary"]
-                .str.extract(r"(\d{1,2})\s*year", expand=False)
-                .astype(float)
-            )
-            df["patient_gender"] = df["patientSummary"].str.extract(
-                r"\b(Female|Male)\b", expand=False
-            )
-            df["follow_up_visit"] = df["patientSummary"].str.contains(
-                "follow up", case=False, na=False
-            )
+        return asyncio.run(runner())
 
-            df["has_allergy"] = ~df["allergy"].str.contains(
-                "no known", case=False, na=False
-            )
+    async def _load_patient_ids(self, use_cache: bool = True):
+        """Fetch the cohort patient IDs on an async session"""
+        async with AsyncSessionLocal() as db:
+            return await get_patient_ids(db, use_cache=use_cache)
 
-            df["flare_signal"] = (
-                df["complaint_flare_kw"]
-                | df["flare_in_assessment"]
-                | df["itch_present"]
-            ).astype(int)
+    def _extract_features_streaming(self, chunk_size: int):
+        """Fetch and featurize the final data one chunk at a time"""
+        try:
+            patients_ids = self._run_async(self._load_patient_ids())
+            logger.info(f"Total patients IDs: {len(patients_ids)}")
 
-            df["any_steroid_use"] = (
-                df["steroid_started"] | df["on_steroid_med"]
-            ).astype(int)
+            # Chunks go to staging stores, swapped in once the stream is complete.
+            note_store, feature_store = self.note_store.staging(), self.feature_store.staging()
+            frames = []
+            n_rows = 0
+            try:
+                with session_scope() as db:
+                    for i, chunk in enumerate(
+                        stream_final_data(db, patients_ids, chunk_size)
+                    ):
+                        note_store.append(chunk)
+                        n_rows += len(chunk)
+                        features = self.featurize(chunk, compact=False)
+                        feature_store.append(features)
+                        # Cleaned text that only fed the derived features is not kept.
+                        if self.compact:
+                            frames.append(compact_features(features))
+                        else:
+                            frames.append(features.drop(columns=FEATURE_ONLY_TEXT_COLS, errors="ignore"))
+                        logger.info(f"Chunk {i + 1} featurized, {n_rows} rows so far")
+
+                logger.info(f"Total rows in extracted data: {n_rows}")
+                if not frames:
+                    logger.error("Streaming extraction returned no rows; the note store is left unchanged.")
+                    note_store.discard()
+                    feature_store.discard()
+                    return None
+                # The stream is not ordered by sign date: advance the watermark
+                # once, over every stored note.
+                note_store.save_watermark(note_store.read(columns=["physicianSignDate", "noteId"]))
+            except BaseException:
+                note_store.discard()
+                feature_store.discard()
+                raise
+            self.note_store.replace_with(note_store)
+            self.feature_store.replace_with(feature_store)
+
+            df = pd.concat(frames, ignore_index=True)
+            df = df.sort_values(["patientId", "noteDate"]).reset_index(drop=True)
+            logger.info(f"Preprocessing completed.")
+            return df
+        except Exception as e:
+            logger.error(f"An error occurred in streaming preprocessing: {e}")
+            return None
 
-            df["flare_risk_score"] = (
-                df["flare_signal"] * 2 + df["any_steroid_use"] + df["trigger_mentioned"]
+    def _extract_features_incremental(self):
+        """Fetch and featurize only the notes signed after the stored watermark"""
+        try:
+            note_store = self.note_store
+            feature_store = self.feature_store
+            # The cached cohort would hide patients added since it was written.
+            patients_ids = self._run_async(self._load_patient_ids(use_cache=False))
+            logger.info(f"Total patients IDs: {len(patients_ids)}")
+            watermark = note_store.load_watermark()
+            logger.info(f"Extracting notes signed after {watermark}")
+            delta = self._run_async(
+                fetch_new_notes(patients_ids, watermark, note_store.patient_ids())
             )
-            logger.info(f"Preprocessing completed.")
+            logger.info(f"New rows in extracted data: {delta.shape[0]}")
+
+            if not delta.empty:
+                note_store.append(delta)
+                feature_store.append(self.featurize(delta, compact=False))
+                # Advance the watermark last so a failed run is simply retried.
+                note_store.save_watermark(delta)
+
+            df = feature_store.read()
+            if df.empty:
+                logger.error("Note store is empty.")
+                return None
+            df = stored_features(df)
+            if self.compact:
+                df = compact_features(df)
+            df = df.sort_values(["patientId", "noteDate"]).reset_index(drop=True)
+            logger.info(f"Preprocessing completed, {df.shape[0]} rows in store.")
             return df
         except Exception as e:
-            logger.error(f"An error occurred in preprocessing: {e}")
+            logger.error(f"An error occurred in incremental preprocessing: {e}")
             return None
 
+    @staticmethod
+    def build_features(df: pd.DataFrame) -> pd.DataFrame:
+        """Clean the text columns and derive the features of utils.feature_spec.
+
+        Every step is row-wise, so this can run on the whole extraction or on
+        independent chunks of it.
+        """
+        df = FeatureExtraction.prepare_columns(df)
+        df = batch_features.transform(df)
+        logger.info(f"text columns preprocessed: {df.columns}")
+        return df
+
+    @staticmethod
+    def prepare_columns(df: pd.DataFrame) -> pd.DataFrame:
+        """Drop the extraction columns the features never use and parse noteDate"""
+        # Only present when the notes come from the "full" extraction query.
+        df = df.drop(
+            columns=["biopsyNotes", "mohsNotes", "referringPhysician", "Physician"],
+            axis=1,
+            errors="ignore",
+        )
+        df.columns = df.columns.str.strip()
+        df = df.loc[:, ~df.columns.duplicated(keep="first")]
+        df.drop(
+            columns=[
+                "Rendering Provider",
+                "Referring Provider",
+                "Billing Provider",
+            ],
+            inplace=True,
+            errors="ignore",
+        )
+        logger.info(f"columns after dropping the columns: {df.columns}")
+        df["noteDate"] = pd.to_datetime(df["noteDate"], errors="coerce")
+        return df
+
     def split_data(self, df: pd.DataFrame):
-        """Split data into train and test sets"""
+        """Split data into train and test sets
+
+        Dense X_train and X_test are writable float32 arrays, or read-only
+        float32 memory maps of the .npy files when MATRIX_CACHE_DIR is set;
+        copy them before modifying them in place. Sparse mode returns
+        float32 CSR matrices.
+        """
         logger.info(f"Ready for splitting and finalizing data preparation.......")
 
-        df["flare_label"] = np.where(
-            (df["flare_signal"] == 1) & (df["any_steroid_use"] == 1), 1, 0
-        )
-        logger.info(f"target column flare_label created.")
-        df = df.sort_values(["patientId", "noteDate"]).reset_index(drop=True)
-        df["flare_label_next"] = df.groupby("patientId")["flare_label"].shift(-1)
-        df = df.dropna(subset=["flare_label_next"]).reset_index(drop=True)
-        df["flare_label_next"] = df["flare_label_next"].astype(int)
-        target_col = "flare_label_next"
-        leak_cols = [
-            "flare_label",
-            "flare_signal",
-            "flare_risk_score",
-            "flare_in_assessment",
-            "any_steroid_use",
-            "steroid_started",
-            "complaint_flare_kw",
-            "complaint_no_relief",
-        ]
-
-        for c in leak_cols:
-            if c in df.columns:
-                df.pop(c)
-
-        [c for c in leak_cols if c in df.columns]
-        for col in [
-            "assesment",
-            "complaints",
-            "examination",
-            "patientSummary",
-            "currentmedication",
-        ]:
-            df[col + "_clean"] = df[col].fillna("").apply(mask_post_flare_terms)
-
-        safe_numeric_cols = [
-            "patient_age",
-            "has_psoriasis",
-            "on_steroid_med",
-            "on_biologic",
-            "itch_present",
-            "dry_skin",
-            "plaques_present",
-            "silvery_scale",
-            "elbows_involved",
-            "hyperpigmentation",
-            "smoker",
-            "alcohol_use",
-            "family_melanoma",
-        ]
+        df = add_next_flare_label(df)
+        target_col = TARGET_COL
+        # Only the masked model text is used from here on; compact mode masks
+        # just those columns and drops the unmasked text.
+        mask_cols = FEATURE_SPEC.model_text_columns if self.compact else MASKED_TEXT_COLS
+        masked = self._map_chunks(_mask_text_chunk, df[mask_cols])
+        for col in mask_cols:
+            df[col + "_clean"] = masked[col + "_clean"]
+        del masked
+        if self.compact:
+            df = df.drop(columns=MASKED_TEXT_COLS)
+        logger.info(f"Text cache stats: {text_cache_stats()}")
+
+        safe_numeric_cols = FEATURE_SPEC.numeric_features
 
         safe_numeric_cols = [c for c in safe_numeric_cols if c in df.columns]
-        text_inputs = ["assesment_clean", "complaints_clean", "examination_clean"]
+        text_inputs = [col + "_clean" for col in FEATURE_SPEC.model_text_columns]
         text_inputs = [c for c in text_inputs if c in df.columns]
-        gss = GroupShuffleSplit(n_splits=1, test_size=0.20, random_state=42)
-        train_idx, test_idx = next(gss.split(df, groups=df["patientId"]))
+        train_idx, test_idx = patient_split(df["patientId"])
         train_df = df.iloc[train_idx].reset_index(drop=True)
         test_df = df.iloc[test_idx].reset_index(drop=True)
         print(
@@ -291,55 +736,38 @@ class FeatureExtraction:
             "Test pos rate:",
             test_df[target_col].mean(),
         )
-        train_text = (
-            train_df["assesment_clean"].fillna("")
-            + " "
-            + train_df["complaints_clean"].fillna("")
-            + " "
-            + train_df["examination_clean"].fillna("")
-        ).astype(str)
-
-        tfidf = TfidfVectorizer(
-            ngram_range=(1, 2), max_features=5000, min_df=5, stop_words="english"
+        train_text = _model_text(train_df)
+        test_text = _model_text(test_df)
+        del df
+        if self.compact:
+            # The frames only feed the numeric inputs from here on.
+            keep_cols = safe_numeric_cols + [target_col]
+            train_df, test_df = train_df[keep_cols], test_df[keep_cols]
+
+        X_num_train = train_df[safe_numeric_cols].fillna(0).astype(float).values
+        text_chunks = lambda: (
+            train_text.iloc[i : i + TEXT_FIT_CHUNK_SIZE] for i in range(0, len(train_text), TEXT_FIT_CHUNK_SIZE)
         )
-        X_text_train = tfidf.fit_transform(train_text)
 
-        svd = TruncatedSVD(n_components=100, random_state=42)
-        X_text_train_svd = svd.fit_transform(X_text_train)
-
-        os.makedirs("/tmp/preproc", exist_ok=True)
-        joblib.dump(tfidf, "/tmp/preproc/tfidf.joblib")
-        joblib.dump(svd, "/tmp/preproc/svd.joblib")
-        scaler = StandardScaler()
-        X_num_train = scaler.fit_transform(
-            train_df[safe_numeric_cols].fillna(0).astype(float).values
-        )
-        joblib.dump(scaler, "/tmp/preproc/scaler.joblib")
-
-        X_text_train = tfidf.transform(train_text)
-        X_text_train_svd = svd.transform(X_text_train)
-
-        test_text = (
-            test_df["assesment_clean"].fillna("")
-            + " "
-            + test_df["complaints_clean"].fillna("")
-            + " "
-            + test_df["examination_clean"].fillna("")
-        ).astype(str)
-        X_text_test = tfidf.transform(test_text)
-        X_text_test_svd = svd.transform(X_text_test)
-
-        X_num_test = scaler.transform(
-            test_df[safe_numeric_cols].fillna(0).astype(float).values
-        )
-        X_train = np.hstack([X_num_train, X_text_train_svd])
-        X_test = np.hstack([X_num_test, X_text_test_svd])
+        def fit():
+            tfidf, svd = fit_text_transformers(text_chunks, self.out_of_core, self.sparse)
+            return tfidf, svd, StandardScaler().fit(X_num_train)
+
+        tfidf, svd, scaler, projector = self.fit_preprocessors(text_chunks, [X_num_train], fit)
+        X_num_test = test_df[safe_numeric_cols].fillna(0).astype(float).values
+        if self.sparse:
+            X_train = sparse_model_input(scaler.transform(X_num_train), tfidf.transform(train_text))
+            X_test = sparse_model_input(scaler.transform(X_num_test), tfidf.transform(test_text))
+        else:
+            X_train, X_test = self.model_matrices(
+                FeatureAssembler(scaler, projector),
+                {"X_train": (X_num_train, train_text), "X_test": (X_num_test, test_text)},
+            )
         y_train = train_df[target_col].values
         y_test = test_df[target_col].values
         print(X_train.shape, X_test.shape, y_train.mean(), y_test.mean())
         logger.info(f"Data split into train and test sets.")
-        logger.info(f"TF-IDF vocab size: {len(tfidf.vocabulary_)}")
-        logger.info(f"SVD components: {X_text_train_svd.shape}")
+        logger.info(f"Text features: {X_train.shape[1] - X_num_train.shape[1]}")
         logger.info(f"train test split completed.....")
 
         return X_train, X_test, y_train, y_test
@@ -0,0 +1,378 @@
+import os
+import sys
+import queue
+import shutil
+import logging
+import weakref
+import tempfile
+import threading
+from functools import partial
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from db.db import session_scope
+from typing_extensions import Tuple
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import StandardScaler
+from sklearn.feature_extraction.text import TfidfVectorizer
+from pipeline.extract_data import STREAM_CHUNK_SIZE, shard_patient_ids, stream_final_data
+from pipeline.note_store import NOTE_STORE_COMPRESSION
+from pipeline.preprocessing import (
+    SVD_PARAMS,
+    TARGET_COL,
+    TFIDF_PARAMS,
+    FeatureExtraction,
+    add_next_flare_label,
+    fit_text_transformers,
+    patient_split,
+    sparse_model_input,
+)
+from utils.feature_assembler import FeatureAssembler
+from utils.feature_spec import FEATURE_SPEC
+
+logger = logging.getLogger(__name__)
+
+# Model-ready chunks written by the first pass and read by the later ones;
+# each ChunkStore without an explicit root gets its own directory under it.
+STREAM_CHUNK_DIR = os.getenv("STREAM_CHUNK_DIR", os.path.join("data", "stream_chunks"))
+# Chunks buffered between two stages; a full queue blocks the stage feeding it.
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "2"))
+# Patients per chunk. Chunks hold every note of their patients, which the
+# next-note label needs.
+STREAM_SHARD_SIZE = int(os.getenv("STREAM_SHARD_SIZE", "2000"))
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def bounded(items, maxsize: int = STREAM_QUEUE_SIZE, name: str = "stage"):
+    """Iterate ``items`` on a background thread, through a queue of at most ``maxsize`` items
+
+    The thread runs ahead of the consumer until the queue is full, so
+    chained stages overlap their I/O and CPU work while at most ``maxsize``
+    chunks wait between any two of them. An exception in ``items`` is raised
+    in the consumer; closing the consumer stops the thread and closes
+    ``items``.
+    """
+    handoff = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(_StageError(e))
+        finally:
+            if hasattr(items, "close"):
+                items.close()
+
+    thread = threading.Thread(target=produce, name=f"stream-{name}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = handoff.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def row_order(patient_ids: np.ndarray, note_dates: np.ndarray) -> np.ndarray:
+    """Permutation of stored rows into split_data's (patientId, noteDate) order
+
+    Shards follow the order of the cohort IDs, which need not match the
+    order of the patientId column, and rows within a chunk are already
+    sorted; the sort is stable so ties keep their stored order.
+    """
+    return np.lexsort((note_dates, patient_ids))
+
+
+class ChunkStore:
+    """Ordered Parquet part files of model-ready chunks, read back in write order.
+
+    Without ``root`` the chunks go to a fresh directory under
+    STREAM_CHUNK_DIR, removed with the store, so concurrent runs never
+    reset each other's chunks.
+    """
+
+    def __init__(self, root: str = None):
+        self._remove_root = None
+        if root is None:
+            os.makedirs(STREAM_CHUNK_DIR, exist_ok=True)
+            root = tempfile.mkdtemp(prefix="run-", dir=STREAM_CHUNK_DIR)
+            self._remove_root = weakref.finalize(self, shutil.rmtree, root, True)
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def close(self):
+        """Remove the chunk directory this store created, if any."""
+        if self._remove_root is not None:
+            self._remove_root()
+
+    def paths(self) -> list:
+        return sorted(
+            os.path.join(self.root, name) for name in os.listdir(self.root) if name.endswith(".parquet")
+        )
+
+    def reset(self):
+        """Remove every stored chunk."""
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+
+    def write(self, df: pd.DataFrame) -> str:
+        """Store ``df`` as the next chunk."""
+        path = os.path.join(self.root, f"chunk-{len(self.paths()):06d}.parquet")
+        df.to_parquet(path, index=False, compression=NOTE_STORE_COMPRESSION)
+        return path
+
+    def read(self, columns: list = None):
+        """Yield the stored chunks in write order."""
+        for path in self.paths():
+            yield pq.read_table(path, columns=columns).to_pandas()
+
+    def patient_ids(self) -> np.ndarray:
+        """Sorted unique patient IDs of every stored chunk."""
+        ids = [chunk["patientId"].to_numpy() for chunk in self.read(columns=["patientId"])]
+        return np.unique(np.concatenate(ids)) if ids else np.array([])
+
+
+class StreamingPipeline:
+    def __init__(
+        self,
+        feature_extraction: FeatureExtraction = None,
+        store: ChunkStore = None,
+        shard_size: int = STREAM_SHARD_SIZE,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        queue_size: int = STREAM_QUEUE_SIZE,
+    ):
+        """Extraction to feature matrices as chained generator stages
+
+        Fetch, clean, derive and label/mask run as generators connected by
+        ``bounded`` queues, so database I/O, cleaning and feature work
+        overlap. Only ``queue_size`` chunks of ``shard_size`` patients are in
+        flight per stage, and the cohort is never held in memory at once.
+        The first pass writes model-ready chunks (numeric features, masked
+        text, label) to a ``ChunkStore``. TF-IDF, SVD and the scaler are then
+        fitted on the stored training chunks, and a vectorize stage streams
+        the store into the train/test matrices. The result matches
+        ``FeatureExtraction.split_data`` on the same notes up to float
+        rounding: TF-IDF entries are summed in corpus order, and the float32
+        text features can round either way. With the feature extraction's
+        ``out_of_core`` mode the fit keeps one chunk in memory as well.
+        """
+        self.feature_extraction = feature_extraction or FeatureExtraction()
+        self.store = store or ChunkStore()
+        self.shard_size = shard_size
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.stats = {"n_rows": 0, "flare_signal": 0, "any_steroid_use": 0}
+
+    def _stage(self, items, name: str):
+        return bounded(items, self.queue_size, name)
+
+    def fetch(self, patient_ids: list):
+        """Stage 1: final data of one patient shard per chunk"""
+        with session_scope() as db:
+            for shard in shard_patient_ids(patient_ids, self.shard_size):
+                frames = list(stream_final_data(db, shard, self.chunk_size))
+                if frames:
+                    yield pd.concat(frames, ignore_index=True)
+
+    def clean(self, chunks):
+        """Stage 2: cleaned text columns"""
+        for chunk in chunks:
+            yield self.feature_extraction.clean_text(chunk)
+
+    def derive(self, chunks):
+        """Stage 3: derived feature columns"""
+        for chunk in chunks:
+            yield self.feature_extraction.derive(chunk)
+
+    def label_and_mask(self, chunks):
+        """Stage 4: next-note label and masked model text, without the note text"""
+        for chunk in chunks:
+            self.stats["n_rows"] += len(chunk)
+            self.stats["flare_signal"] += int(chunk["flare_signal"].sum())
+            self.stats["any_steroid_use"] += int(chunk["any_steroid_use"].sum())
+            chunk = add_next_flare_label(chunk)
+            model_chunk = chunk[["patientId", "noteDate"] + FEATURE_SPEC.numeric_features + [TARGET_COL]].copy()
+            model_chunk["model_text"] = self.feature_extraction.model_text(chunk).to_numpy()
+            yield model_chunk
+
+    def build_chunk_store(self, patient_ids: list) -> int:
+        """First pass: fetch -> clean -> derive -> label/mask, persisted chunk by chunk"""
+        self.store.reset()
+        self.stats = {"n_rows": 0, "flare_signal": 0, "any_steroid_use": 0}
+        stages = self._stage(self.fetch(patient_ids), "fetch")
+        stages = self._stage(self.clean(stages), "clean")
+        stages = self._stage(self.derive(stages), "derive")
+        stages = self._stage(self.label_and_mask(stages), "mask")
+        n_chunks = 0
+        for model_chunk in stages:
+            self.store.write(model_chunk)
+            n_chunks += 1
+            logger.info(f"Chunk {n_chunks} stored, {self.stats['n_rows']} rows so far")
+        return n_chunks
+
+    def _train_rows(self, columns: list, train_ids: set):
+        for chunk in self.store.read(columns=["patientId", "noteDate"] + columns):
+            yield chunk[chunk["patientId"].isin(train_ids)]
+
+    def fit_transformers(self, train_ids: set):
+        """Second pass: fit TF-IDF, SVD and the scaler on the stored training chunks
+
+        Returns the text transformer (the fused projector, or the TF-IDF in
+        sparse mode) and the scaler, reused from the
+        preprocessor cache when the stored training rows are unchanged. In
+        out-of-core mode the transformers are fitted chunk by chunk and only
+        one stored chunk is in memory at a time.
+        """
+        numeric_cols = FEATURE_SPEC.numeric_features
+        fit = self._fit_out_of_core if self.feature_extraction.out_of_core else self._fit_in_memory
+        tfidf, _, scaler, projector = self.feature_extraction.fit_preprocessors(
+            lambda: (chunk["model_text"] for chunk in self._train_rows(["model_text"], train_ids)),
+            (chunk[numeric_cols].fillna(0).astype(float).values for chunk in self._train_rows(numeric_cols, train_ids)),
+            partial(fit, train_ids),
+            fit_name="streaming",
+        )
+        return (tfidf if self.feature_extraction.sparse else projector), scaler
+
+    def _fit_out_of_core(self, train_ids: set):
+        """Hashed TF-IDF, Gram-matrix SVD and scaler fitted chunk by chunk"""
+        tfidf, svd = fit_text_transformers(
+            lambda: (chunk["model_text"] for chunk in self._train_rows(["model_text"], train_ids)),
+            out_of_core=True,
+            sparse=self.feature_extraction.sparse,
+        )
+        scaler = StandardScaler()
+        for chunk in self._train_rows(FEATURE_SPEC.numeric_features, train_ids):
+            scaler.partial_fit(chunk[FEATURE_SPEC.numeric_features].fillna(0).astype(float).values)
+        return tfidf, svd, scaler
+
+    def _fit_in_memory(self, train_ids: set):
+        """TfidfVectorizer, TruncatedSVD and scaler fitted as split_data fits them"""
+        keys = []
+
+        def train_text():
+            for chunk in self._train_rows(["model_text"], train_ids):
+                keys.append(chunk[["patientId", "noteDate"]])
+                yield from chunk["model_text"]
+
+        # The vocabulary and IDF do not depend on row order; SVD and the
+        # scaler are fitted on split_data's row order.
+        tfidf = TfidfVectorizer(**TFIDF_PARAMS)
+        X_text_train = tfidf.fit_transform(train_text())
+        keys = pd.concat(keys, ignore_index=True)
+        order = row_order(keys["patientId"].to_numpy(), keys["noteDate"].to_numpy())
+        svd = None
+        if not self.feature_extraction.sparse:
+            svd = TruncatedSVD(**SVD_PARAMS)
+            svd.fit(X_text_train[order])
+        del X_text_train
+
+        numeric = pd.concat(self._train_rows(FEATURE_SPEC.numeric_features, train_ids), ignore_index=True)
+        numeric = numeric.iloc[order].reset_index(drop=True)
+        scaler = StandardScaler()
+        scaler.fit(numeric[FEATURE_SPEC.numeric_features].fillna(0).astype(float).values)
+        return tfidf, svd, scaler
+
+    def vectorize(self, chunks, text_transformer, scaler, train_ids: set):
+        """Stage 5: model input rows of each stored chunk, with labels and train membership"""
+        assembler = None if self.feature_extraction.sparse else FeatureAssembler(scaler, text_transformer)
+        for chunk in chunks:
+            X_num = chunk[FEATURE_SPEC.numeric_features].fillna(0).astype(float).values
+            if assembler is None:
+                X_chunk = sparse_model_input(scaler.transform(X_num), text_transformer.transform(chunk["model_text"]))
+            else:
+                X_chunk = assembler.transform(X_num, chunk["model_text"])
+            yield chunk, X_chunk, chunk["patientId"].isin(train_ids).to_numpy()
+
+    def run(self, patient_ids: list = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Run every pass and return X_train, X_test, y_train, y_test, or None without notes"""
+        if patient_ids is None:
+            patient_ids = self.feature_extraction.cohort_patient_ids()
+        logger.info(f"Total patients IDs: {len(patient_ids)}")
+        n_chunks = self.build_chunk_store(patient_ids)
+        logger.info(f"{n_chunks} chunks, {self.stats['n_rows']} rows in {self.store.root}")
+        if not n_chunks:
+            logger.error("Streaming pipeline returned no rows.")
+            return None
+
+        stored_ids = self.store.patient_ids()
+        train_idx, _ = patient_split(stored_ids)
+        train_ids = set(stored_ids[train_idx])
+        text_transformer, scaler = self.fit_transformers(train_ids)
+
+        chunks = self._stage(self.store.read(), "read")
+        vectors = self._stage(self.vectorize(chunks, text_transformer, scaler, train_ids), "vectorize")
+        if self.feature_extraction.sparse:
+            X_train, X_test, y_train, y_test = self._stack(vectors)
+        else:
+            X_train, X_test, y_train, y_test = self._scatter(vectors, train_ids)
+        print(X_train.shape, X_test.shape, y_train.mean(), y_test.mean())
+        logger.info("Streaming pipeline completed.")
+        return X_train, X_test, y_train, y_test
+
+    def _stack(self, vectors):
+        """Sparse train/test matrices: stack the chunks, then order and split the rows"""
+        X, y, is_train, patients, note_dates = [], [], [], [], []
+        for chunk, X_chunk, train_chunk in vectors:
+            X.append(X_chunk)
+            y.append(chunk[TARGET_COL].to_numpy())
+            is_train.append(train_chunk)
+            patients.append(chunk["patientId"].to_numpy())
+            note_dates.append(chunk["noteDate"].to_numpy())
+        order = row_order(np.concatenate(patients), np.concatenate(note_dates))
+        X, y, is_train = sp.vstack(X, format="csr")[order], np.concatenate(y)[order], np.concatenate(is_train)[order]
+        return X[is_train], X[~is_train], y[is_train], y[~is_train]
+
+    def _scatter(self, vectors, train_ids: set):
+        """Dense train/test matrices allocated once, each chunk's rows written to their final rows
+
+        The final row of every stored note (split_data's order within its
+        split) is known from the stored keys, so no stacked, reordered or
+        split copy of the whole matrix is ever made.
+        """
+        keys = pd.concat(self.store.read(columns=["patientId", "noteDate"]), ignore_index=True)
+        order = row_order(keys["patientId"].to_numpy(), keys["noteDate"].to_numpy())
+        is_train = keys["patientId"].isin(train_ids).to_numpy()
+        ordered_train = is_train[order]
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.where(ordered_train, np.cumsum(ordered_train), np.cumsum(~ordered_train)) - 1
+        sizes = {True: int(is_train.sum()), False: int((~is_train).sum())}
+
+        X, y, start = None, None, 0
+        for chunk, X_chunk, train_chunk in vectors:
+            if X is None:
+                X = {split: np.empty((n, X_chunk.shape[1]), dtype=X_chunk.dtype) for split, n in sizes.items()}
+                y = {split: np.empty(n, dtype=chunk[TARGET_COL].dtype) for split, n in sizes.items()}
+            rows = position[start : start + len(chunk)]
+            y_chunk = chunk[TARGET_COL].to_numpy()
+            for split, mask in [(True, train_chunk), (False, ~train_chunk)]:
+                X[split][rows[mask]] = X_chunk[mask]
+                y[split][rows[mask]] = y_chunk[mask]
+            start += len(chunk)
+        return X[True], X[False], y[True], y[False]
@@ -6,14 +6,20 @@ It handles model loading, input/output transformations, and predictions.
 """
 
 import os
+import sys
 import json
 import joblib
-import numpy as np
 import pandas as pd
 import traceback
 from io import StringIO
 import logging
 
+# utils/ is copied next to this file in the image; locally it is the repo root.
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from sklearn.pipeline import make_pipeline
+from utils.feature_assembler import FeatureAssembler
+from utils.feature_spec import FEATURE_SPEC, row_features
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,6 +36,7 @@ class ModelHandler:
         self.tfidf = None
         self.svd = None
         self.scaler = None
+        self.projector = None
         self.feature_names = None
         self.loaded = False
         
@@ -41,17 +48,24 @@ class ModelHandler:
             # Load model artifacts
             self.model = joblib.load(os.path.join(MODEL_PATH, 'lgbm_model.pkl'))
             self.tfidf = joblib.load(os.path.join(MODEL_PATH, 'tfidf.joblib'))
-            self.svd = joblib.load(os.path.join(MODEL_PATH, 'svd.joblib'))
+            # Sparse TF-IDF models are packaged without an SVD
+            svd_path = os.path.join(MODEL_PATH, 'svd.joblib')
+            if os.path.exists(svd_path):
+                self.svd = joblib.load(svd_path)
             self.scaler = joblib.load(os.path.join(MODEL_PATH, 'scaler.joblib'))
+
+            # Fused TF-IDF -> SVD projection the model was trained with; older
+            # packages without it keep the separate TF-IDF and SVD steps
+            projector_path = os.path.join(MODEL_PATH, 'text_projector.joblib')
+            if os.path.exists(projector_path):
+                self.projector = joblib.load(projector_path)
             
             # Define feature names
-            self.numeric_features = [
-                "patient_age", "has_psoriasis", "on_steroid_med", "on_biologic",
-                "itch_present", "dry_skin", "plaques_present", "silvery_scale",
-                "elbows_involved", "hyperpigmentation", "smoker", "alcohol_use",
-                "family_melanoma"
-            ]
-            self.svd_features = [f"svd_{i}" for i in range(self.svd.n_components)]
+            self.numeric_features = FEATURE_SPEC.numeric_features
+            if self.svd is None:
+                self.svd_features = [f"tfidf_{term}" for term in self.tfidf.get_feature_names_out()]
+            else:
+                self.svd_features = [f"svd_{i}" for i in range(self.svd.n_components)]
             self.feature_names = self.numeric_features + self.svd_features
             
             self.loaded = True
@@ -110,96 +124,37 @@ def input_fn(request_body, content_type='application/json'):
         raise ValueError(f"Unsupported content type: {content_type}")
 
 
-def preprocess_single(raw_note, tfidf, svd, scaler):
+def preprocess_single(raw_note, tfidf, svd, scaler, projector=None):
     """
     Preprocess a single patient note for prediction.
     
     Args:
         raw_note: Dictionary containing patient note data
         tfidf: Fitted TF-IDF vectorizer
-        svd: Fitted SVD transformer
+        svd: Fitted SVD transformer, None for sparse TF-IDF models
         scaler: Fitted standard scaler
+        projector: Optional TextProjector replacing the TF-IDF and SVD steps
         
     Returns:
-        Preprocessed feature array
+        Preprocessed float32 feature array, assembled as in training
     """
     try:
-        df = pd.DataFrame([raw_note]).copy()
-        
-        # Text columns
-        text_cols = ['complaints', 'pastHistory', 'assesment', 'reviewofsystem',
-                     'currentmedication', 'procedure', 'allergy', 'examination',
-                     'patientSummary', 'diagnoses']
-        
-        for col in text_cols:
-            if col not in df.columns:
-                df[col] = ""
-            df[col] = df[col].fillna("")
-        
-        # Feature engineering (same as training)
-        df['has_psoriasis'] = df.get('diagnoses', pd.Series([""])).str.contains('L40', case=False, na=False).astype(int)
-        
-        flare_terms = ['flare', 'worse', 'itch', 'red', 'scaling', 'burning', 'rash', 'lesion']
-        
-        # Medication features
-        df['on_steroid_med'] = df.get('currentmedication', pd.Series([""])).str.contains(
-            "steroid|triamcinolone|clobetasol|hydrocortisone", case=False, na=False
-        ).astype(int)
-        
-        df['on_biologic'] = df.get('currentmedication', pd.Series([""])).str.contains(
-            "adalimumab|secukinumab|ixekizumab|etanercept", case=False, na=False
-        ).astype(int)
-        
-        # Examination features
-        df['plaques_present'] = df.get('examination', pd.Series([""])).str.contains("plaque", case=False, na=False).astype(int)
-        df['silvery_scale'] = df.get('examination', pd.Series([""])).str.contains("silvery|scale", case=False, na=False).astype(int)
-        df['elbows_involved'] = df.get('examination', pd.Series([""])).str.contains("elbow", case=False, na=False).astype(int)
-        df['hyperpigmentation'] = df.get('examination', pd.Series([""])).str.contains("hyperpigment", case=False, na=False).astype(int)
-        
-        # Review of system features
-        df['itch_present'] = df.get('reviewofsystem', pd.Series([""])).str.contains("itch", case=False, na=False).astype(int)
-        df['dry_skin'] = df.get('reviewofsystem', pd.Series([""])).str.contains("dry skin", case=False, na=False).astype(int)
-        
-        # Past history features
-        df['smoker'] = df.get('pastHistory', pd.Series([""])).str.contains("smoker", case=False, na=False).astype(int)
-        df['alcohol_use'] = df.get('pastHistory', pd.Series([""])).str.contains("alcohol.*yes", case=False, na=False).astype(int)
-        df['family_melanoma'] = df.get('pastHistory', pd.Series([""])).str.contains("melanoma.*yes", case=False, na=False).astype(int)
-        
-        # Patient age extraction
-        age_match = df.get('patientSummary', pd.Series([""])).str.extract(r'(\d{1,2})\s*year', expand=False)
-        df['patient_age'] = pd.to_numeric(age_match, errors='coerce').fillna(0).astype(float)
-        
-        # Combine text features
-        text_combined = (
-            df.get('assesment', "").fillna('') + ' ' +
-            df.get('complaints', "").fillna('') + ' ' +
-            df.get('examination', "").fillna('')
-        ).astype(str)
-        
-        # TF-IDF and SVD transformation
-        X_text_tfidf = tfidf.transform(text_combined)
-        X_text_svd = svd.transform(X_text_tfidf)
-        
-        # Numeric features
-        numeric_cols = [
-            "patient_age", "has_psoriasis", "on_steroid_med", "on_biologic",
-            "itch_present", "dry_skin", "plaques_present", "silvery_scale",
-            "elbows_involved", "hyperpigmentation", "smoker", "alcohol_use",
-            "family_melanoma"
-        ]
-        
-        for col in numeric_cols:
-            if col not in df.columns:
-                df[col] = 0
-        
-        X_num = df[numeric_cols].fillna(0).astype(float).values
-        X_num_scaled = scaler.transform(X_num)
-        
-        # Combine features
-        X_final = np.hstack([X_num_scaled, X_text_svd])
-        
+        # Feature engineering (same spec as training)
+        features = row_features.transform(raw_note)
+
+        # Text features of the masked text
+        if projector is not None:
+            assembler = FeatureAssembler(scaler, projector)
+        elif svd is None:
+            assembler = FeatureAssembler(scaler, tfidf, n_text=len(tfidf.idf_))
+        else:
+            assembler = FeatureAssembler(scaler, make_pipeline(tfidf, svd), n_text=svd.n_components)
+
+        # Scaled numeric and text features written into one row
+        X_final = assembler.transform(row_features.numeric_vector(features), [row_features.model_text(features)])
+
         return X_final
-        
+
     except Exception as e:
         logger.error(f"Error in preprocessing: {str(e)}")
         logger.error(traceback.format_exc())
@@ -228,7 +183,8 @@ def predict_fn(input_data, model_handler):
             
             for note in notes:
                 X = preprocess_single(note, model_handler.tfidf, 
-                                    model_handler.svd, model_handler.scaler)
+                                    model_handler.svd, model_handler.scaler,
+                                    model_handler.projector)
                 proba = float(model_handler.model.predict_proba(X)[:, 1][0])
                 label = int(proba >= 0.5)
                 
@@ -253,7 +209,8 @@ def predict_fn(input_data, model_handler):
         elif isinstance(input_data, dict):
             # Single prediction
             X = preprocess_single(input_data, model_handler.tfidf,
-                                model_handler.svd, model_handler.scaler)
+                                model_handler.svd, model_handler.scaler,
+                                model_handler.projector)
             proba = float(model_handler.model.predict_proba(X)[:, 1][0])
             label = int(proba >= 0.5)
             
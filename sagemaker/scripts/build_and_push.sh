@@ -71,9 +71,13 @@ fi
 echo -e "\n${YELLOW}Step 3/5: Building Docker image...${NC}"
 cd "$(dirname "$0")/../docker"
 
+# The handler shares the feature code of the repo's utils package
+rm -rf utils && mkdir utils && cp ../../utils/*.py utils/
+
 # Build for linux/amd64 platform and disable buildx features that create OCI manifests
 # SageMaker requires Docker v2 manifest format, not OCI image index
 DOCKER_BUILDKIT=0 docker build --platform linux/amd64 -t ${ECR_REPOSITORY}:${IMAGE_TAG} -f Dockerfile .
+rm -rf utils
 echo -e "${GREEN}✓ Image built successfully${NC}"
 
 # Tag image for ECR
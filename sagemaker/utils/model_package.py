@@ -85,7 +85,7 @@ def package_model_from_mlflow(
             raise FileNotFoundError(f"Model file not found: {model_src}")
         
         # Preprocessing artifacts
-        preprocessing_files = ["tfidf.joblib", "svd.joblib", "scaler.joblib"]
+        preprocessing_files = ["tfidf.joblib", "svd.joblib", "scaler.joblib", "text_projector.joblib"]
         for filename in preprocessing_files:
             src = os.path.join(artifacts_dir, "preprocessing", filename)
             if os.path.exists(src):
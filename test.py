@@ -1,5 +1,5 @@
 import asyncio
-from db.db import get_db
+from db.db import session_scope
 from pipeline.get_patient import fetch_final_data
 from contextlib import closing
 from app.model_service import ModelService
@@ -7,8 +7,8 @@ from app.model_service import ModelService
 model_service = ModelService() 
 
 def predict_patient(patient_id: str):
-    db = next(get_db())
-    notes_df = fetch_final_data(db, patient_id)
+    with session_scope() as db:
+        notes_df = fetch_final_data(db, patient_id)
 
     print(f"Fetched {len(notes_df)} notes for patient {patient_id}")
 
@@ -0,0 +1,28 @@
+"""
+clean_html must give the same text as the BeautifulSoup reference.
+
+Runs the parity corpus of benchmarks/bench_clean_html.py: its hand-written
+edge cases and the text columns of a small batch of synthetic notes.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.bench_clean_html import PARITY_CORPUS, synthetic_notes
+from utils.helper import clean_html, clean_html_bs4, strip_html
+
+
+def test_fast_path_matches_beautifulsoup_on_edge_cases():
+    for sample in PARITY_CORPUS:
+        assert clean_html(sample) == clean_html_bs4(sample), sample
+
+
+def test_fast_path_matches_beautifulsoup_on_synthetic_notes():
+    for sample in synthetic_notes(50):
+        assert clean_html(sample) == clean_html_bs4(sample), sample
+
+
+def test_malformed_tags_fall_back():
+    for sample in ["<p<b>bold</b>", "<a<script>x</script>", "<p<!-- comment -->text>"]:
+        assert strip_html(sample) is None, sample
@@ -0,0 +1,21 @@
+"""
+The batch (training) and row (serving) backends of utils.feature_spec must
+agree on every feature, the numeric model input and the masked model text.
+
+Runs the parity check of benchmarks/bench_feature_backends.py on a small
+batch of synthetic notes; mismatches are printed by the check.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.bench_feature_backends import check_parity, synthetic_notes
+from utils.feature_spec import BatchFeatures, RowFeatures
+from utils.helper import clean_html, mask_post_flare_terms
+
+
+def test_batch_and_row_backends_agree():
+    batch = BatchFeatures(clean=clean_html)
+    row = RowFeatures(clean=clean_html, mask=mask_post_flare_terms)
+    assert check_parity(synthetic_notes(100), batch, row) == 0
@@ -0,0 +1,22 @@
+"""
+mask_post_flare_terms must match the original sequential re.sub masking.
+
+Uses the reference implementation and samples of benchmarks/bench_mask.py:
+edge cases, random token soups and masked columns of synthetic notes.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.bench_mask import EDGE_CASES, mask_post_flare_terms_reference, synthetic_texts, token_soups
+from utils.helper import mask_post_flare_terms
+
+
+SAMPLES = EDGE_CASES + token_soups(2000) + synthetic_texts(50)
+
+
+def test_one_pass_mask_matches_sequential_reference():
+    for sample in SAMPLES:
+        assert mask_post_flare_terms(sample) == mask_post_flare_terms_reference(sample), sample
+
@@ -0,0 +1,63 @@
+import numpy as np
+import scipy.sparse as sp
+
+from utils.text_projector import TextProjector
+
+
+class FeatureAssembler:
+    """Dense model input rows assembled in one preallocated float32 matrix
+
+    The scaled numeric columns come first, then the text features, as in
+    training. Instead of scaling, projecting and ``np.hstack``-ing float64
+    blocks, ``transform`` allocates (or is given) the (n_rows, n_features)
+    float32 matrix once; the scaler writes its columns straight into the
+    numeric slice and a TextProjector writes into the text slice. Values are
+    the float32 rounding of the float64 scaler output, so every caller gets
+    the same rows bit for bit.
+
+    Args:
+        scaler: Fitted StandardScaler of the numeric columns
+        text_transformer: TextProjector, or any fitted transformer of texts
+            (e.g. a TF-IDF -> SVD pipeline or a TF-IDF vectorizer) whose
+            output is copied into the text slice
+        n_text: Text feature count; defaults to ``text_transformer.n_components``
+    """
+
+    def __init__(self, scaler, text_transformer, n_text: int = None):
+        self.scaler = scaler
+        self.text_transformer = text_transformer
+        self.n_numeric = scaler.n_features_in_
+        self.n_text = n_text if n_text is not None else text_transformer.n_components
+
+    @property
+    def n_features(self) -> int:
+        return self.n_numeric + self.n_text
+
+    def empty(self, n_rows: int) -> np.ndarray:
+        return np.empty((n_rows, self.n_features), dtype=np.float32)
+
+    def scale_into(self, X_num: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """``scaler.transform(X_num)`` written into ``out`` without an intermediate copy"""
+        X_num = np.asarray(X_num, dtype=np.float64)
+        if self.scaler.with_mean:
+            centered = np.subtract(X_num, self.scaler.mean_)
+        else:
+            centered = X_num
+        if self.scaler.with_std:
+            np.divide(centered, self.scaler.scale_, out=out, casting="same_kind")
+        else:
+            out[...] = centered
+        return out
+
+    def transform(self, X_num: np.ndarray, texts, out: np.ndarray = None) -> np.ndarray:
+        """(n_rows, n_features) float32 model input of raw numeric rows and their model texts"""
+        if out is None:
+            out = self.empty(len(X_num))
+        self.scale_into(X_num, out[:, : self.n_numeric])
+        text_out = out[:, self.n_numeric :]
+        if isinstance(self.text_transformer, TextProjector):
+            self.text_transformer.transform(texts, out=text_out)
+        else:
+            X_text = self.text_transformer.transform(texts)
+            text_out[...] = X_text.toarray() if sp.issparse(X_text) else X_text
+        return out
@@ -0,0 +1,182 @@
+import re
+import numpy as np
+import pandas as pd
+from utils.keywords import NOTE_KEYWORD_FEATURES, KeywordEngine
+from utils.text_cache import cached_clean_html, cached_mask_post_flare_terms
+
+
+class FeatureSpec:
+    """Declarative definition of the note features shared by training and serving.
+
+    Args:
+        text_columns: Raw HTML columns cleaned to text before anything else
+        extracts: (feature, column, regex, kind) with kind "findall" (list of
+            matches), "extract" (first group or NaN) or "float" (first group
+            as a float or NaN)
+        keyword_features: Boolean keyword features by column, see
+            utils.keywords.NOTE_KEYWORD_FEATURES
+        derived: (feature, weights) computed in order as the integer sum of
+            weight * input feature; with "any" as weights the 0/1 OR of inputs
+        numeric_features: Model input columns, in model order
+        masked_columns: Columns masked with mask_post_flare_terms into
+            "<column>_clean"
+        model_text_columns: Masked columns joined into the TF-IDF input text
+        categories: Possible values of "extract" features, for categorical
+            dtypes in the compact training layout
+    """
+
+    def __init__(self, text_columns, extracts, keyword_features, derived, numeric_features, masked_columns, model_text_columns, categories):
+        self.text_columns = text_columns
+        self.extracts = extracts
+        self.keyword_features = keyword_features
+        self.derived = derived
+        self.numeric_features = numeric_features
+        self.masked_columns = masked_columns
+        self.model_text_columns = model_text_columns
+        self.categories = categories
+
+
+FEATURE_SPEC = FeatureSpec(
+    text_columns=[
+        "complaints",
+        "pastHistory",
+        "assesment",
+        "reviewofsystem",
+        "currentmedication",
+        "procedure",
+        "allergy",
+        "examination",
+        "patientSummary",
+        "diagnoses",
+    ],
+    extracts=[
+        ("diagnosis_codes", "diagnoses", r"[A-Z]\d{2}\.\d", "findall"),
+        ("psoriasis_type", "diagnoses", r"(Plaque|Arthropathic|Guttate|Pustular)", "extract"),
+        ("patient_age", "patientSummary", r"(\d{1,2})\s*year", "float"),
+        ("patient_gender", "patientSummary", r"\b(Female|Male)\b", "extract"),
+    ],
+    keyword_features=NOTE_KEYWORD_FEATURES,
+    derived=[
+        ("flare_signal", ("any", ["complaint_flare_kw", "flare_in_assessment", "itch_present"])),
+        ("any_steroid_use", ("any", ["steroid_started", "on_steroid_med"])),
+        ("flare_risk_score", {"flare_signal": 2, "any_steroid_use": 1, "trigger_mentioned": 1}),
+    ],
+    numeric_features=[
+        "patient_age",
+        "has_psoriasis",
+        "on_steroid_med",
+        "on_biologic",
+        "itch_present",
+        "dry_skin",
+        "plaques_present",
+        "silvery_scale",
+        "elbows_involved",
+        "hyperpigmentation",
+        "smoker",
+        "alcohol_use",
+        "family_melanoma",
+    ],
+    masked_columns=["assesment", "complaints", "examination", "patientSummary", "currentmedication"],
+    model_text_columns=["assesment", "complaints", "examination"],
+    categories={
+        "psoriasis_type": ["Plaque", "Arthropathic", "Guttate", "Pustular"],
+        "patient_gender": ["Female", "Male"],
+    },
+)
+
+
+class BatchFeatures:
+    """Vectorized backend of a FeatureSpec over a DataFrame of notes (training)."""
+
+    def __init__(self, spec: FeatureSpec = FEATURE_SPEC, clean=cached_clean_html):
+        self.spec = spec
+        self.clean = clean
+        self.keywords = KeywordEngine(spec.keyword_features)
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Clean the text columns of ``df`` and add every feature column."""
+        return self.derive(self.clean_text(df))
+
+    def clean_text(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Replace the raw HTML text columns of ``df`` with cleaned text."""
+        for col in self.spec.text_columns:
+            if col not in df.columns:
+                df[col] = ""
+            df[col] = df[col].fillna("").apply(self.clean)
+        return df
+
+    def derive(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Add every feature column to ``df`` with cleaned text columns."""
+        spec = self.spec
+        for name, col, pattern, kind in spec.extracts:
+            if kind == "findall":
+                df[name] = df[col].str.findall(pattern)
+            elif kind == "float":
+                df[name] = df[col].str.extract(pattern, expand=False).astype(float)
+            else:
+                df[name] = df[col].str.extract(pattern, expand=False)
+
+        for name, values in self.keywords.transform(df).items():
+            df[name] = values
+
+        for name, weights in spec.derived:
+            if isinstance(weights, tuple):
+                values = np.zeros(len(df), dtype=bool)
+                for col in weights[1]:
+                    values = values | df[col].to_numpy().astype(bool)
+                df[name] = values.astype(int)
+            else:
+                df[name] = sum(df[col].astype(int) * weight for col, weight in weights.items())
+        return df
+
+
+class RowFeatures:
+    """Plain-Python backend of a FeatureSpec for one note given as a dict (serving)."""
+
+    def __init__(self, spec: FeatureSpec = FEATURE_SPEC, clean=cached_clean_html, mask=cached_mask_post_flare_terms):
+        self.spec = spec
+        self.clean = clean
+        self.mask = mask
+        self.keywords = KeywordEngine(spec.keyword_features)
+        self.extracts = [(name, col, re.compile(pattern), kind) for name, col, pattern, kind in spec.extracts]
+
+    def transform(self, note: dict) -> dict:
+        """Cleaned text columns plus every feature of ``note``."""
+        spec = self.spec
+        features = {}
+        for col in spec.text_columns:
+            value = note.get(col)
+            features[col] = self.clean(value if isinstance(value, str) else "")
+
+        for name, col, pattern, kind in self.extracts:
+            if kind == "findall":
+                features[name] = pattern.findall(features[col])
+                continue
+            match = pattern.search(features[col])
+            if kind == "float":
+                features[name] = float(match.group(1)) if match else np.nan
+            else:
+                features[name] = match.group(1) if match else np.nan
+
+        features.update(self.keywords.transform_row(features))
+
+        for name, weights in spec.derived:
+            if isinstance(weights, tuple):
+                features[name] = int(any(features[col] for col in weights[1]))
+            else:
+                features[name] = sum(int(features[col]) * weight for col, weight in weights.items())
+        return features
+
+    def numeric_vector(self, features: dict) -> np.ndarray:
+        """(1, n_numeric) float64 model input, missing values as 0."""
+        values = [features.get(col, 0) for col in self.spec.numeric_features]
+        row = np.array([0.0 if value is None else float(value) for value in values], dtype=np.float64)
+        return np.nan_to_num(row, nan=0.0).reshape(1, -1)
+
+    def model_text(self, features: dict) -> str:
+        """Masked TF-IDF input text of a transformed note."""
+        return " ".join(self.mask(features[col]) for col in self.spec.model_text_columns)
+
+
+batch_features = BatchFeatures()
+row_features = RowFeatures()
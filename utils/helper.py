@@ -1,7 +1,48 @@
 from bs4 import BeautifulSoup
+from html import unescape
+from html.entities import html5
 import re
 
-def clean_html(text):
+
+# Markup our EHR emits: tags with optional quoted attributes, comments,
+# doctypes, script/style blocks and well-formed entity references.
+# One left-to-right pass, so removing a block never splices the text around
+# it into a tag. Quotes only open attribute values; a "<" or a stray quote in
+# a tag body, or a script/style block that is not closed, is left in place
+# for the fallback.
+_TAG_BODY = r"""[^<>"'=]*(?:=(?:\s*(?:"[^"]*"|'[^']*'))?[^<>"'=]*)*"""
+_HTML_MARKUP = re.compile(
+    r"<!--.*?-->|<!doctype[^<>]*>"
+    r"|<(script|style)(?:[\s/]" + _TAG_BODY + r")?>.*?</\1\s*>"
+    r"|(?:</|<(?!(?:script|style)\b))[A-Za-z]" + _TAG_BODY + ">",
+    re.I | re.S,
+)
+_HTML_ENTITY = re.compile(r"&(?:#[0-9]+|#[xX][0-9a-fA-F]+|([A-Za-z][A-Za-z0-9]*));")
+_HTML_AMBIGUOUS_AMP = re.compile(r"&[#A-Za-z]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def strip_html(text):
+    """Fast text of an HTML fragment, or None if the markup needs a real parser.
+
+    Handles tags, comments, doctypes, script/style blocks and well-formed
+    entities with regular expressions. Anything else, such as a stray "<" or
+    an unterminated or unknown entity, returns None so the caller can fall back to
+    BeautifulSoup.
+    """
+    if "<" in text:
+        text = _HTML_MARKUP.sub(" ", text)
+        if "<" in text:
+            return None
+    if "&" in text:
+        known = _HTML_ENTITY.sub(lambda m: "" if m.group(1) is None or m.group(1) + ";" in html5 else m.group(0), text)
+        if _HTML_AMBIGUOUS_AMP.search(known):
+            return None
+        text = unescape(text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def clean_html_bs4(text):
     if not isinstance(text, str):
         return ""
     text = BeautifulSoup(text, "html.parser").get_text(separator=" ")
@@ -9,6 +50,15 @@ def clean_html(text):
     return text.strip()
 
 
+def clean_html(text):
+    if not isinstance(text, str):
+        return ""
+    stripped = strip_html(text)
+    if stripped is None:
+        return clean_html_bs4(text)
+    return stripped
+
+
 def flag_any(t, keywords):
     # print(f"DEBUG: Type of t in flag_any: {type(t)}, Value: {t}")
     t = t.lower()
@@ -18,15 +68,21 @@ def flag_any(t, keywords):
 
 
 
+# The three masking rules of the original sequential re.sub calls, folded into
+# one alternation. Rule 3 ("use ... cream") only ever sees text the first two
+# rules left: a standalone "apply" or "ointment" is already gone by then, so
+# it starts at "use" and ends at cream, gel, or an "ointment" inside a longer
+# word.
+_POST_FLARE_TERMS = re.compile(
+    r"\b(?:flare|flares|flaring|flare-up|flare up|psoriasis flare"
+    r"|triamcinolone|clobetasol|hydrocortisone|ointment|apply|start|prescribed|prescription)\b"
+    r"|\buse\b.*?(?:\Bointment|cream|gel)\b",
+    re.I,
+)
+
+
 def mask_post_flare_terms(text):
     if not isinstance(text, str):
         return ""
-
-    text = re.sub(r'\b(flare|flares|flaring|flare-up|flare up|psoriasis flare)\b', ' ', text, flags=re.I)
-    text = re.sub(r'\b(triamcinolone|clobetasol|hydrocortisone|ointment|apply|start|apply\s+\w+|prescribed|prescription|start\s+)\b', ' ', text, flags=re.I)
-
-    text = re.sub(r'\b(apply|use)\b.*?(ointment|cream|gel)\b', ' ', text, flags=re.I)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
+    return " ".join(_POST_FLARE_TERMS.sub(" ", text).split())
 
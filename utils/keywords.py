@@ -0,0 +1,134 @@
+import re
+from bisect import bisect_right
+from itertools import accumulate
+import numpy as np
+import pandas as pd
+
+
+# Boolean note features by source column: (feature, patterns, negate, as_int).
+# Patterns are lowercase regexes matched anywhere in the lowercased cleaned
+# text, i.e. ``str.contains(..., case=False)``. ``negate`` marks "absent"
+# features such as has_allergy; ``as_int`` features are 0/1 ints instead of
+# bools, as the model was trained with.
+NOTE_KEYWORD_FEATURES = {
+    "diagnoses": [
+        ("has_psoriasis", ["l40"], False, True),
+    ],
+    "complaints": [
+        ("complaint_flare_kw", ["flare", "worse", "itch", "red", "scaling", "burning", "rash", "lesion"], False, True),
+        ("complaint_no_relief", ["without relief", "no improvement"], False, True),
+    ],
+    "assesment": [
+        ("flare_in_assessment", ["flare", "worsen", "flare-up"], False, True),
+        ("trigger_mentioned", ["stress", "infection", "weather", "medication"], False, True),
+        ("steroid_started", ["triamcinolone", "steroid", "ointment", "cream"], False, True),
+    ],
+    "currentmedication": [
+        ("has_medications", ["no active"], True, False),
+        ("on_steroid_med", ["steroid", "triamcinolone", "clobetasol", "hydrocortisone"], False, False),
+        ("on_biologic", ["adalimumab", "secukinumab", "ixekizumab", "etanercept"], False, False),
+    ],
+    "examination": [
+        ("plaques_present", ["plaque"], False, False),
+        ("silvery_scale", ["silvery", "scale"], False, False),
+        ("elbows_involved", ["elbow"], False, False),
+        ("hyperpigmentation", ["hyperpigment"], False, False),
+    ],
+    "reviewofsystem": [
+        ("itch_present", ["itch"], False, False),
+        ("dry_skin", ["dry skin"], False, False),
+        ("fever_absent", ["no fever"], False, False),
+    ],
+    "pastHistory": [
+        ("smoker", ["smoker"], False, False),
+        ("alcohol_use", ["alcohol.*yes"], False, False),
+        ("family_melanoma", ["melanoma.*yes"], False, False),
+    ],
+    "patientSummary": [
+        ("follow_up_visit", ["follow up"], False, False),
+    ],
+    "allergy": [
+        ("has_allergy", ["no known"], True, False),
+    ],
+}
+
+class KeywordEngine:
+    """Derive every boolean keyword feature of a column in one scan of its text.
+
+    Each feature's patterns are compiled once into a single regex, and a
+    column's features into one lookahead alternation that finds every
+    position where any of them matches. A column is lowercased once and
+    joined into one newline-separated buffer that this alternation scans in
+    C; at each hit only the row's still-unmatched features are tried, and
+    once all of a row's features have matched the scan jumps to the next
+    row. This replaces one ``str.contains``/``apply`` pass per feature, each
+    lowercasing every cell or matching it from Python. Patterns must not
+    match a newline, so a match never spans two rows.
+    """
+
+    def __init__(self, features: dict = NOTE_KEYWORD_FEATURES):
+        self.features = features
+        self.patterns = {
+            column: [re.compile("|".join(patterns)) for _, patterns, _, _ in specs]
+            for column, specs in features.items()
+        }
+        self.scanners = {
+            column: re.compile("|".join(f"(?={pattern.pattern})" for pattern in patterns))
+            for column, patterns in self.patterns.items()
+        }
+
+    @property
+    def feature_names(self) -> list:
+        return [name for specs in self.features.values() for name, _, _, _ in specs]
+
+    def scan(self, column: str, texts: list) -> np.ndarray:
+        """(len(texts), n_features) match matrix of ``column``'s features, before negation."""
+        patterns = self.patterns[column]
+        n_features = len(patterns)
+        hits = [[False] * n_features for _ in texts]
+        if not texts:
+            return np.zeros((0, n_features), dtype=bool)
+        texts = [text.lower() if isinstance(text, str) else "" for text in texts]
+        starts = list(accumulate([0] + [len(text) + 1 for text in texts[:-1]]))
+        buffer = "\n".join(texts)
+        search = self.scanners[column].search
+        pos = 0
+        while (match := search(buffer, pos)) is not None:
+            at = match.start()
+            row = bisect_right(starts, at) - 1
+            found = hits[row]
+            for i, pattern in enumerate(patterns):
+                if not found[i] and pattern.match(buffer, at):
+                    found[i] = True
+            if all(found):
+                if row + 1 == len(starts):
+                    break
+                pos = starts[row + 1]
+            else:
+                pos = at + 1
+        return np.array(hits, dtype=bool)
+
+    def transform(self, df: pd.DataFrame) -> dict:
+        """Feature name -> NumPy array for every row of ``df``."""
+        out = {}
+        for column, specs in self.features.items():
+            texts = df[column].tolist() if column in df.columns else [""] * len(df)
+            hits = self.scan(column, texts)
+            for i, (name, _, negate, as_int) in enumerate(specs):
+                values = ~hits[:, i] if negate else hits[:, i]
+                out[name] = values.astype(int) if as_int else values
+        return out
+
+    def transform_row(self, row: dict) -> dict:
+        """Feature name -> value for a single note given as a dict of cleaned text."""
+        out = {}
+        for column, specs in self.features.items():
+            text = row.get(column, "")
+            text = text.lower() if isinstance(text, str) else ""
+            for pattern, (name, _, negate, as_int) in zip(self.patterns[column], specs):
+                value = (pattern.search(text) is not None) != negate
+                out[name] = int(value) if as_int else value
+        return out
+
+
+keyword_engine = KeywordEngine()
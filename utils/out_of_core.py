@@ -0,0 +1,183 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import clone
+from sklearn.preprocessing import normalize
+from sklearn.utils.extmath import randomized_svd
+from sklearn.feature_extraction.text import HashingVectorizer
+
+
+class HashedCounter:
+    """Term counts of the hash buckets a HashingTfidf kept, in kept-column order
+
+    Args:
+        hasher: HashingVectorizer producing raw term counts
+        columns: Sorted hash buckets kept as terms
+    """
+
+    def __init__(self, hasher: HashingVectorizer, columns: np.ndarray):
+        self.hasher = hasher
+        self.columns = columns
+        self.lookup = np.full(hasher.n_features, -1, dtype=np.int32)
+        self.lookup[columns] = np.arange(len(columns), dtype=np.int32)
+
+    def transform(self, texts) -> sp.csr_matrix:
+        """(n_texts, n_terms) CSR counts; buckets that were not kept are dropped"""
+        counts = self.hasher.transform(texts)
+        cols = self.lookup[counts.indices]
+        keep = cols >= 0
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        return sp.csr_matrix(
+            (counts.data[keep], (rows[keep], cols[keep])),
+            shape=(counts.shape[0], len(self.columns)),
+            dtype=counts.dtype,
+        )
+
+
+class HashingTfidf:
+    """TF-IDF over hashed terms, fitted from streamed chunks of text
+
+    Stands in for ``TfidfVectorizer`` with the same ``ngram_range``,
+    ``stop_words``, ``min_df`` and ``max_features``, but never builds a
+    vocabulary: terms are hashed into ``n_features`` buckets and only the
+    per-bucket document and term counts are accumulated by ``partial_fit``.
+    ``finalize`` keeps the buckets with at least ``min_df`` documents, the
+    ``max_features`` most frequent of them, and computes their smoothed IDF.
+    Memory is bounded by ``n_features`` whatever the corpus size.
+    """
+
+    norm = "l2"
+    use_idf = True
+    sublinear_tf = False
+
+    def __init__(
+        self,
+        n_features: int = 2**20,
+        ngram_range: tuple = (1, 1),
+        stop_words=None,
+        min_df=1,
+        max_features: int = None,
+    ):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.stop_words = stop_words
+        self.min_df = min_df
+        self.max_features = max_features
+        self.hasher = HashingVectorizer(
+            n_features=n_features,
+            ngram_range=ngram_range,
+            stop_words=stop_words,
+            alternate_sign=False,
+            norm=None,
+            dtype=np.float64,
+        )
+        self.n_documents_ = 0
+        self.document_counts_ = np.zeros(n_features, dtype=np.int64)
+        self.term_counts_ = np.zeros(n_features, dtype=np.float64)
+
+    def partial_fit(self, texts) -> "HashingTfidf":
+        """Accumulate the document and term counts of one chunk of texts"""
+        counts = self.hasher.transform(texts)
+        self.n_documents_ += counts.shape[0]
+        self.document_counts_ += np.bincount(counts.indices, minlength=self.n_features)
+        self.term_counts_ += np.bincount(counts.indices, counts.data, minlength=self.n_features)
+        return self
+
+    def finalize(self) -> "HashingTfidf":
+        """Select the kept buckets, compute their IDF and drop the accumulators"""
+        min_df = self.min_df if isinstance(self.min_df, int) else self.min_df * self.n_documents_
+        candidates = np.flatnonzero(self.document_counts_ >= max(min_df, 1))
+        if self.max_features is not None and len(candidates) > self.max_features:
+            top = np.argsort(-self.term_counts_[candidates], kind="stable")[: self.max_features]
+            candidates = np.sort(candidates[top])
+        if not len(candidates):
+            raise ValueError("After pruning, no terms remain. Try a lower min_df.")
+        document_counts = self.document_counts_[candidates]
+        self.idf_ = np.log((1 + self.n_documents_) / (1 + document_counts)) + 1
+        self.counter_ = HashedCounter(self.hasher, candidates)
+        del self.document_counts_, self.term_counts_
+        return self
+
+    def fit(self, text_chunks) -> "HashingTfidf":
+        for texts in text_chunks:
+            self.partial_fit(texts)
+        return self.finalize()
+
+    @property
+    def n_terms(self) -> int:
+        return len(self.idf_)
+
+    def get_feature_names_out(self) -> np.ndarray:
+        """Hash bucket of each term column; the terms themselves are not kept"""
+        return np.array([f"hash_{bucket}" for bucket in self.counter_.columns], dtype=object)
+
+    def counter(self) -> HashedCounter:
+        """float32 term counter for TextProjector"""
+        return HashedCounter(clone(self.hasher).set_params(dtype=np.float32), self.counter_.columns)
+
+    def transform(self, texts) -> sp.csr_matrix:
+        """l2-normalized TF-IDF rows of ``texts`` over the kept buckets"""
+        counts = self.counter_.transform(texts)
+        counts.data *= self.idf_[counts.indices]
+        return normalize(counts, norm=self.norm, copy=False)
+
+
+class GramSVD:
+    """TruncatedSVD of a matrix streamed by row chunks, through its Gram matrix
+
+    ``partial_fit`` adds ``X.T @ X`` of each chunk to an (n_terms, n_terms)
+    Gram matrix, whose size does not depend on the number of rows.
+    ``finalize`` takes its top eigenvectors with a randomized SVD; these are
+    the right singular vectors ``TruncatedSVD`` fits on the stacked chunks,
+    with the same sign convention, so ``transform`` is a drop-in replacement.
+    """
+
+    def __init__(self, n_components: int = 100, random_state=None, n_iter: int = 7):
+        self.n_components = n_components
+        self.random_state = random_state
+        self.n_iter = n_iter
+        self.gram_ = None
+
+    def partial_fit(self, X) -> "GramSVD":
+        gram = X.T @ X
+        gram = gram.toarray() if sp.issparse(gram) else np.asarray(gram)
+        if self.gram_ is None:
+            self.gram_ = gram
+        else:
+            self.gram_ += gram
+        return self
+
+    def finalize(self) -> "GramSVD":
+        _, eigenvalues, components = randomized_svd(
+            self.gram_, self.n_components, n_iter=self.n_iter, random_state=self.random_state
+        )
+        # Largest absolute loading of each component positive, as svd_flip does.
+        signs = np.sign(components[np.arange(len(components)), np.argmax(np.abs(components), axis=1)])
+        self.components_ = components * signs[:, None]
+        self.singular_values_ = np.sqrt(eigenvalues)
+        self.gram_ = None
+        return self
+
+    def fit(self, chunks) -> "GramSVD":
+        for X in chunks:
+            self.partial_fit(X)
+        return self.finalize()
+
+    def transform(self, X) -> np.ndarray:
+        return np.asarray(X @ self.components_.T)
+
+
+def fit_out_of_core(text_chunks, tfidf_params: dict, svd_params: dict, n_features: int = 2**20):
+    """Fit a HashingTfidf and a GramSVD in two passes over chunks of text
+
+    Args:
+        text_chunks: Callable returning a fresh iterator over chunks of texts
+        tfidf_params: TfidfVectorizer-style ngram_range/stop_words/min_df/max_features
+        svd_params: TruncatedSVD-style n_components/random_state
+        n_features: Hash buckets
+
+    Returns:
+        The fitted (tfidf, svd) pair
+    """
+    tfidf = HashingTfidf(n_features=n_features, **tfidf_params).fit(text_chunks())
+    svd = GramSVD(**svd_params).fit(tfidf.transform(texts) for texts in text_chunks())
+    return tfidf, svd
@@ -0,0 +1,182 @@
+import os
+import atexit
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from utils.helper import clean_html, mask_post_flare_terms
+
+
+TEXT_CACHE_SIZE = int(os.getenv("TEXT_CACHE_SIZE", "100000"))
+# Directory of the persistent tier; unset keeps the cache in memory only.
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", "")
+TEXT_CACHE_FLUSH_EVERY = 500
+
+
+def content_key(text: str) -> bytes:
+    """128-bit hash of a text, used instead of the text itself as cache key."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class TextCache:
+    """Memoize a text -> text function on the content hash of its input.
+
+    Copy-forwarded note sections (history, allergies, medications) are
+    byte-identical across visits, so their cleaned form is computed once. The
+    in-process tier is an LRU of ``maxsize`` entries; with ``cache_dir`` set,
+    misses also go through a SQLite file shared by every process using that
+    directory. Bump ``version`` whenever ``func``'s output changes so stale
+    persistent entries are not reused.
+    """
+
+    def __init__(self, func, name: str, maxsize: int = TEXT_CACHE_SIZE, cache_dir: str = TEXT_CACHE_DIR, version: str = "1"):
+        self.func = func
+        self.name = name
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.version = version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+        self._pending = []
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        # A SQLite connection must not cross a fork, so reopen in child processes.
+        if self._db is None or self._db_pid != os.getpid():
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = os.path.join(self.cache_dir, f"{self.name}-v{self.version}.sqlite")
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS cache (key BLOB PRIMARY KEY, value TEXT)")
+            self._db_pid = os.getpid()
+            self._pending = []
+        return self._db
+
+    def _disk_get(self, key: bytes):
+        row = self._connection().execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _remember(self, key: bytes, value: str):
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __call__(self, text):
+        if not isinstance(text, str) or not text:
+            return self.func(text)
+        key = content_key(text)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            if self.cache_dir:
+                value = self._disk_get(key)
+                if value is not None:
+                    self.disk_hits += 1
+                    self._remember(key, value)
+                    return value
+
+        value = self.func(text)
+        with self._lock:
+            self.misses += 1
+            self._remember(key, value)
+            if self.cache_dir:
+                self._pending.append((key, value))
+                if len(self._pending) >= TEXT_CACHE_FLUSH_EVERY:
+                    self._flush_locked()
+        return value
+
+    def _flush_locked(self):
+        if self._pending and self._db_pid == os.getpid():
+            with self._db:
+                self._db.executemany("INSERT OR IGNORE INTO cache VALUES (?, ?)", self._pending)
+        self._pending = []
+
+    def flush(self):
+        """Write pending entries to the persistent tier."""
+        with self._lock:
+            self._flush_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, disk_hits, misses = self.hits, self.disk_hits, self.misses
+            size = len(self._entries)
+        calls = hits + disk_hits + misses
+        return {
+            "hits": hits,
+            "disk_hits": disk_hits,
+            "misses": misses,
+            "hit_rate": round((hits + disk_hits) / calls, 4) if calls else 0.0,
+            "size": size,
+            "maxsize": self.maxsize,
+        }
+
+    def drain_counts(self) -> tuple:
+        """Return and zero the (hits, disk_hits, misses) counters."""
+        with self._lock:
+            counts = (self.hits, self.disk_hits, self.misses)
+            self.hits = self.disk_hits = self.misses = 0
+        return counts
+
+    def add_counts(self, counts: tuple):
+        """Add counters drained from the same cache in a worker process."""
+        with self._lock:
+            self.hits += counts[0]
+            self.disk_hits += counts[1]
+            self.misses += counts[2]
+
+    def _after_fork(self):
+        # Workers report only their own calls; the parent already counted the rest.
+        self._lock = threading.Lock()
+        self._pending = []
+        self.hits = self.disk_hits = self.misses = 0
+
+    def clear(self):
+        """Drop the in-process entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+
+# Output versions of the cleaning and masking functions: bump one whenever its
+# output changes. They also version stored note vectors (app.model_service).
+CLEAN_HTML_VERSION = "2"
+MASK_POST_FLARE_TERMS_VERSION = "1"
+
+cached_clean_html = TextCache(clean_html, "clean_html", version=CLEAN_HTML_VERSION)
+cached_mask_post_flare_terms = TextCache(
+    mask_post_flare_terms, "mask_post_flare_terms", version=MASK_POST_FLARE_TERMS_VERSION
+)
+TEXT_CACHES = [cached_clean_html, cached_mask_post_flare_terms]
+
+
+def text_cache_stats() -> dict:
+    """Hit statistics of every text cache of this process, by cache name."""
+    return {cache.name: cache.stats() for cache in TEXT_CACHES}
+
+
+def drain_text_cache_counts() -> dict:
+    """Flush the caches and hand their counters over, e.g. from a worker process."""
+    flush_text_caches()
+    return {cache.name: cache.drain_counts() for cache in TEXT_CACHES}
+
+
+def merge_text_cache_counts(counts: dict):
+    for cache in TEXT_CACHES:
+        if cache.name in counts:
+            cache.add_counts(counts[cache.name])
+
+
+def flush_text_caches():
+    for cache in TEXT_CACHES:
+        cache.flush()
+
+
+atexit.register(flush_text_caches)
+os.register_at_fork(after_in_child=lambda: [cache._after_fork() for cache in TEXT_CACHES])
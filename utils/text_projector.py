@@ -0,0 +1,74 @@
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+
+class TextProjector:
+    """A fitted TF-IDF -> TruncatedSVD pair folded into one float32 projection.
+
+    ``svd.transform(tfidf.transform(texts))`` is ``norm(tf * idf) @ components_.T``.
+    The IDF weights are folded into the projection, ``idf[:, None] * components_.T``,
+    and the row normalization is a per-note scalar taken from the same term
+    counts. A batch of notes maps to its SVD features with one sparse-dense
+    product of its term-count matrix, without building the TF-IDF matrix.
+
+    Args:
+        counter: CountVectorizer with the fitted vocabulary and analyzer, or any
+            object whose ``transform`` gives CSR term counts in projection-row order
+        projection: (n_terms, n_components) float32 ``idf * components_.T``
+        idf: IDF weights, used for the row norms
+        norm: TfidfVectorizer ``norm`` ("l2", "l1" or None)
+        sublinear_tf: TfidfVectorizer ``sublinear_tf``
+    """
+
+    def __init__(self, counter: CountVectorizer, projection: np.ndarray, idf: np.ndarray, norm: str, sublinear_tf: bool):
+        self.counter = counter
+        self.projection = projection
+        self.idf = idf
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+
+    @classmethod
+    def from_fitted(cls, tfidf, svd) -> "TextProjector":
+        """Projector equivalent to ``svd.transform(tfidf.transform(texts))``.
+
+        ``tfidf`` is a TfidfVectorizer, or a utils.out_of_core.HashingTfidf
+        that provides its own term counter.
+        """
+        if hasattr(tfidf, "counter"):
+            counter = tfidf.counter()
+        else:
+            count_params = CountVectorizer().get_params()
+            params = {k: v for k, v in tfidf.get_params().items() if k in count_params}
+            params.update(vocabulary=tfidf.vocabulary_, dtype=np.float32)
+            counter = CountVectorizer(**params)
+        idf = tfidf.idf_ if tfidf.use_idf else np.ones(len(tfidf.vocabulary_))
+        projection = (idf[:, None] * svd.components_.T).astype(np.float32)
+        return cls(counter, projection, idf.astype(np.float32), tfidf.norm, tfidf.sublinear_tf)
+
+    @property
+    def n_components(self) -> int:
+        return self.projection.shape[1]
+
+    def transform(self, texts, out: np.ndarray = None) -> np.ndarray:
+        """(n_texts, n_components) float32 SVD features of ``texts``.
+
+        With ``out`` (e.g. a column slice of a model input matrix) the
+        normalized features are written there instead of a new array.
+        """
+        counts = self.counter.transform(texts)
+        if self.sublinear_tf:
+            np.log(counts.data, counts.data)
+            counts.data += 1
+        X = np.asarray(counts @ self.projection, dtype=np.float32)
+        if out is None:
+            out = X
+        if self.norm:
+            weighted = counts.data * self.idf[counts.indices]
+            weighted = weighted * weighted if self.norm == "l2" else np.abs(weighted)
+            sums = np.bincount(np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr)), weighted, counts.shape[0])
+            norms = np.sqrt(sums) if self.norm == "l2" else sums
+            norms[norms == 0] = 1
+            np.divide(X, norms[:, None].astype(np.float32), out=out)
+        elif out is not X:
+            out[...] = X
+        return out